@@ -0,0 +1,267 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+"""
+Benchmarks show_router, create_router and delete_router against a simulated
+vCenter (see ``fake_vcenter.py``), so releases can be compared.
+
+Reports the throughput, p50/p99 latency and the number of SOAP calls per
+operation. Results are only saved when ``--output`` is given, so a run never
+overwrites the baselines in ``benchmarks/results``. Example::
+
+    python benchmarks/bench_worker.py --users 4 --vms 20 --latency 2 --concurrency 4
+    python benchmarks/bench_worker.py --baseline benchmarks/results/2019.6.25.json
+    python benchmarks/bench_worker.py --output benchmarks/results/<version>.json
+
+To compare the worker engines, run the same load through each. Prefork has
+one operation in flight per process; threads and asyncio have all of them in one process::
+
+    python benchmarks/bench_worker.py --engine prefork --concurrency 4 --task-seconds 0.5
+    python benchmarks/bench_worker.py --engine threads --concurrency 200 --task-seconds 0.5
+    python benchmarks/bench_worker.py --engine asyncio --concurrency 200 --task-seconds 0.5
+"""
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import resource
+import tarfile
+import argparse
+import tempfile
+import collections
+from concurrent.futures import ThreadPoolExecutor
+
+OVF = """<?xml version="1.0" encoding="UTF-8"?>
+<Envelope>
+  <NetworkSection>
+    <Network ovf:name="eth0"></Network>
+    <Network ovf:name="eth1"></Network>
+    <Network ovf:name="eth2"></Network>
+    <Network ovf:name="eth3"></Network>
+  </NetworkSection>
+</Envelope>
+"""
+IMAGE = '1.2.0'
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description=__doc__.strip().split('\n')[0])
+    parser.add_argument('--users', type=int, default=4, help='Number of users, each with their own folder')
+    parser.add_argument('--vms', type=int, default=20, help='Number of Routers each user already has')
+    parser.add_argument('--latency', type=float, default=2.0, help='Milliseconds added to every SOAP call')
+    parser.add_argument('--task-seconds', type=float, default=0.0, help='How long each vCenter task takes')
+    parser.add_argument('--concurrency', type=int, default=4, help='Operations run at the same time')
+    parser.add_argument('--iterations', type=int, default=20, help='Number of times each operation is run')
+    parser.add_argument('--engine', choices=('prefork', 'threads', 'asyncio'), default='prefork',
+                        help='prefork runs each operation in a worker process of its own; threads and asyncio run them all in one')
+    parser.add_argument('--incremental', action='store_true',
+                        help='Show only reads what changed in a folder since the last show')
+    parser.add_argument('--operations', default='show,create,delete,teardown', help='Comma separated operations to run')
+    parser.add_argument('--output', help='Where to save the results. Default is to not save them')
+    parser.add_argument('--baseline', help='Results of an earlier run to compare against')
+    return parser.parse_args(argv)
+
+
+def _make_ova(path):
+    """Create a tiny OVA, so the OVA index has something to parse"""
+    with tarfile.open(path, 'w') as the_tar:
+        for name, data in (('router.ovf', OVF.encode()), ('router-disk1.vmdk', b'\x00' * 512)):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            the_tar.addfile(info, io.BytesIO(data))
+
+
+def setup_environment(work_dir, args):
+    """Point the worker at scratch directories. Must run before vlab_router_api
+    is imported, because the constants are read from the environment on import.
+    """
+    images_dir = os.path.join(work_dir, 'images')
+    os.makedirs(images_dir)
+    _make_ova(os.path.join(images_dir, 'router-vyos-{}.ova'.format(IMAGE)))
+    os.environ['VLAB_ROUTER_IMAGES_DIR'] = images_dir
+    os.environ['VLAB_ROUTER_OVA_INDEX'] = os.path.join(work_dir, 'ova-index.json')
+    os.environ['VLAB_ROUTER_INVENTORY_DIR'] = os.path.join(work_dir, 'inventory')
+    os.environ['VLAB_ROUTER_METRICS_DIR'] = os.path.join(work_dir, 'metrics')
+    # Measure the trip to vCenter, not the inventory cache
+    os.environ['VLAB_ROUTER_INVENTORY_TTL'] = '0'
+    os.environ['VLAB_ROUTER_DEPLOY_MODE'] = 'clone'
+    os.environ['VLAB_ROUTER_DATASTORES'] = 'ds0,ds1'
+    os.environ['VLAB_ROUTER_RESOURCE_POOLS'] = 'Resources'
+    os.environ['VLAB_ROUTER_LOG_LEVEL'] = 'WARNING'
+    os.environ['VLAB_ROUTER_WORKER_ENGINE'] = args.engine
+    if args.incremental:
+        os.environ['VLAB_ROUTER_SHOW_INCREMENTAL'] = 'true'
+    if args.engine == 'prefork':
+        # One session per worker process; the other engines size their own pool
+        os.environ['VLAB_VCENTER_POOL_SIZE'] = str(args.concurrency)
+
+
+def build_inventory(server, args, vmware):
+    """Populate the simulated vCenter with users, networks, Routers and a template
+
+    :Returns: List of usernames
+    """
+    import ujson
+    from vlab_router_api.lib import const
+    from vlab_router_api.lib.worker import ova_index, linked_clone
+
+    meta = ujson.dumps({'component': 'Router', 'created': 0, 'version': IMAGE,
+                        'configured': False, 'generation': 1})
+    for name in const.VLAB_ROUTER_DATASTORES:
+        server.add_datastore(name)
+    usernames = ['user{}'.format(x) for x in range(args.users)]
+    for username in usernames:
+        folder = server.add_folder(username)
+        networks = [server.add_network('{}_net{}'.format(username, x)) for x in range(2)]
+        for index in range(args.vms):
+            server.add_vm(folder, 'router{}'.format(index), annotation=meta, networks=networks)
+    templates = server.add_folder(const.VLAB_ROUTER_TEMPLATE_FOLDER)
+    image_name = vmware.convert_name(IMAGE)
+    name = linked_clone.template_name(image_name, ova_index.lookup(image_name))
+    server.add_vm(templates, name, annotation='', power_state='poweredOff', snapshot=True)
+    return usernames
+
+
+def run(operation, func, items, concurrency, server):
+    """Run ``func`` on every item, and measure it
+
+    :Returns: Dictionary
+    """
+    latencies = []
+    errors = 0
+
+    def timed(item):
+        start = time.perf_counter()
+        func(item)
+        return time.perf_counter() - start
+
+    server.calls.clear()
+    server.objects_sent = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = [executor.submit(timed, x) for x in items]
+        for future in futures:
+            try:
+                latencies.append(future.result())
+            except Exception as doh:
+                errors += 1
+                print('{} failed: {}'.format(operation, doh), file=sys.stderr)
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    ops = len(latencies)
+    calls = sum(server.calls.values())
+    return {'ops': ops,
+            'errors': errors,
+            'seconds': round(elapsed, 4),
+            'ops_per_second': round(ops / elapsed, 2) if elapsed else 0,
+            'p50_ms': round(_percentile(latencies, 50) * 1000, 2),
+            'p99_ms': round(_percentile(latencies, 99) * 1000, 2),
+            'calls_per_op': round(calls / ops, 2) if ops else 0,
+            'objects_per_op': round(server.objects_sent / ops, 2) if ops else 0,
+            'top_calls': dict(collections.Counter({k: round(v / max(ops, 1), 2) for k, v in server.calls.items()}).most_common(8)),
+           }
+
+
+def _login(session_pool):
+    with session_pool.session():
+        # Hold the session, so every call opens a new one
+        time.sleep(0.05)
+
+
+def _percentile(values, percent):
+    if not values:
+        return 0
+    index = min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))
+    return values[index]
+
+
+def report(results, baseline):
+    """Print a table of the results, with the change since the baseline"""
+    print('engine {}, {} operations in flight, about {} MB of worker memory'.format(results['params']['engine'],
+                                                                                   results['params']['concurrency'],
+                                                                                   results['memory_mb']))
+    print('{:<8} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10}'.format('op', 'ops', 'ops/s', 'p50 ms', 'p99 ms',
+                                                                 'calls/op', 'objs/op'))
+    for operation, result in results['operations'].items():
+        print('{:<8} {:>8} {:>10} {:>10} {:>10} {:>10} {:>10}'.format(operation, result['ops'], result['ops_per_second'],
+                                                                     result['p50_ms'], result['p99_ms'],
+                                                                     result['calls_per_op'], result['objects_per_op']))
+        before = (baseline or {}).get('operations', {}).get(operation)
+        if before:
+            changes = []
+            for key in ('ops_per_second', 'p50_ms', 'p99_ms', 'calls_per_op', 'objects_per_op'):
+                # Older results don't have every key
+                if before.get(key):
+                    changes.append('{} {:+.1f}%'.format(key, (result[key] - before[key]) * 100.0 / before[key]))
+            print('         vs baseline: {}'.format(', '.join(changes)))
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    work_dir = tempfile.mkdtemp()
+    try:
+        setup_environment(work_dir, args)
+        # Only importable once the environment is setup
+        from unittest.mock import patch
+        import pkg_resources
+        from fake_vcenter import FakeServer, console_url
+        from vlab_router_api.lib.worker import vmware, session_pool, worker_engine
+
+        if not hasattr(collections, 'Iterable'):
+            # vlab_inf_common still uses collections.Iterable, which Python 3.10 removed
+            collections.Iterable = collections.abc.Iterable
+        server = FakeServer(latency=args.latency / 1000.0, task_seconds=args.task_seconds)
+        logger = logging.getLogger('bench')
+        with patch.object(session_pool, 'vCenter', server.connect), \
+             patch.object(vmware.virtual_machine, '_get_vm_console_url', console_url):
+            usernames = build_inventory(server, args, vmware)
+            # Login before measuring, like a worker that's been up for a while
+            with ThreadPoolExecutor(max_workers=session_pool.get_pool().max_size) as executor:
+                list(executor.map(lambda _: _login(session_pool), range(session_pool.get_pool().max_size)))
+            operations = collections.OrderedDict()
+            items = [(usernames[x % len(usernames)], 'bench{}'.format(x)) for x in range(args.iterations)]
+            for operation in args.operations.split(','):
+                # Like the tasks in tasks.py, hand the vmware functions to the configured engine
+                if operation == 'show':
+                    func = lambda item: worker_engine.run('router.show', vmware.show_router, item[0])
+                elif operation == 'create':
+                    func = lambda item: worker_engine.run('router.create', vmware.create_router, item[0], item[1], IMAGE,
+                                                          ['{}_net0'.format(item[0]), '{}_net1'.format(item[0])],
+                                                          logger)
+                elif operation == 'delete':
+                    func = lambda item: worker_engine.run('router.delete', vmware.delete_router, item[0], item[1], logger)
+                elif operation == 'teardown':
+                    # Every Router of one user, with a single delete_routers call
+                    operations[operation] = run(operation, lambda x: worker_engine.run('router.delete_many', vmware.delete_routers, x, [], logger),
+                                                usernames, args.concurrency, server)
+                    continue
+                else:
+                    raise SystemExit('Unknown operation: {}'.format(operation))
+                operations[operation] = run(operation, func, items, args.concurrency, server)
+            worker_engine.engine.stop()
+        version = pkg_resources.get_distribution('vlab-router-api').version
+        rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+        # Every prefork worker process is a copy of this one
+        processes = args.concurrency if args.engine == 'prefork' else 1
+        results = {'version': version,
+                   'memory_mb': round(rss_mb * processes, 1),
+                   'params': {k: v for k, v in vars(args).items() if k not in ('output', 'baseline')},
+                   'operations': operations}
+        baseline = None
+        if args.baseline:
+            with open(args.baseline) as the_file:
+                baseline = json.load(the_file)
+        report(results, baseline)
+        if args.output:
+            os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+            with open(args.output, 'w') as the_file:
+                json.dump(results, the_file, indent=2, sort_keys=True)
+            print('Saved results to {}'.format(args.output))
+    finally:
+        shutil.rmtree(work_dir)
+
+
+if __name__ == '__main__':
+    main()
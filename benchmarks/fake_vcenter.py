@@ -0,0 +1,391 @@
+# -*- coding: UTF-8 -*-
+"""
+An in-memory stand-in for vCenter, for benchmarking the worker without a lab.
+
+The managed objects handed out are real pyVmomi objects, bound to a fake SOAP
+stub instead of a connection. Every property read and method call that would
+be a round trip to vCenter goes through ``FakeStub``, which sleeps for the
+configured latency and counts the call. That way the real code paths of the
+worker and vlab_inf_common are measured, and the call counts are exactly the
+number of SOAP requests a real vCenter would have served.
+
+Only the parts of the vSphere API the worker uses are implemented.
+"""
+import time
+import uuid
+import datetime
+import threading
+import collections
+from types import SimpleNamespace
+
+from pyVmomi import vim, vmodl
+from vlab_inf_common.vmware import vCenter
+
+
+class FakeStub(object):
+    """Serves the SOAP calls of pyVmomi objects out of a ``FakeServer``
+
+    :param server: The inventory to serve
+    :type server: FakeServer
+    """
+    def __init__(self, server):
+        self.server = server
+        self.cookie = 'vmware_soap_session="fake"'
+
+    def InvokeAccessor(self, mo, info):
+        self.server.round_trip('{}.{}'.format(type(mo).__name__, info.name))
+        return self.server.read(mo, info.name)
+
+    def InvokeMethod(self, mo, info, args):
+        self.server.round_trip('{}.{}'.format(type(mo).__name__, info.name))
+        return self.server.invoke(mo, info.name, args)
+
+
+class FakeServer(object):
+    """The inventory of the simulated vCenter
+
+    :param latency: Seconds added to every SOAP call
+    :type latency: Float
+
+    :param task_seconds: How long a vCenter task takes to complete after it's created
+    :type task_seconds: Float
+
+    :param base_dir: The name of the top level VM folder, like ``INF_VCENTER_TOP_LVL_DIR``
+    :type base_dir: String
+    """
+    def __init__(self, latency=0.002, task_seconds=0.0, base_dir='vlab'):
+        self.latency = latency
+        self.task_seconds = task_seconds
+        self.stub = FakeStub(self)
+        self.calls = collections.Counter()
+        # How many objects the PropertyCollector sent back; a stand-in for the size of the replies
+        self.objects_sent = 0
+        self._lock = threading.Lock()
+        self._ids = collections.Counter()
+        self._props = {}
+        self._children = collections.defaultdict(list)
+        self._destroyed = set()
+        self.service_instance = vim.ServiceInstance('ServiceInstance', self.stub)
+        self.root = self._new(vim.Folder, 'group-d', name='Datacenters')
+        self.datacenter = self._new(vim.Datacenter, 'datacenter', parent=self.root, name='dc')
+        self.vm_folder = self._new(vim.Folder, 'group-v', parent=self.datacenter, name='vm')
+        self.network_folder = self._new(vim.Folder, 'group-n', parent=self.datacenter, name='network')
+        self.host_folder = self._new(vim.Folder, 'group-h', parent=self.datacenter, name='host')
+        self._props[self.datacenter._moId]['vmFolder'] = self.vm_folder
+        self.base_dir = self.add_folder(base_dir, parent=self.vm_folder)
+        cluster = self._new(vim.ComputeResource, 'domain-c', parent=self.host_folder, name='cluster')
+        self.resource_pool = self._new(vim.ResourcePool, 'resgroup', parent=cluster, name='Resources')
+        self._props[cluster._moId]['resourcePool'] = self.resource_pool
+        self.host = self._new(vim.HostSystem, 'host', parent=cluster, name='esxi1',
+                              runtime=vim.host.RuntimeInfo(inMaintenanceMode=False))
+        self._props[self.resource_pool._moId]['owner'] = cluster
+        self._props[cluster._moId]['host'] = [self.host]
+        self.datastore_folder = self._new(vim.Folder, 'group-s', parent=self.datacenter, name='datastore')
+        self.content = vim.ServiceInstanceContent(
+            rootFolder=self.root,
+            viewManager=self._new(vim.view.ViewManager, 'ViewManager'),
+            propertyCollector=self._new(vmodl.query.PropertyCollector, 'propertyCollector'),
+            sessionManager=self._new(vim.SessionManager, 'SessionManager'),
+            setting=self._new(vim.option.OptionManager, 'VpxSettings',
+                              setting=[vim.option.OptionValue(key='VirtualCenter.FQDN', value='vcenter.local')]),
+            about=vim.AboutInfo(instanceUuid=str(uuid.uuid4())),
+        )
+        self._props[self.service_instance._moId] = {'content': self.content}
+        self._props[self.content.sessionManager._moId]['currentSession'] = vim.UserSession(key='session')
+
+    def round_trip(self, name):
+        """Count, and wait out the latency of, one SOAP call"""
+        with self._lock:
+            self.calls[name] += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def connect(self, host=None, user=None, password=None, port=443, base_dir=None):
+        """Login, returning a real ``vlab_inf_common.vmware.vCenter`` bound to this server.
+        Same signature as ``vCenter``, so it can be patched in for it.
+
+        :Returns: vlab_inf_common.vmware.vCenter
+        """
+        self.round_trip('Login')
+        vcenter = vCenter.__new__(vCenter)
+        vcenter._conn = self.service_instance
+        vcenter._base_dir = base_dir if base_dir else self._props[self.base_dir._moId]['name']
+        vcenter._net_cache = None
+        return vcenter
+
+    def _new(self, vimtype, prefix, parent=None, **props):
+        """Create a managed object, and put it in the inventory"""
+        with self._lock:
+            self._ids[prefix] += 1
+            moid = '{}-{}'.format(prefix, self._ids[prefix])
+        mo = vimtype(moid, self.stub)
+        props.setdefault('name', moid)
+        props['parent'] = parent
+        self._props[moid] = props
+        if parent is not None:
+            self._children[parent._moId].append(mo)
+        return mo
+
+    def add_folder(self, name, parent=None):
+        """Create a VM folder, under the top level VM folder by default
+
+        :Returns: vim.Folder
+        """
+        return self._new(vim.Folder, 'group', parent=parent or self.base_dir, name=name)
+
+    def add_network(self, name):
+        """Create a standard port group
+
+        :Returns: vim.Network
+        """
+        return self._new(vim.Network, 'network', parent=self.network_folder, name=name)
+
+    def add_datastore(self, name, free_gb=500):
+        """Create a datastore, mounted by the only ESXi host
+
+        :Returns: vim.Datastore
+        """
+        mount = vim.Datastore.HostMount(key=self.host, mountInfo=vim.host.MountInfo(accessible=True))
+        summary = vim.Datastore.Summary(name=name, freeSpace=free_gb * 1024 ** 3, accessible=True)
+        return self._new(vim.Datastore, 'datastore', parent=self.datastore_folder, name=name,
+                         summary=summary, host=[mount])
+
+    def add_vm(self, folder, name, annotation='', networks=(), power_state='poweredOn',
+               snapshot=False, nics=4):
+        """Create a VM
+
+        :Returns: vim.VirtualMachine
+        """
+        devices = [vim.vm.device.VirtualVmxnet3(key=4000 + x) for x in range(nics)]
+        the_vm = self._new(vim.VirtualMachine, 'vm', parent=folder, name=name,
+                           annotation=annotation, changeVersion=str(time.time()),
+                           devices=devices, powerState=power_state,
+                           networks=list(networks), ips=['192.168.1.1', 'fe80::1'])
+        if snapshot:
+            self._props[the_vm._moId]['snapshot'] = vim.vm.Snapshot('snapshot-{}'.format(the_vm._moId), self.stub)
+        return the_vm
+
+    def _walk(self, mo):
+        """Every object below ``mo``, recursively"""
+        for child in self._children[mo._moId]:
+            yield child
+            for descendant in self._walk(child):
+                yield descendant
+
+    def read(self, mo, name):
+        """The value of a managed object's property"""
+        props = self._props[mo._moId]
+        if isinstance(mo, vim.Folder) and name == 'childEntity':
+            return list(self._children[mo._moId])
+        elif isinstance(mo, vim.VirtualMachine):
+            return self._vm_property(mo, props, name)
+        elif isinstance(mo, vim.Network) and name == 'vm':
+            return [x for x in self._walk(self.vm_folder)
+                    if isinstance(x, vim.VirtualMachine) and mo in self._props[x._moId]['networks']]
+        elif isinstance(mo, vim.Task) and name == 'info':
+            return self._task_info(mo, props)
+        return props.get(name)
+
+    def _vm_property(self, the_vm, props, name):
+        if name == 'runtime':
+            return vim.vm.RuntimeInfo(powerState=props['powerState'])
+        elif name == 'config':
+            return vim.vm.ConfigInfo(annotation=props['annotation'],
+                                     changeVersion=props['changeVersion'],
+                                     hardware=vim.vm.VirtualHardware(device=props['devices']))
+        elif name == 'guest':
+            return vim.vm.GuestInfo(net=[vim.vm.GuestInfo.NicInfo(ipAddress=props['ips'])])
+        elif name == 'network':
+            return list(props['networks'])
+        elif name == 'snapshot':
+            if props.get('snapshot') is None:
+                return None
+            return vim.vm.SnapshotInfo(currentSnapshot=props['snapshot'])
+        return props.get(name)
+
+    def _task_info(self, task, props):
+        done = time.time() - props['created'] >= self.task_seconds
+        info = vim.TaskInfo(key=task._moId, task=task)
+        if done:
+            info.state = vim.TaskInfo.State.success
+            info.completeTime = datetime.datetime.now()
+            info.result = props['result']
+        else:
+            info.state = vim.TaskInfo.State.running
+        return info
+
+    def _task(self, result=None):
+        return self._new(vim.Task, 'task', created=time.time(), result=result)
+
+    def invoke(self, mo, name, args):
+        """Run a managed method"""
+        props = self._props.get(mo._moId, {})
+        if name == 'RetrieveContent':
+            return self.content
+        elif name == 'CreateContainerView':
+            container, types, recursive = args
+            children = self._walk(container) if recursive else self._children[container._moId]
+            view = [x for x in children if isinstance(x, tuple(types))]
+            return self._new(vim.view.ContainerView, 'session[fake]', view=view)
+        elif name == 'RetrieveContents':
+            contents = self._retrieve_contents(args[0])
+            self.objects_sent += len(contents)
+            return contents
+        elif name == 'CreatePropertyCollector':
+            return self._new(vmodl.query.PropertyCollector, 'session[collector]', reported=set())
+        elif name == 'CreateFilter':
+            props['filter'] = args[0]
+            return self._new(vmodl.query.PropertyCollector.Filter, 'session[filter]')
+        elif name == 'WaitForUpdatesEx':
+            return self._wait_for_updates(props)
+        elif isinstance(mo, vmodl.query.PropertyCollector) and name == 'Destroy':
+            # DestroyPropertyCollector
+            return None
+        elif name == 'AcquireCloneTicket':
+            return 'cst-{}'.format(uuid.uuid4())
+        elif isinstance(mo, vim.view.ContainerView) or name == 'Logout':
+            # DestroyView
+            return None
+        elif name == 'PowerOn':
+            props['powerState'] = 'poweredOn'
+        elif name == 'PowerOff':
+            props['powerState'] = 'poweredOff'
+        elif name == 'Reconfigure':
+            spec = args[0]
+            if spec.annotation is not None:
+                props['annotation'] = spec.annotation
+            props['changeVersion'] = str(time.time())
+        elif name == 'Destroy':
+            with self._lock:
+                self._children[props['parent']._moId].remove(mo)
+                self._destroyed.add(mo._moId)
+        elif name == 'Rename':
+            props['name'] = args[0]
+        elif name == 'MoveInto':
+            for the_vm in args[0]:
+                with self._lock:
+                    self._children[self._props[the_vm._moId]['parent']._moId].remove(the_vm)
+                    self._children[mo._moId].append(the_vm)
+                self._props[the_vm._moId]['parent'] = mo
+        elif name == 'Clone':
+            folder, new_name, spec = args
+            networks = [x.device.backing.network for x in spec.config.deviceChange
+                        if x.device.connectable.connected]
+            the_vm = self.add_vm(folder, new_name, annotation=props['annotation'],
+                                 networks=networks,
+                                 power_state='poweredOn' if spec.powerOn else 'poweredOff')
+            return self._task(result=the_vm)
+        elif name == 'CreateSnapshot':
+            props['snapshot'] = vim.vm.Snapshot('snapshot-{}'.format(mo._moId), self.stub)
+        else:
+            raise NotImplementedError('FakeServer does not support {}'.format(name))
+        return self._task()
+
+    def _wait_for_updates(self, props):
+        """Report the tasks in the filter that have finished since the last call,
+        or for any other filter, what changed since the last call"""
+        if not all(isinstance(x.obj, vim.Task) for x in props['filter'].objectSet):
+            return self._diff_filter(props)
+        tasks = [x.obj for x in props['filter'].objectSet if x.obj._moId not in props['reported']]
+        if not tasks:
+            return None
+        oldest = min(self._props[x._moId]['created'] for x in tasks)
+        time.sleep(max(0, oldest + self.task_seconds - time.time()))
+        object_set = []
+        for task in tasks:
+            info = self._task_info(task, self._props[task._moId])
+            if info.state == vim.TaskInfo.State.success:
+                props['reported'].add(task._moId)
+                object_set.append(SimpleNamespace(obj=task, changeSet=[SimpleNamespace(name='info.state', val=info.state)]))
+        return SimpleNamespace(version=str(len(props['reported'])), filterSet=[SimpleNamespace(objectSet=object_set)])
+
+    def _diff_filter(self, props):
+        """Compare what the filter matches now with what it matched at the last call"""
+        current = {}
+        for content in self._retrieve_contents([props['filter']]):
+            current[content.obj._moId] = (content.obj, {x.name: x.val for x in content.propSet})
+        seen = props.get('seen', {})
+        object_set = []
+        for moid, (obj, values) in current.items():
+            before = seen.get(moid)
+            if before is None:
+                changes = [SimpleNamespace(name=k, op='assign', val=v) for k, v in values.items()]
+                object_set.append(SimpleNamespace(obj=obj, kind='enter', changeSet=changes))
+                continue
+            # Data objects are rebuilt on every read, so compare what they hold
+            changes = [SimpleNamespace(name=k, op='assign', val=v) for k, v in values.items()
+                       if repr(v) != repr(before.get(k))]
+            if changes:
+                object_set.append(SimpleNamespace(obj=obj, kind='modify', changeSet=changes))
+        for moid in set(seen) - set(current):
+            object_set.append(SimpleNamespace(obj=props['objects'][moid], kind='leave', changeSet=[]))
+        props['seen'] = {moid: values for moid, (_, values) in current.items()}
+        props['objects'] = {moid: obj for moid, (obj, _) in current.items()}
+        self.objects_sent += len(object_set)
+        if not object_set:
+            return None
+        props['version'] = props.get('version', 0) + 1
+        return SimpleNamespace(version=str(props['version']), truncated=False,
+                               filterSet=[SimpleNamespace(objectSet=object_set)])
+
+    def _retrieve_contents(self, spec_set):
+        """A PropertyCollector that follows TraversalSpecs from each ObjectSpec"""
+        contents = []
+        for filter_spec in spec_set:
+            found = []
+            for obj_spec in filter_spec.objectSet:
+                if obj_spec.obj._moId in self._destroyed:
+                    raise vmodl.fault.ManagedObjectNotFound(obj=obj_spec.obj)
+                if not obj_spec.skip:
+                    found.append(obj_spec.obj)
+                found += self._traverse(obj_spec.obj, obj_spec.selectSet)
+            seen = set()
+            for obj in found:
+                if obj._moId in seen:
+                    continue
+                seen.add(obj._moId)
+                for prop_spec in filter_spec.propSet:
+                    if isinstance(obj, prop_spec.type):
+                        prop_set = [SimpleNamespace(name=x, val=self._path(obj, x)) for x in prop_spec.pathSet]
+                        contents.append(SimpleNamespace(obj=obj, propSet=prop_set))
+        return contents
+
+    def _traverse(self, obj, select_set):
+        found = []
+        for spec in select_set or []:
+            if not isinstance(obj, spec.type):
+                continue
+            value = self.read(obj, spec.path)
+            targets = value if isinstance(value, list) else [value]
+            for target in targets:
+                if target is None:
+                    continue
+                if not spec.skip:
+                    found.append(target)
+                found += self._traverse(target, spec.selectSet)
+        return found
+
+    def _path(self, obj, path):
+        """Read a dotted property path, like ``config.annotation``, without a round trip"""
+        head, _, rest = path.partition('.')
+        value = self.read(obj, head)
+        for part in rest.split('.') if rest else []:
+            value = getattr(value, part)
+        return value
+
+
+def console_url(vcenter, the_vm):
+    """Stand-in for ``virtual_machine._get_vm_console_url``, which fetches the TLS
+    certificate of vCenter. Makes the same SOAP calls, and counts the certificate
+    fetch as a round trip too.
+
+    :Returns: String
+    """
+    vcenter._conn._stub.server.round_trip('get_server_certificate')
+    server_guid = vcenter.content.about.instanceUuid
+    session = vcenter.content.sessionManager.AcquireCloneTicket()
+    for item in vcenter.content.setting.setting:
+        if item.key == 'VirtualCenter.FQDN':
+            break
+    return 'https://vcenter.local/ui/webconsole.html?vmId={}&vmName={}&serverGuid={}&sessionTicket={}'.format(
+        the_vm._moId, the_vm.name, server_guid, session)
@@ -15,5 +15,5 @@ setup(name="vlab-router-api",
       package_files={'vlab_router_api' : ['app.ini']},
       description="router",
       install_requires=['flask', 'ldap3', 'pyjwt', 'uwsgi', 'vlab-api-common',
-                        'ujson', 'cryptography', 'vlab-inf-common', 'celery']
+                        'ujson', 'cryptography', 'vlab-inf-common', 'celery[redis]']
       )
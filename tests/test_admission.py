@@ -0,0 +1,129 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in admission.py
+"""
+import shutil
+import tempfile
+import unittest
+from collections import OrderedDict
+from unittest.mock import patch, MagicMock
+
+from vlab_router_api.lib import admission
+
+
+class TestLeases(unittest.TestCase):
+    """A set of test cases for the Leases object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.admission_dir = tempfile.mkdtemp()
+        self.leases = admission.Leases(directory=self.admission_dir, ttl=60)
+        self.celery_app = MagicMock()
+        # Not the Redis backend, so the leases are files
+        self.celery_app.backend = object()
+        self.caps = OrderedDict([('user:bob', 2), ('vcenter', 3)])
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.admission_dir)
+
+    def test_acquire(self):
+        """``Leases.acquire`` returns None when the leases were taken"""
+        full = self.leases.acquire(self.celery_app, 'task1', 2, self.caps)
+
+        self.assertTrue(full is None)
+
+    def test_acquire_full(self):
+        """``Leases.acquire`` returns the scope that's full"""
+        self.leases.acquire(self.celery_app, 'task1', 2, self.caps)
+        full = self.leases.acquire(self.celery_app, 'task2', 1, self.caps)
+
+        self.assertEqual(full, 'user:bob')
+
+    def test_acquire_all_or_nothing(self):
+        """``Leases.acquire`` takes no leases when any scope is full"""
+        self.leases.acquire(self.celery_app, 'task1', 2, OrderedDict([('vcenter', 3)]))
+        self.leases.acquire(self.celery_app, 'task2', 2, self.caps)
+        full = self.leases.acquire(self.celery_app, 'task3', 2, OrderedDict([('user:bob', 2)]))
+
+        self.assertTrue(full is None)
+
+    def test_release(self):
+        """``Leases.release`` makes room for another holder"""
+        self.leases.acquire(self.celery_app, 'task1', 2, self.caps)
+        self.leases.release(self.celery_app, 'task1', 2, list(self.caps.keys()))
+        full = self.leases.acquire(self.celery_app, 'task2', 2, self.caps)
+
+        self.assertTrue(full is None)
+
+    @patch.object(admission.time, 'time')
+    def test_expired(self, fake_time):
+        """``Leases.acquire`` ignores leases that expired"""
+        fake_time.return_value = 100
+        self.leases.acquire(self.celery_app, 'task1', 2, self.caps)
+        fake_time.return_value = 200
+        full = self.leases.acquire(self.celery_app, 'task2', 2, self.caps)
+
+        self.assertTrue(full is None)
+
+    def test_acquire_redis(self):
+        """``Leases.acquire`` maps the answer of the Redis script to the full scope"""
+        self.celery_app.backend = MagicMock()
+        self.celery_app.backend.client.eval.return_value = 2
+
+        full = self.leases.acquire(self.celery_app, 'task1', 1, self.caps)
+
+        self.assertEqual(full, 'vcenter')
+
+
+class TestAdmit(unittest.TestCase):
+    """A set of test cases for the ``admit`` and ``release`` functions"""
+
+    @patch.object(admission, 'leases')
+    def test_admit_busy(self, fake_leases):
+        """``admit`` raises Busy when a scope is full"""
+        fake_leases.acquire.return_value = 'user:bob'
+
+        with self.assertRaises(admission.Busy):
+            admission.admit(MagicMock(), 'bob')('task1')
+
+    @patch.object(admission, 'leases')
+    def test_admit_bulk(self, fake_leases):
+        """``admit`` only counts the Routers a bulk create deploys at the same time"""
+        fake_leases.acquire.return_value = None
+
+        admission.admit(MagicMock(), 'bob', 50)('task1')
+        count = fake_leases.acquire.call_args[0][2]
+
+        self.assertEqual(count, admission.const.VLAB_ROUTER_BULK_CONCURRENCY)
+
+    @patch.object(admission, 'leases')
+    def test_admit_release(self, fake_leases):
+        """``admit`` makes a function that can give back the leases it took"""
+        fake_leases.acquire.return_value = None
+        take = admission.admit(MagicMock(), 'bob', 50)
+
+        take('task1')
+        take.release('task1')
+        _, holder, count, _ = fake_leases.release.call_args[0]
+
+        self.assertEqual(holder, 'task1')
+        self.assertEqual(count, fake_leases.acquire.call_args[0][2])
+
+    @patch.object(admission, 'const', admission.const._replace(INF_VCENTER_SERVER='vcenter.local'))
+    def test_caps(self):
+        """``_caps`` caps the deploys of a user, and of the whole vCenter"""
+        output = list(admission._caps('bob').keys())
+
+        self.assertEqual(output, ['user:bob', 'vcenter:vcenter.local'])
+
+    @patch.object(admission, 'leases')
+    def test_release_error(self, fake_leases):
+        """``release`` doesn't fail the task when the leases can't be given back"""
+        fake_leases.release.side_effect = OSError('testing')
+
+        admission.release(MagicMock(), 'bob', 'task1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -51,6 +51,37 @@ class TestRouterViewSchema(unittest.TestCase):
 
         self.assertTrue(schema_valid)
 
+    def test_bulk_post_schema(self):
+        """The schema defined for POST on /bulk is valid"""
+        try:
+            Draft4Validator.check_schema(router.RouterView.BULK_POST_SCHEMA)
+            schema_valid = True
+        except RuntimeError:
+            schema_valid = False
+
+        self.assertTrue(schema_valid)
+
+    def test_bulk_delete_schema(self):
+        """The schema defined for DELETE on /bulk is valid"""
+        try:
+            Draft4Validator.check_schema(router.RouterView.BULK_DELETE_SCHEMA)
+            schema_valid = True
+        except RuntimeError:
+            schema_valid = False
+
+        self.assertTrue(schema_valid)
+
+    def test_bulk_post_requires_networks(self):
+        """The schema defined for POST on /bulk requires every Router to have 'networks'"""
+        body = {'routers': [{'name': 'myRouter', 'image': '1.0.32'}]}
+        try:
+            validate(body, router.RouterView.BULK_POST_SCHEMA)
+            schema_valid = False
+        except ValidationError:
+            schema_valid = True
+
+        self.assertTrue(schema_valid)
+
     def test_post_requires_image(self):
         """The schema defined for POST requires the parameter 'image'"""
         body = {'name': 'myRouter', 'networks': ['net1', 'net2']}
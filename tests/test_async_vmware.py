@@ -0,0 +1,183 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in async_vmware.py
+"""
+import asyncio
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_router_api.lib.worker import async_vmware
+
+
+async def _call(step, *args, **kwargs):
+    """Run a blocking step right away, instead of on an executor"""
+    return step(*args, **kwargs)
+
+
+def _run(coroutine):
+    """Run a coroutine to the end"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class TestWaitTask(unittest.TestCase):
+    """A set of test cases for the ``wait_task`` function"""
+
+    @patch.object(async_vmware, 'const', async_vmware.const._replace(VLAB_ROUTER_TASK_POLL=0))
+    @patch.object(async_vmware.vmware, 'task_done')
+    def test_wait_task(self, fake_task_done):
+        """``wait_task`` checks on the vCenter task until it's done"""
+        fake_task_done.side_effect = [False, False, True]
+
+        _run(async_vmware.wait_task(_call, 'task-1'))
+
+        self.assertEqual(fake_task_done.call_count, 3)
+
+    @patch.object(async_vmware.vmware, 'task_done')
+    def test_wait_task_error(self, fake_task_done):
+        """``wait_task`` raises RuntimeError when the vCenter task fails"""
+        fake_task_done.side_effect = RuntimeError('testing')
+
+        with self.assertRaises(RuntimeError):
+            _run(async_vmware.wait_task(_call, 'task-1'))
+
+    @patch.object(async_vmware, 'const', async_vmware.const._replace(VLAB_ROUTER_TASK_POLL=0.01))
+    @patch.object(async_vmware.vmware, 'task_done')
+    def test_wait_task_timeout(self, fake_task_done):
+        """``wait_task`` raises RuntimeError when the vCenter task takes too long"""
+        fake_task_done.return_value = False
+
+        with self.assertRaises(RuntimeError):
+            _run(async_vmware.wait_task(_call, 'task-1', timeout=0.05))
+
+
+class TestCoroutines(unittest.TestCase):
+    """A set of test cases for the coroutines of the vmware functions"""
+
+    @patch.object(async_vmware.vmware, 'task_done')
+    @patch.object(async_vmware, '_created_info')
+    @patch.object(async_vmware, '_start_set_meta')
+    @patch.object(async_vmware, '_start')
+    @patch.object(async_vmware, '_deploy')
+    @patch.object(async_vmware.vmware, 'check_image')
+    def test_create_router(self, fake_check_image, fake_deploy, fake_start, fake_start_set_meta, fake_created_info, fake_task_done):
+        """``create_router`` deploys, powers on and describes the new Router"""
+        fake_check_image.return_value = ('router-vyos-1.1.8.ova', {'networks': ['frontend']}, ['bob_frontend'])
+        fake_deploy.return_value = ('vm-1', None)
+        fake_start.return_value = 'task-1'
+        fake_start_set_meta.return_value = 'task-2'
+        fake_created_info.return_value = {'myRouter': {'worked': True}}
+        fake_task_done.return_value = True
+
+        output = _run(async_vmware.create_router(_call, 'bob', 'myRouter', '1.1.8', ['frontend'], MagicMock()))
+        waited = [x[0][0] for x in fake_task_done.call_args_list]
+
+        self.assertEqual(output, {'myRouter': {'worked': True}})
+        fake_start.assert_called_with('vm-1', 'on')
+        self.assertEqual(waited, ['task-1', 'task-2'])
+
+    @patch.object(async_vmware.vmware, 'task_done')
+    @patch.object(async_vmware, '_created_info')
+    @patch.object(async_vmware, '_start_set_meta')
+    @patch.object(async_vmware, '_start')
+    @patch.object(async_vmware, '_deploy')
+    @patch.object(async_vmware.vmware, 'check_image')
+    def test_create_router_power_fails(self, fake_check_image, fake_deploy, fake_start, fake_start_set_meta, fake_created_info, fake_task_done):
+        """``create_router`` carries on when powering on fails, like ``vmware.create_router``"""
+        fake_check_image.return_value = ('router-vyos-1.1.8.ova', {'networks': ['frontend']}, ['bob_frontend'])
+        fake_deploy.return_value = ('vm-1', None)
+        fake_start.return_value = 'task-1'
+        fake_start_set_meta.return_value = 'task-2'
+        fake_created_info.return_value = {'myRouter': {'worked': True}}
+        fake_task_done.side_effect = [RuntimeError('testing'), True]
+
+        output = _run(async_vmware.create_router(_call, 'bob', 'myRouter', '1.1.8', ['frontend'], MagicMock()))
+
+        self.assertEqual(output, {'myRouter': {'worked': True}})
+
+    @patch.object(async_vmware.vmware, 'check_image')
+    def test_create_router_value_error(self, fake_check_image):
+        """``create_router`` raises the ValueError of a bad request"""
+        fake_check_image.side_effect = ValueError('testing')
+
+        with self.assertRaises(ValueError):
+            _run(async_vmware.create_router(_call, 'bob', 'myRouter', '9.9.9', [], MagicMock()))
+
+    @patch.object(async_vmware, 'inventory')
+    @patch.object(async_vmware.vmware, 'task_done')
+    @patch.object(async_vmware, '_start_destroy')
+    @patch.object(async_vmware, '_start')
+    @patch.object(async_vmware, '_find')
+    def test_delete_router(self, fake_find, fake_start, fake_start_destroy, fake_task_done, fake_inventory):
+        """``delete_router`` powers off and destroys the Router"""
+        fake_find.return_value = ('vm-1', {'datastore': 'ds1'})
+        fake_start.return_value = 'task-1'
+        fake_start_destroy.return_value = 'task-2'
+        fake_task_done.return_value = True
+
+        _run(async_vmware.delete_router(_call, 'bob', 'myRouter', MagicMock()))
+        waited = [x[0][0] for x in fake_task_done.call_args_list]
+
+        fake_start.assert_called_with('vm-1', 'off')
+        self.assertEqual(waited, ['task-1', 'task-2'])
+        self.assertTrue(fake_inventory.invalidate.called)
+
+    @patch.object(async_vmware.vmware, 'task_done')
+    @patch.object(async_vmware, '_start_destroy')
+    @patch.object(async_vmware, '_start')
+    @patch.object(async_vmware, '_find')
+    def test_delete_router_no_wait(self, fake_find, fake_start, fake_start_destroy, fake_task_done):
+        """``delete_router`` returns the destroy task without waiting on it when ``wait`` is False"""
+        fake_find.return_value = ('vm-1', {})
+        fake_start.return_value = None
+        fake_start_destroy.return_value = 'task-2'
+
+        output = _run(async_vmware.delete_router(_call, 'bob', 'myRouter', MagicMock(), wait=False))
+
+        self.assertEqual(output, 'task-2')
+        self.assertFalse(fake_task_done.called)
+
+    @patch.object(async_vmware, 'session_pool')
+    @patch.object(async_vmware.meta_index, 'find')
+    def test_find_missing(self, fake_find, fake_session_pool):
+        """``_find`` raises ValueError when the user has no such Router"""
+        fake_find.return_value = (None, None)
+
+        with self.assertRaises(ValueError):
+            async_vmware._find('bob', 'myRouter')
+
+    @patch.object(async_vmware, 'vim')
+    @patch.object(async_vmware, 'session_pool')
+    def test_start_already(self, fake_session_pool, fake_vim):
+        """``_start`` doesn't start a task for a VM that's already in the requested state"""
+        fake_vim.VirtualMachine.return_value.runtime.powerState = 'poweredOn'
+
+        output = async_vmware._start('vm-1', 'on')
+
+        self.assertTrue(output is None)
+        self.assertFalse(fake_vim.VirtualMachine.return_value.PowerOn.called)
+
+    @patch.object(async_vmware, 'vim')
+    @patch.object(async_vmware, 'session_pool')
+    def test_start(self, fake_session_pool, fake_vim):
+        """``_start`` returns the moId of the power task"""
+        fake_vim.VirtualMachine.return_value.runtime.powerState = 'poweredOn'
+        fake_vim.VirtualMachine.return_value.PowerOff.return_value._moId = 'task-1'
+
+        output = async_vmware._start('vm-1', 'off')
+
+        self.assertEqual(output, 'task-1')
+
+    def test_coroutines(self):
+        """``COROUTINES`` has a coroutine for show, create, delete and image"""
+        vmware = async_vmware.vmware
+        expected = {vmware.show_router, vmware.create_router, vmware.delete_router, vmware.list_images}
+
+        self.assertEqual(set(async_vmware.COROUTINES.keys()), expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in celery_config.py
+"""
+import unittest
+from unittest.mock import patch
+
+from vlab_router_api.lib import celery_config
+
+
+class TestMakeCelery(unittest.TestCase):
+    """A set of test cases for the ``make_celery`` function"""
+
+    @patch.object(celery_config, 'const', celery_config.const._replace(VLAB_ROUTER_RESULT_BACKEND='redis://results:6379/0',
+                                                                       VLAB_ROUTER_RESULT_TTL=60))
+    def test_backend(self):
+        """``make_celery`` stores results in the configured backend, and expires them"""
+        app = celery_config.make_celery()
+
+        self.assertEqual(app.conf.result_backend, 'redis://results:6379/0')
+        self.assertEqual(app.conf.result_expires, 60)
+
+    def test_json(self):
+        """``make_celery`` only accepts JSON"""
+        app = celery_config.make_celery()
+
+        self.assertEqual(app.conf.accept_content, ['json'])
+        self.assertEqual(app.conf.result_serializer, 'json')
+
+    @patch.object(celery_config, 'const', celery_config.const._replace(VLAB_ROUTER_RESULT_COMPRESSION=''))
+    def test_no_compression(self):
+        """``make_celery`` can store results uncompressed"""
+        app = celery_config.make_celery()
+
+        self.assertTrue(app.conf.result_compression is None)
+
+
+    def test_queues(self):
+        """``make_celery`` declares a fast and a slow queue, both with priorities"""
+        app = celery_config.make_celery()
+        queues = {x.name: x.queue_arguments for x in app.conf.task_queues}
+        expected = {'router_fast': {'x-max-priority': 9}, 'router_slow': {'x-max-priority': 9}}
+
+        self.assertEqual(queues, expected)
+        self.assertEqual(app.conf.worker_prefetch_multiplier, 1)
+
+    def test_routes(self):
+        """``make_celery`` sends reads to the fast queue, and deploys to the slow one"""
+        app = celery_config.make_celery()
+
+        self.assertEqual(app.amqp.router.route({}, 'router.show')['queue'].name, 'router_fast')
+        self.assertEqual(app.amqp.router.route({}, 'router.create')['queue'].name, 'router_slow')
+
+    def test_acks_late(self):
+        """``make_celery`` only acknowledges slow tasks once they're done, so they don't hoard messages"""
+        app = celery_config.make_celery()
+
+        @app.task(name='router.create')
+        def create():
+            pass
+
+        @app.task(name='router.show')
+        def show():
+            pass
+
+        self.assertTrue(create.acks_late)
+        self.assertFalse(show.acks_late)
+
+    def test_delete_before_create(self):
+        """``task_routes`` puts deletes ahead of creates waiting in the same queue"""
+        routes = celery_config.task_routes()
+
+        self.assertTrue(routes['router.delete']['priority'] > routes['router.create']['priority'])
+
+
+if __name__ == '__main__':
+    unittest.main()
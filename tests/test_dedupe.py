@@ -0,0 +1,157 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in dedupe.py
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_router_api.lib import dedupe
+
+
+class TestDeduper(unittest.TestCase):
+    """A set of test cases for the Deduper object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.deduper = dedupe.Deduper(window=60)
+        self.celery_app = MagicMock()
+        # Not the Redis backend, so keys are kept in the process
+        self.celery_app.backend = object()
+        self.celery_app.send_task.side_effect = lambda name, args, task_id: MagicMock(id=task_id)
+
+    def test_submit(self):
+        """``Deduper.submit`` sends a task for a new submission"""
+        task_id = self.deduper.submit(self.celery_app, 'key1', 'router.create', ['bob'])
+
+        _, kwargs = self.celery_app.send_task.call_args
+        self.assertEqual(kwargs['task_id'], task_id)
+
+    def test_submit_duplicate(self):
+        """``Deduper.submit`` returns the first task for a repeated submission"""
+        first = self.deduper.submit(self.celery_app, 'key1', 'router.create', ['bob'])
+        second = self.deduper.submit(self.celery_app, 'key1', 'router.create', ['bob'])
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.celery_app.send_task.call_count, 1)
+
+    @patch.object(dedupe.time, 'time')
+    def test_submit_expired(self, fake_time):
+        """``Deduper.submit`` forgets a submission after the window"""
+        fake_time.return_value = 100
+        first = self.deduper.submit(self.celery_app, 'key1', 'router.create', ['bob'])
+        fake_time.return_value = 200
+        second = self.deduper.submit(self.celery_app, 'key1', 'router.create', ['bob'])
+
+        self.assertNotEqual(first, second)
+
+    def test_submit_not_reused(self):
+        """``Deduper.submit`` sends a new task when ``reuse`` rejects the old one"""
+        first = self.deduper.submit(self.celery_app, 'key1', 'router.show', ['bob'])
+        second = self.deduper.submit(self.celery_app, 'key1', 'router.show', ['bob'], reuse=lambda x: False)
+        third = self.deduper.submit(self.celery_app, 'key1', 'router.show', ['bob'])
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(second, third)
+
+    def test_submit_send_fails(self):
+        """``Deduper.submit`` forgets a submission whose task was never sent"""
+        self.celery_app.send_task.side_effect = [RuntimeError('testing'), MagicMock(id='asdf')]
+
+        with self.assertRaises(RuntimeError):
+            self.deduper.submit(self.celery_app, 'key1', 'router.create', ['bob'])
+        task_id = self.deduper.submit(self.celery_app, 'key1', 'router.create', ['bob'])
+
+        self.assertEqual(task_id, 'asdf')
+
+    def test_submit_send_fails_release(self):
+        """``Deduper.submit`` gives back what ``admit`` took when the task can't be sent"""
+        self.celery_app.send_task.side_effect = RuntimeError('testing')
+        fake_admit = MagicMock()
+
+        with self.assertRaises(RuntimeError):
+            self.deduper.submit(self.celery_app, 'key1', 'router.create', ['bob'], admit=fake_admit)
+        admitted = fake_admit.call_args[0][0]
+
+        fake_admit.release.assert_called_with(admitted)
+
+    def test_submit_refused_no_release(self):
+        """``Deduper.submit`` has nothing to give back when ``admit`` refuses the task"""
+        fake_admit = MagicMock(side_effect=RuntimeError('testing'))
+
+        with self.assertRaises(RuntimeError):
+            self.deduper.submit(self.celery_app, 'key1', 'router.create', ['bob'], admit=fake_admit)
+
+        self.assertFalse(fake_admit.release.called)
+        self.assertFalse(self.celery_app.send_task.called)
+
+    def test_submit_redis(self):
+        """``Deduper.submit`` reuses the task another API replica stored in Redis"""
+        self.celery_app.backend = MagicMock()
+        self.celery_app.backend.client.set.return_value = None
+        self.celery_app.backend.client.get.return_value = b'some-task-id'
+
+        task_id = self.deduper.submit(self.celery_app, 'key1', 'router.create', ['bob'])
+
+        self.assertEqual(task_id, 'some-task-id')
+        self.assertFalse(self.celery_app.send_task.called)
+
+
+class TestSubmit(unittest.TestCase):
+    """A set of test cases for the ``submit`` and ``show`` functions"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.celery_app = MagicMock()
+        self.celery_app.backend = object()
+        self.celery_app.send_task.side_effect = lambda name, args, task_id=None: MagicMock(id=task_id or 'no-dedupe')
+
+    @patch.object(dedupe, 'deduper', dedupe.Deduper(window=60))
+    def test_payload(self):
+        """``submit`` only dedupes requests with the same payload"""
+        first = dedupe.submit(self.celery_app, 'bob', 'router.delete', ['bob', 'r1', 'id1'], 'id1', {'name': 'r1'})
+        second = dedupe.submit(self.celery_app, 'bob', 'router.delete', ['bob', 'r2', 'id1'], 'id1', {'name': 'r2'})
+
+        self.assertNotEqual(first, second)
+
+    @patch.object(dedupe, 'deduper', dedupe.Deduper(window=60))
+    def test_no_txn_id(self):
+        """``submit`` doesn't dedupe requests without an X-REQUEST-ID"""
+        dedupe.submit(self.celery_app, 'bob', 'router.delete', ['bob', 'r1', 'noId'], 'noId', {'name': 'r1'})
+        dedupe.submit(self.celery_app, 'bob', 'router.delete', ['bob', 'r1', 'noId'], 'noId', {'name': 'r1'})
+
+        self.assertEqual(self.celery_app.send_task.call_count, 2)
+
+    def test_no_txn_id_send_fails(self):
+        """``submit`` gives back what ``admit`` took when a request without an X-REQUEST-ID can't be sent"""
+        self.celery_app.send_task.side_effect = RuntimeError('testing')
+        fake_admit = MagicMock()
+
+        with self.assertRaises(RuntimeError):
+            dedupe.submit(self.celery_app, 'bob', 'router.create', ['bob'], 'noId', {}, admit=fake_admit)
+        admitted = fake_admit.call_args[0][0]
+
+        fake_admit.release.assert_called_with(admitted)
+
+    @patch.object(dedupe, 'deduper', dedupe.Deduper(window=60))
+    def test_show_coalesced(self):
+        """``show`` joins the router.show that's still running for the user"""
+        self.celery_app.AsyncResult.return_value.ready.return_value = False
+
+        first = dedupe.show(self.celery_app, 'bob', 'id1')
+        second = dedupe.show(self.celery_app, 'bob', 'id2')
+
+        self.assertEqual(first, second)
+
+    @patch.object(dedupe, 'deduper', dedupe.Deduper(window=60))
+    def test_show_done(self):
+        """``show`` starts a new router.show once the last one is done"""
+        self.celery_app.AsyncResult.return_value.ready.return_value = True
+
+        first = dedupe.show(self.celery_app, 'bob', 'id1')
+        second = dedupe.show(self.celery_app, 'bob', 'id2')
+
+        self.assertNotEqual(first, second)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,137 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in folder_diff.py
+"""
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from vlab_router_api.lib.worker import folder_diff
+from vlab_router_api.lib.worker.folder_diff import vim, vmodl
+
+
+def _update(version, *obj_updates):
+    """Make an UpdateSet like WaitForUpdatesEx returns"""
+    return SimpleNamespace(version=version, truncated=False,
+                           filterSet=[SimpleNamespace(objectSet=list(obj_updates))])
+
+
+def _obj(obj, kind, **changes):
+    change_set = [SimpleNamespace(name=k.replace('__', '.'), op='assign', val=v) for k, v in changes.items()]
+    return SimpleNamespace(obj=obj, kind=kind, changeSet=change_set)
+
+
+class TestFolderDiffs(unittest.TestCase):
+    """A set of test cases for the FolderDiffs object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.vcenter = MagicMock()
+        self.collector = self.vcenter.content.propertyCollector.CreatePropertyCollector.return_value
+        self.folder = vim.Folder('group-1')
+        self.vm1 = vim.VirtualMachine('vm-1')
+        self.vm2 = vim.VirtualMachine('vm-2')
+        self.network = vim.Network('network-1')
+        self.initial = _update('1',
+                               _obj(self.vm1, 'enter', name='router1', runtime__powerState='poweredOn'),
+                               _obj(self.vm2, 'enter', name='router2', runtime__powerState='poweredOn'),
+                               _obj(self.network, 'enter', name='alice_frontend'))
+        self.diffs = folder_diff.FolderDiffs(max_views=4)
+
+    def test_retrieve(self):
+        """``FolderDiffs.retrieve`` returns every VM the first time"""
+        self.collector.WaitForUpdatesEx.return_value = self.initial
+        vms, network_names = self.diffs.retrieve(self.vcenter, 'alice', self.folder)
+
+        self.assertEqual(sorted(x['name'] for x in vms.values()), ['router1', 'router2'])
+        self.assertEqual(network_names, {'network-1': 'alice_frontend'})
+
+    def test_retrieve_changes(self):
+        """``FolderDiffs.retrieve`` merges what changed into what it read before"""
+        self.collector.WaitForUpdatesEx.side_effect = [self.initial,
+                                                       _update('2', _obj(self.vm1, 'modify', runtime__powerState='poweredOff'))]
+        self.diffs.retrieve(self.vcenter, 'alice', self.folder)
+        vms, _ = self.diffs.retrieve(self.vcenter, 'alice', self.folder)
+
+        self.assertEqual(vms[self.vm1], {'name': 'router1', 'runtime.powerState': 'poweredOff'})
+        self.assertEqual(vms[self.vm2]['runtime.powerState'], 'poweredOn')
+
+    def test_retrieve_version(self):
+        """``FolderDiffs.retrieve`` only asks for what changed since the last read"""
+        self.collector.WaitForUpdatesEx.side_effect = [self.initial, None]
+        self.diffs.retrieve(self.vcenter, 'alice', self.folder)
+        self.diffs.retrieve(self.vcenter, 'alice', self.folder)
+        versions = [x[0][0] for x in self.collector.WaitForUpdatesEx.call_args_list]
+
+        self.assertEqual(versions, ['', '1'])
+        self.assertEqual(self.collector.CreateFilter.call_count, 1)
+
+    def test_retrieve_nothing_changed(self):
+        """``FolderDiffs.retrieve`` returns what it read before when nothing changed"""
+        self.collector.WaitForUpdatesEx.side_effect = [self.initial, None]
+        first, _ = self.diffs.retrieve(self.vcenter, 'alice', self.folder)
+        second, _ = self.diffs.retrieve(self.vcenter, 'alice', self.folder)
+
+        self.assertEqual(first, second)
+
+    def test_retrieve_leave(self):
+        """``FolderDiffs.retrieve`` drops VMs that left the folder"""
+        self.collector.WaitForUpdatesEx.side_effect = [self.initial, _update('2', _obj(self.vm2, 'leave'))]
+        self.diffs.retrieve(self.vcenter, 'alice', self.folder)
+        vms, _ = self.diffs.retrieve(self.vcenter, 'alice', self.folder)
+
+        self.assertEqual(list(vms.keys()), [self.vm1])
+
+    def test_retrieve_stale(self):
+        """``FolderDiffs.retrieve`` reads the whole folder again when the collector is gone"""
+        self.collector.WaitForUpdatesEx.side_effect = [self.initial,
+                                                       vmodl.fault.ManagedObjectNotFound(),
+                                                       _update('1', _obj(self.vm1, 'enter', name='router1'))]
+        self.diffs.retrieve(self.vcenter, 'alice', self.folder)
+        vms, _ = self.diffs.retrieve(self.vcenter, 'alice', self.folder)
+
+        self.assertEqual(vms, {self.vm1: {'name': 'router1'}})
+        self.assertEqual(self.collector.CreateFilter.call_count, 2)
+
+    def test_retrieve_error(self):
+        """``FolderDiffs.retrieve`` starts over after an unexpected error"""
+        self.collector.WaitForUpdatesEx.side_effect = [RuntimeError('testing'), self.initial]
+        with self.assertRaises(RuntimeError):
+            self.diffs.retrieve(self.vcenter, 'alice', self.folder)
+        vms, _ = self.diffs.retrieve(self.vcenter, 'alice', self.folder)
+
+        self.assertEqual(len(vms), 2)
+        self.assertTrue(self.collector.DestroyPropertyCollector.called)
+
+    def test_retrieve_other_session(self):
+        """``FolderDiffs.retrieve`` keeps a view per session; collectors belong to one"""
+        other = MagicMock()
+        other.content.propertyCollector.CreatePropertyCollector.return_value.WaitForUpdatesEx.return_value = self.initial
+        self.collector.WaitForUpdatesEx.return_value = self.initial
+        self.diffs.retrieve(self.vcenter, 'alice', self.folder)
+        self.diffs.retrieve(other, 'alice', self.folder)
+
+        self.assertTrue(other.content.propertyCollector.CreatePropertyCollector.called)
+
+    def test_retrieve_evicts(self):
+        """``FolderDiffs.retrieve`` destroys the collector of an evicted view, once its session is used"""
+        self.diffs.max_views = 1
+        self.collector.WaitForUpdatesEx.return_value = self.initial
+        self.diffs.retrieve(self.vcenter, 'alice', self.folder)
+        self.diffs.retrieve(self.vcenter, 'bob', vim.Folder('group-2'))
+        self.assertFalse(self.collector.DestroyPropertyCollector.called)
+        self.diffs.retrieve(self.vcenter, 'bob', vim.Folder('group-2'))
+
+        self.assertTrue(self.collector.DestroyPropertyCollector.called)
+
+    def test_retrieve_new_folder(self):
+        """``FolderDiffs.retrieve`` watches the new folder when a user's folder is replaced"""
+        self.collector.WaitForUpdatesEx.return_value = self.initial
+        self.diffs.retrieve(self.vcenter, 'alice', self.folder)
+        self.diffs.retrieve(self.vcenter, 'alice', vim.Folder('group-9'))
+
+        self.assertEqual(self.collector.CreateFilter.call_count, 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
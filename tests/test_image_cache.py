@@ -0,0 +1,207 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in image_cache.py
+"""
+import io
+import os
+import time
+import shutil
+import hashlib
+import tarfile
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from vlab_router_api.lib.worker import image_cache, ova_index
+
+DISK = b'\x01' * 4096
+
+
+def _make_ova(path, disk=DISK, checksum=None):
+    """Create a tiny OVA file, with a manifest"""
+    checksum = checksum or hashlib.sha256(disk).hexdigest()
+    manifest = 'SHA256(router-disk1.vmdk)= {}\n'.format(checksum).encode()
+    with tarfile.open(path, 'w') as the_tar:
+        for name, data in (('router.ovf', b'<Envelope/>'), ('router.mf', manifest), ('router-disk1.vmdk', disk)):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            the_tar.addfile(info, io.BytesIO(data))
+
+
+def _copies(cache_dir):
+    """The copies in the cache, without their locks and markers"""
+    return sorted(x for x in os.listdir(cache_dir) if not x.endswith(('.lock', image_cache.MARKER_SUFFIX)))
+
+
+class TestImageCache(unittest.TestCase):
+    """A set of test cases for the ImageCache object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.images_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.images_dir, 'cache')
+        self.ova_path = os.path.join(self.images_dir, 'router-vyos-1.1.8.ova')
+        _make_ova(self.ova_path)
+        self.ova_meta = ova_index.parse_ova(self.ova_path)
+        self.cache = image_cache.ImageCache(self.images_dir, self.cache_dir, budget=1024 * 1024)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.images_dir)
+
+    def test_disks(self):
+        """``ImageCache.disks`` returns a local copy of each disk"""
+        path, offset, size = self.cache.disks('router-vyos-1.1.8.ova', self.ova_meta)['router-disk1.vmdk']
+        with open(path, 'rb') as the_file:
+            output = the_file.read()
+
+        self.assertTrue(path.startswith(self.cache_dir))
+        self.assertEqual((offset, size), (0, len(DISK)))
+        self.assertEqual(output, DISK)
+
+    def test_disks_content_addressed(self):
+        """``ImageCache.disks`` names a copy after the checksum in the manifest"""
+        path, _, _ = self.cache.disks('router-vyos-1.1.8.ova', self.ova_meta)['router-disk1.vmdk']
+        expected = 'sha256-{}'.format(hashlib.sha256(DISK).hexdigest())
+
+        self.assertEqual(os.path.basename(path), expected)
+
+    def test_disks_disabled(self):
+        """``ImageCache.disks`` reads the disks from the OVA when the budget is 0"""
+        self.cache.budget = 0
+        output = self.cache.disks('router-vyos-1.1.8.ova', self.ova_meta)['router-disk1.vmdk']
+        expected = (self.ova_path, self.ova_meta['offsets']['router-disk1.vmdk'], len(DISK))
+
+        self.assertEqual(output, expected)
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_disks_cached(self):
+        """``ImageCache.disks`` doesn't copy a disk that's already in the cache"""
+        self.cache.disks('router-vyos-1.1.8.ova', self.ova_meta)
+        with patch.object(self.cache, '_copy') as fake_copy:
+            self.cache.disks('router-vyos-1.1.8.ova', self.ova_meta)
+
+        self.assertFalse(fake_copy.called)
+
+    def test_disks_marker(self):
+        """``ImageCache.disks`` records what a copy was verified with next to it"""
+        path, _, _ = self.cache.disks('router-vyos-1.1.8.ova', self.ova_meta)['router-disk1.vmdk']
+
+        self.assertTrue(os.path.exists(path + image_cache.MARKER_SUFFIX))
+
+    def test_disks_changed(self):
+        """``ImageCache.disks`` copies a disk again when the copy changed after it was verified"""
+        path, _, _ = self.cache.disks('router-vyos-1.1.8.ova', self.ova_meta)['router-disk1.vmdk']
+        with open(path, 'r+b') as the_file:
+            the_file.write(b'\x00')
+        os.utime(path, ns=(0, 0))
+        self.cache.disks('router-vyos-1.1.8.ova', self.ova_meta)
+        with open(path, 'rb') as the_file:
+            output = the_file.read()
+
+        self.assertEqual(output, DISK)
+
+    def test_disks_no_marker(self):
+        """``ImageCache.disks`` doesn't trust a copy without a marker, even if it's the right size"""
+        os.makedirs(self.cache_dir)
+        path = os.path.join(self.cache_dir, image_cache.cache_key(self.ova_meta, 'router-disk1.vmdk'))
+        with open(path, 'wb') as the_file:
+            the_file.write(b'\x00' * len(DISK))
+        self.cache.disks('router-vyos-1.1.8.ova', self.ova_meta)
+        with open(path, 'rb') as the_file:
+            output = the_file.read()
+
+        self.assertEqual(output, DISK)
+
+    def test_disks_other_checksum(self):
+        """``ImageCache.disks`` doesn't trust a copy verified against another checksum"""
+        path, _, _ = self.cache.disks('router-vyos-1.1.8.ova', self.ova_meta)['router-disk1.vmdk']
+        with open(path + image_cache.MARKER_SUFFIX, 'r') as the_file:
+            marker = the_file.read()
+        with open(path + image_cache.MARKER_SUFFIX, 'w') as the_file:
+            the_file.write(marker.replace(hashlib.sha256(DISK).hexdigest(), '0' * 64))
+        with patch.object(self.cache, '_copy') as fake_copy:
+            self.cache.disks('router-vyos-1.1.8.ova', self.ova_meta)
+
+        self.assertTrue(fake_copy.called)
+
+    def test_disks_bad_checksum(self):
+        """``ImageCache.disks`` raises RuntimeError when a disk doesn't match the manifest"""
+        _make_ova(self.ova_path, checksum='0' * 64)
+        ova_meta = ova_index.parse_ova(self.ova_path)
+        with self.assertRaises(RuntimeError):
+            self.cache.disks('router-vyos-1.1.8.ova', ova_meta)
+
+        self.assertEqual(_copies(self.cache_dir), [])
+
+    def test_disks_os_error(self):
+        """``ImageCache.disks`` falls back to the OVA when a disk can't be cached"""
+        with patch.object(self.cache, 'fetch', side_effect=OSError('testing')):
+            output = self.cache.disks('router-vyos-1.1.8.ova', self.ova_meta)['router-disk1.vmdk']
+
+        self.assertEqual(output[0], self.ova_path)
+
+    def test_evict(self):
+        """``ImageCache.evict`` deletes the least recently used copies that don't fit the budget"""
+        os.makedirs(self.cache_dir)
+        long_ago = time.time() - image_cache.IN_USE_SECONDS - 60
+        for name, age in (('sha256-old', 10), ('sha256-new', 0)):
+            path = os.path.join(self.cache_dir, name)
+            with open(path, 'wb') as the_file:
+                the_file.write(b'\x00' * 1000)
+            os.utime(path, (long_ago - age, long_ago - age))
+        self.cache.budget = 1500
+        self.cache.evict()
+        output = _copies(self.cache_dir)
+
+        self.assertEqual(output, ['sha256-new'])
+
+    def test_evict_marker(self):
+        """``ImageCache.evict`` deletes the marker of a copy with it"""
+        self.cache.disks('router-vyos-1.1.8.ova', self.ova_meta)
+        long_ago = time.time() - image_cache.IN_USE_SECONDS - 60
+        for name in os.listdir(self.cache_dir):
+            os.utime(os.path.join(self.cache_dir, name), (long_ago, long_ago))
+        self.cache.budget = 1
+        self.cache.evict()
+        output = [x for x in os.listdir(self.cache_dir) if not x.endswith('.lock')]
+
+        self.assertEqual(output, [])
+
+    def test_evict_in_use(self):
+        """``ImageCache.evict`` keeps copies used recently, even over the budget"""
+        self.cache.disks('router-vyos-1.1.8.ova', self.ova_meta)
+        self.cache.budget = 1
+        self.cache.evict()
+        output = _copies(self.cache_dir)
+
+        self.assertEqual(len(output), 1)
+
+    @patch.object(image_cache, 'ova_index')
+    def test_warm(self, fake_ova_index):
+        """``ImageCache.warm`` copies the disks of every OVA that fits the budget"""
+        fake_ova_index.lookup.return_value = self.ova_meta
+        self.cache.warm()
+        output = _copies(self.cache_dir)
+
+        self.assertEqual(len(output), 1)
+
+    @patch.object(image_cache, 'ova_index')
+    def test_warm_over_budget(self, fake_ova_index):
+        """``ImageCache.warm`` stops once the budget is used up"""
+        fake_ova_index.lookup.return_value = self.ova_meta
+        self.cache.budget = 10
+        self.cache.warm()
+
+        self.assertFalse(os.path.exists(self.cache_dir))
+
+    def test_cache_key_no_manifest(self):
+        """``cache_key`` works for an OVA without a manifest"""
+        ova_meta = {'manifest': {}, 'sha256': 'abc'}
+        output = image_cache.cache_key(ova_meta, 'router-disk1.vmdk')
+
+        self.assertTrue(output.startswith('ova-'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in image_index.py
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from vlab_router_api.lib import image_index
+
+
+class TestImageIndex(unittest.TestCase):
+    """A set of test cases for the ImageIndex object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.images_dir = tempfile.mkdtemp()
+        open(os.path.join(self.images_dir, 'router-vyos-1.1.8.ova'), 'w').close()
+        self.index = image_index.ImageIndex(self.images_dir)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.images_dir)
+
+    def test_images(self):
+        """``ImageIndex.images`` returns the versions of Router that can be deployed"""
+        output = self.index.images()
+        expected = ['1.1.8']
+
+        self.assertEqual(output, expected)
+
+    def test_images_cached(self):
+        """``ImageIndex.images`` does not re-read the directory when it has not changed"""
+        self.index.images()
+        with patch.object(image_index.os, 'listdir') as fake_listdir:
+            self.index.images()
+
+        self.assertFalse(fake_listdir.called)
+
+    def test_images_refresh(self):
+        """``ImageIndex.images`` re-reads the directory when its mtime changes"""
+        self.index.images()
+        open(os.path.join(self.images_dir, 'router-vyos-1.2.0.ova'), 'w').close()
+        os.utime(self.images_dir, ns=(0, 1))
+
+        output = sorted(self.index.images())
+        expected = ['1.1.8', '1.2.0']
+
+        self.assertEqual(output, expected)
+
+
+class TestConvertName(unittest.TestCase):
+    """A set of test cases for the ``convert_name`` function"""
+
+    def test_convert_name(self):
+        """``convert_name`` returns an image name from a supplied version by default"""
+        output = image_index.convert_name(name='1.1.8')
+        expected = 'router-vyos-1.1.8.ova'
+
+        self.assertEqual(output, expected)
+
+    def test_convert_name_to_version(self):
+        """``convert_name`` returns the version when supplied with a image name"""
+        output = image_index.convert_name(name='router-vyos-1.1.8.ova', to_version=True)
+        expected = '1.1.8'
+
+        self.assertEqual(output, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,166 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in inventory.py
+"""
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from threading import Thread
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from vlab_router_api.lib.worker import inventory
+
+
+class TestInventoryCache(unittest.TestCase):
+    """A set of test cases for the InventoryCache object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.cache_dir = tempfile.mkdtemp()
+        self.cache = inventory.InventoryCache(directory=self.cache_dir, ttl=30)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.cache_dir)
+
+    def test_get_miss(self):
+        """``InventoryCache.get`` returns None when the user has no entry"""
+        output = self.cache.get('alice')
+
+        self.assertTrue(output is None)
+
+    def test_set(self):
+        """``InventoryCache.set`` stores an entry that ``get`` returns"""
+        self.cache.set('alice', {'myRouter': {'state': 'poweredOn'}}, time.time())
+
+        output = self.cache.get('alice')
+        expected = {'myRouter': {'state': 'poweredOn'}}
+
+        self.assertEqual(output, expected)
+
+    def test_set_no_console(self):
+        """``InventoryCache.set`` does not store console URLs; their tickets only work once"""
+        self.cache.set('alice', {'myRouter': {'state': 'poweredOn', 'console': 'https://some-console'}}, time.time())
+
+        output = self.cache.get('alice')
+        expected = {'myRouter': {'state': 'poweredOn'}}
+
+        self.assertEqual(output, expected)
+
+    def test_set_threads(self):
+        """``InventoryCache.set`` can store the inventory of one user from many threads at once"""
+        errors = []
+        def store():
+            try:
+                self.cache.set('alice', {'myRouter': {'state': 'poweredOn'}}, time.time())
+            except Exception as doh:
+                errors.append(doh)
+        threads = [Thread(target=store) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(os.listdir(self.cache_dir), ['alice.json'])
+
+    def test_ttl(self):
+        """``InventoryCache.get`` ignores entries older than the TTL"""
+        self.cache.set('alice', {'myRouter': {}}, time.time() - 31)
+
+        output = self.cache.get('alice')
+
+        self.assertTrue(output is None)
+
+    def test_disabled(self):
+        """``InventoryCache`` stores nothing when the TTL is zero"""
+        self.cache.ttl = 0
+        self.cache.set('alice', {'myRouter': {}}, time.time())
+
+        output = self.cache.get('alice')
+
+        self.assertTrue(output is None)
+
+    def test_invalidate(self):
+        """``InventoryCache.invalidate`` throws away the entry of a user"""
+        self.cache.set('alice', {'myRouter': {}}, time.time())
+        self.cache.invalidate('alice')
+
+        output = self.cache.get('alice')
+
+        self.assertTrue(output is None)
+
+    def test_set_after_invalidate(self):
+        """``InventoryCache.set`` does not store an inventory read before the last invalidation"""
+        fetched_at = time.time() - 1
+        self.cache.invalidate('alice')
+        self.cache.set('alice', {'myRouter': {}}, fetched_at)
+
+        output = self.cache.get('alice')
+
+        self.assertTrue(output is None)
+
+    def test_username_path(self):
+        """``InventoryCache`` does not let a username escape the cache directory"""
+        output = self.cache._path('../../etc/passwd')
+
+        self.assertTrue(output.startswith(self.cache_dir))
+        self.assertFalse('/../' in output)
+
+
+class TestInventoryWatcher(unittest.TestCase):
+    """A set of test cases for the InventoryWatcher object"""
+
+    @staticmethod
+    def _update(*obj_updates):
+        """Make the kind of object returned by ``WaitForUpdatesEx``"""
+        return SimpleNamespace(filterSet=[SimpleNamespace(objectSet=list(obj_updates))])
+
+    @staticmethod
+    def _obj_update(obj, kind='modify', **changes):
+        change_set = [SimpleNamespace(name=x, val=y) for x, y in changes.items()]
+        return SimpleNamespace(obj=obj, kind=kind, changeSet=change_set)
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.fake_cache = MagicMock()
+        self.watcher = inventory.InventoryWatcher(self.fake_cache)
+        folder = inventory.vim.Folder('group-1')
+        initial = self._update(self._obj_update(folder, kind='enter', name='alice'),
+                               self._obj_update(inventory.vim.VirtualMachine('vm-1'), kind='enter',
+                                                name='myRouter', parent=folder))
+        self.watcher.handle_update(initial, initial=True)
+
+    def test_initial(self):
+        """``InventoryWatcher.handle_update`` does not invalidate anything for the initial update"""
+        self.assertFalse(self.fake_cache.invalidate.called)
+
+    def test_modify(self):
+        """``InventoryWatcher.handle_update`` invalidates the owner of a changed VM"""
+        update = self._update(self._obj_update(inventory.vim.VirtualMachine('vm-1'),
+                                               **{'runtime.powerState': 'poweredOff'}))
+        self.watcher.handle_update(update)
+
+        self.fake_cache.invalidate.assert_called_with('alice')
+
+    def test_leave(self):
+        """``InventoryWatcher.handle_update`` invalidates the owner of a deleted VM"""
+        update = self._update(self._obj_update(inventory.vim.VirtualMachine('vm-1'), kind='leave'))
+        self.watcher.handle_update(update)
+
+        self.fake_cache.invalidate.assert_called_with('alice')
+
+    def test_enter(self):
+        """``InventoryWatcher.handle_update`` invalidates the owner of a new VM"""
+        update = self._update(self._obj_update(inventory.vim.VirtualMachine('vm-2'), kind='enter',
+                                               name='newRouter', parent=inventory.vim.Folder('group-1')))
+        self.watcher.handle_update(update)
+
+        self.fake_cache.invalidate.assert_called_with('alice')
+
+
+if __name__ == '__main__':
+    unittest.main()
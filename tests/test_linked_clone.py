@@ -0,0 +1,221 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in linked_clone.py
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_router_api.lib.worker import linked_clone
+
+OVA_META = {'networks': ['frontend', 'backend'], 'sha256': 'deadbeefcafe'}
+
+
+def _fake_port_group(key):
+    """Make a distributed port group that can be assigned to a NIC backing"""
+    port_group = MagicMock(spec=linked_clone.vim.dvs.DistributedVirtualPortgroup)
+    port_group.key = key
+    port_group.config.distributedVirtualSwitch.uuid = 'some-switch-uuid'
+    return port_group
+
+
+class TestLinkedClone(unittest.TestCase):
+    """A set of test cases for linked_clone.py"""
+
+    def test_template_name(self):
+        """``template_name`` includes the version and checksum of the OVA"""
+        output = linked_clone.template_name('router-vyos-1.1.8.ova', OVA_META)
+        expected = 'router-vyos-1.1.8-deadbeef'
+
+        self.assertEqual(output, expected)
+
+    @patch.object(linked_clone.virtual_machine, 'deploy_from_ova')
+    @patch.object(linked_clone, 'Ova')
+    def test_get_template_exists(self, fake_Ova, fake_deploy_from_ova):
+        """``get_template`` does not import the OVA when the template already exists"""
+        fake_template = MagicMock()
+        fake_template.name = 'router-vyos-1.1.8-deadbeef'
+        fake_vcenter = MagicMock()
+        fake_vcenter.get_by_name.return_value.childEntity = [fake_template]
+
+        output = linked_clone.get_template(fake_vcenter, 'router-vyos-1.1.8.ova', OVA_META, [], MagicMock())
+
+        self.assertTrue(output is fake_template)
+        self.assertFalse(fake_deploy_from_ova.called)
+
+    @patch.object(linked_clone, 'consume_task')
+    @patch.object(linked_clone.virtual_machine, 'deploy_from_ova')
+    @patch.object(linked_clone, 'Ova')
+    def test_get_template_import(self, fake_Ova, fake_deploy_from_ova, fake_consume_task):
+        """``get_template`` imports and snapshots the OVA when there is no template yet"""
+        fake_vcenter = MagicMock()
+        fake_vcenter.get_by_name.return_value.childEntity = []
+
+        output = linked_clone.get_template(fake_vcenter, 'router-vyos-1.1.8.ova', OVA_META, [], MagicMock())
+
+        self.assertTrue(output is fake_deploy_from_ova.return_value)
+        self.assertTrue(output.CreateSnapshot_Task.called)
+
+    @patch.object(linked_clone, '_wait_for_template')
+    @patch.object(linked_clone.virtual_machine, 'deploy_from_ova')
+    @patch.object(linked_clone, 'Ova')
+    def test_get_template_racing(self, fake_Ova, fake_deploy_from_ova, fake_wait_for_template):
+        """``get_template`` waits on another worker's import if its own import fails"""
+        fake_vcenter = MagicMock()
+        fake_vcenter.get_by_name.return_value.childEntity = []
+        fake_deploy_from_ova.side_effect = linked_clone.vim.fault.DuplicateName()
+
+        output = linked_clone.get_template(fake_vcenter, 'router-vyos-1.1.8.ova', OVA_META, [], MagicMock())
+
+        self.assertTrue(output is fake_wait_for_template.return_value)
+
+    @patch.object(linked_clone, '_wait_for_template')
+    @patch.object(linked_clone.virtual_machine, 'deploy_from_ova')
+    @patch.object(linked_clone, 'Ova')
+    def test_get_template_import_error(self, fake_Ova, fake_deploy_from_ova, fake_wait_for_template):
+        """``get_template`` raises the error of a failed import, instead of waiting on it"""
+        fake_vcenter = MagicMock()
+        fake_vcenter.get_by_name.return_value.childEntity = []
+        fake_deploy_from_ova.side_effect = RuntimeError('testing')
+
+        with self.assertRaises(RuntimeError):
+            linked_clone.get_template(fake_vcenter, 'router-vyos-1.1.8.ova', OVA_META, [], MagicMock())
+
+        self.assertFalse(fake_wait_for_template.called)
+
+    @patch.object(linked_clone, 'consume_task')
+    @patch.object(linked_clone.virtual_machine, 'deploy_from_ova')
+    @patch.object(linked_clone, 'Ova')
+    def test_get_template_no_snapshot(self, fake_Ova, fake_deploy_from_ova, fake_consume_task):
+        """``get_template`` snapshots a template that was imported, but never snapshotted"""
+        fake_template = MagicMock()
+        fake_template.name = 'router-vyos-1.1.8-deadbeef'
+        fake_template.snapshot = None
+        fake_vcenter = MagicMock()
+        fake_vcenter.get_by_name.return_value.childEntity = [fake_template]
+
+        output = linked_clone.get_template(fake_vcenter, 'router-vyos-1.1.8.ova', OVA_META, [], MagicMock())
+
+        self.assertTrue(output is fake_template)
+        self.assertTrue(fake_template.CreateSnapshot_Task.called)
+        self.assertFalse(fake_deploy_from_ova.called)
+
+    @patch.object(linked_clone, '_wait_for_template')
+    @patch.object(linked_clone, 'consume_task')
+    @patch.object(linked_clone, 'Ova')
+    def test_get_template_snapshot_busy(self, fake_Ova, fake_consume_task, fake_wait_for_template):
+        """``get_template`` waits on another worker when it cannot snapshot the template"""
+        fake_template = MagicMock()
+        fake_template.name = 'router-vyos-1.1.8-deadbeef'
+        fake_template.snapshot = None
+        fake_vcenter = MagicMock()
+        fake_vcenter.get_by_name.return_value.childEntity = [fake_template]
+        fake_template.CreateSnapshot_Task.return_value.info.error = linked_clone.vim.fault.TaskInProgress()
+        fake_consume_task.side_effect = RuntimeError('Another task is already in progress.')
+
+        output = linked_clone.get_template(fake_vcenter, 'router-vyos-1.1.8.ova', OVA_META, [], MagicMock())
+
+        self.assertTrue(output is fake_wait_for_template.return_value)
+
+    @patch.object(linked_clone, '_wait_for_template')
+    @patch.object(linked_clone, 'Ova')
+    def test_get_template_snapshot_invalid_state(self, fake_Ova, fake_wait_for_template):
+        """``get_template`` waits on another worker when the template can't be snapshotted in its state"""
+        fake_template = MagicMock()
+        fake_template.name = 'router-vyos-1.1.8-deadbeef'
+        fake_template.snapshot = None
+        fake_template.CreateSnapshot_Task.side_effect = linked_clone.vim.fault.InvalidState()
+        fake_vcenter = MagicMock()
+        fake_vcenter.get_by_name.return_value.childEntity = [fake_template]
+
+        output = linked_clone.get_template(fake_vcenter, 'router-vyos-1.1.8.ova', OVA_META, [], MagicMock())
+
+        self.assertTrue(output is fake_wait_for_template.return_value)
+
+    @patch.object(linked_clone, '_wait_for_template')
+    @patch.object(linked_clone, 'consume_task')
+    @patch.object(linked_clone, 'Ova')
+    def test_get_template_snapshot_fails(self, fake_Ova, fake_consume_task, fake_wait_for_template):
+        """``get_template`` raises the error of a failed snapshot, instead of waiting on it"""
+        fake_template = MagicMock()
+        fake_template.name = 'router-vyos-1.1.8-deadbeef'
+        fake_template.snapshot = None
+        fake_template.CreateSnapshot_Task.return_value.info.error = linked_clone.vim.fault.NoDiskSpace()
+        fake_vcenter = MagicMock()
+        fake_vcenter.get_by_name.return_value.childEntity = [fake_template]
+        fake_consume_task.side_effect = RuntimeError('Insufficient disk space on datastore')
+
+        with self.assertRaises(RuntimeError):
+            linked_clone.get_template(fake_vcenter, 'router-vyos-1.1.8.ova', OVA_META, [], MagicMock())
+
+        self.assertFalse(fake_wait_for_template.called)
+
+    @patch.object(linked_clone, 'nic_specs')
+    @patch.object(linked_clone.virtual_machine, 'power')
+    @patch.object(linked_clone, 'consume_task')
+    def test_clone_router(self, fake_consume_task, fake_power, fake_nic_specs):
+        """``clone_router`` makes a linked clone and powers it on"""
+        fake_nic_specs.return_value = []
+        fake_template = MagicMock()
+        fake_template.snapshot.currentSnapshot = linked_clone.vim.vm.Snapshot('snapshot-1')
+        fake_vcenter = MagicMock()
+        fake_vcenter.resource_pools = {linked_clone.const.INF_VCENTER_RESORUCE_POOL: linked_clone.vim.ResourcePool('resgroup-1')}
+
+        output = linked_clone.clone_router(fake_vcenter, fake_template, linked_clone.vim.Folder('group-1'),
+                                           'myRouter', [], MagicMock())
+        spec = fake_template.CloneVM_Task.call_args[1]['spec']
+
+        self.assertTrue(output is fake_consume_task.return_value)
+        self.assertEqual(spec.location.diskMoveType, 'createNewChildDiskBacking')
+        self.assertTrue(fake_power.called)
+
+    @patch.object(linked_clone, 'nic_specs')
+    @patch.object(linked_clone.virtual_machine, 'power')
+    @patch.object(linked_clone, 'consume_task')
+    def test_clone_router_placement(self, fake_consume_task, fake_power, fake_nic_specs):
+        """``clone_router`` puts the clone on the datastore and pool it's given"""
+        fake_nic_specs.return_value = []
+        fake_template = MagicMock()
+        fake_template.snapshot.currentSnapshot = linked_clone.vim.vm.Snapshot('snapshot-1')
+        where = MagicMock(datastore=linked_clone.vim.Datastore('datastore-2'),
+                          pool=linked_clone.vim.ResourcePool('resgroup-2'))
+
+        linked_clone.clone_router(MagicMock(), fake_template, linked_clone.vim.Folder('group-1'),
+                                  'myRouter', [], MagicMock(), where=where)
+        spec = fake_template.CloneVM_Task.call_args[1]['spec']
+
+        self.assertEqual(spec.location.datastore._moId, 'datastore-2')
+        self.assertEqual(spec.location.pool._moId, 'resgroup-2')
+
+    def test_clone_router_bad_name(self):
+        """``clone_router`` raises ValueError for an invalid machine name"""
+        with self.assertRaises(ValueError):
+            linked_clone.clone_router(MagicMock(), MagicMock(), MagicMock(), 'my_router!', [], MagicMock())
+
+    def test_nic_specs(self):
+        """``nic_specs`` connects each NIC to the requested network, in order"""
+        fake_vm = MagicMock()
+        fake_vm.config.hardware.device = [linked_clone.vim.vm.device.VirtualVmxnet3(key=4001),
+                                          linked_clone.vim.vm.device.VirtualVmxnet3(key=4000)]
+        network_map = [MagicMock(network=_fake_port_group('dvportgroup-1')),
+                       MagicMock(network=_fake_port_group('dvportgroup-2'))]
+
+        output = [x.device.backing.port.portgroupKey for x in linked_clone.nic_specs(fake_vm, network_map)]
+        expected = ['dvportgroup-1', 'dvportgroup-2']
+
+        self.assertEqual(output, expected)
+
+    def test_nic_specs_disconnected(self):
+        """``nic_specs`` disconnects NICs that have no requested network"""
+        fake_vm = MagicMock()
+        fake_vm.config.hardware.device = [linked_clone.vim.vm.device.VirtualVmxnet3(key=4000),
+                                          linked_clone.vim.vm.device.VirtualVmxnet3(key=4001)]
+        network_map = [MagicMock(network=_fake_port_group('dvportgroup-1'))]
+
+        output = [x.device.connectable.startConnected for x in linked_clone.nic_specs(fake_vm, network_map)]
+        expected = [True, False]
+
+        self.assertEqual(output, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in meta_index.py
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_router_api.lib.worker import meta_index
+
+ROUTER = '{"component": "Router", "created": 1234, "version": "1.1.8", "configured": false, "generation": 1}'
+WINDOWS = '{"component": "Windows", "created": 1234, "version": "10", "configured": false, "generation": 1}'
+
+
+class TestMetaIndex(unittest.TestCase):
+    """A set of test cases for the MetaIndex object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.index = meta_index.MetaIndex(max_users=2)
+        self.fake_vcenter = MagicMock()
+        self.folder = meta_index.vim.Folder('group-1')
+        self.fake_vcenter.get_by_name.return_value = self.folder
+        self.vms = {meta_index.vim.VirtualMachine('vm-1'): {'name': 'myRouter', 'config.annotation': ROUTER, 'parent': self.folder},
+                    meta_index.vim.VirtualMachine('vm-2'): {'name': 'myRouter', 'config.annotation': WINDOWS, 'parent': self.folder},
+                   }
+
+    def test_rebuild(self):
+        """``MetaIndex.rebuild`` indexes each VM by its component and name"""
+        self.index.rebuild('alice', self.folder, self.vms)
+
+        self.assertEqual(self.index.get('alice', 'Router', 'myRouter'), ('vm-1', 'group-1'))
+        self.assertEqual(self.index.get('alice', 'Windows', 'myRouter'), ('vm-2', 'group-1'))
+
+    def test_add(self):
+        """``MetaIndex.add`` indexes a VM of a user that was never indexed"""
+        self.index.add('alice', 'Router', 'myRouter', meta_index.vim.VirtualMachine('vm-1'), self.folder)
+
+        self.assertEqual(self.index.get('alice', 'Router', 'myRouter'), ('vm-1', 'group-1'))
+
+    def test_remove(self):
+        """``MetaIndex.remove`` forgets a VM"""
+        self.index.rebuild('alice', self.folder, self.vms)
+
+        self.index.remove('alice', 'Router', 'myRouter')
+
+        self.assertIsNone(self.index.get('alice', 'Router', 'myRouter'))
+        self.assertIsNotNone(self.index.get('alice', 'Windows', 'myRouter'))
+
+    def test_max_users(self):
+        """``MetaIndex`` forgets the least recently used user past the limit"""
+        self.index.rebuild('alice', self.folder, self.vms)
+        self.index.rebuild('bob', self.folder, self.vms)
+        self.index.get('alice', 'Router', 'myRouter')
+        self.index.rebuild('carol', self.folder, self.vms)
+
+        self.assertIsNone(self.index.get('bob', 'Router', 'myRouter'))
+        self.assertIsNotNone(self.index.get('alice', 'Router', 'myRouter'))
+
+    @patch.object(meta_index, 'retrieve_vm')
+    @patch.object(meta_index, 'retrieve_folder')
+    def test_find_hit(self, fake_retrieve_folder, fake_retrieve_vm):
+        """``MetaIndex.find`` reads only the indexed VM, not the whole folder"""
+        self.index.rebuild('alice', self.folder, self.vms)
+        fake_retrieve_vm.return_value = ({'name': 'myRouter', 'config.annotation': ROUTER, 'parent': self.folder}, {})
+
+        the_vm, meta = self.index.find(self.fake_vcenter, 'alice', 'Router', 'myRouter')
+
+        self.assertEqual(the_vm._moId, 'vm-1')
+        self.assertEqual(meta['component'], 'Router')
+        self.assertFalse(fake_retrieve_folder.called)
+
+    @patch.object(meta_index, 'retrieve_vm')
+    @patch.object(meta_index, 'retrieve_folder')
+    def test_find_miss(self, fake_retrieve_folder, fake_retrieve_vm):
+        """``MetaIndex.find`` rebuilds the index of the user after a miss"""
+        fake_retrieve_folder.return_value = (self.vms, {})
+
+        the_vm, meta = self.index.find(self.fake_vcenter, 'alice', 'Router', 'myRouter')
+
+        self.assertEqual(the_vm._moId, 'vm-1')
+        self.assertFalse(fake_retrieve_vm.called)
+        self.assertEqual(self.index.get('alice', 'Windows', 'myRouter'), ('vm-2', 'group-1'))
+
+    @patch.object(meta_index, 'retrieve_vm')
+    @patch.object(meta_index, 'retrieve_folder')
+    def test_find_not_found(self, fake_retrieve_folder, fake_retrieve_vm):
+        """``MetaIndex.find`` returns (None, None) when the user has no such VM"""
+        fake_retrieve_folder.return_value = (self.vms, {})
+
+        output = self.index.find(self.fake_vcenter, 'alice', 'Router', 'noSuchRouter')
+
+        self.assertEqual(output, (None, None))
+
+    @patch.object(meta_index, 'retrieve_vm')
+    @patch.object(meta_index, 'retrieve_folder')
+    def test_find_destroyed(self, fake_retrieve_folder, fake_retrieve_vm):
+        """``MetaIndex.find`` rebuilds the index when another worker destroyed the VM"""
+        self.index.rebuild('alice', self.folder, self.vms)
+        fake_retrieve_vm.side_effect = meta_index.vmodl.fault.ManagedObjectNotFound()
+        fake_retrieve_folder.return_value = ({}, {})
+
+        output = self.index.find(self.fake_vcenter, 'alice', 'Router', 'myRouter')
+
+        self.assertEqual(output, (None, None))
+        self.assertIsNone(self.index.get('alice', 'Windows', 'myRouter'))
+
+    @patch.object(meta_index, 'retrieve_vm')
+    @patch.object(meta_index, 'retrieve_folder')
+    def test_find_renamed(self, fake_retrieve_folder, fake_retrieve_vm):
+        """``MetaIndex.find`` does not trust an entry whose VM now has another name"""
+        self.index.rebuild('alice', self.folder, self.vms)
+        fake_retrieve_vm.return_value = ({'name': 'otherRouter', 'config.annotation': ROUTER, 'parent': self.folder}, {})
+        fake_retrieve_folder.return_value = ({}, {})
+
+        output = self.index.find(self.fake_vcenter, 'alice', 'Router', 'myRouter')
+
+        self.assertEqual(output, (None, None))
+        self.assertTrue(fake_retrieve_folder.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
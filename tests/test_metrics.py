@@ -0,0 +1,178 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in metrics.py
+"""
+import os
+import shutil
+import tempfile
+import unittest
+from threading import Thread
+from unittest.mock import patch, MagicMock
+
+import ujson
+
+from vlab_router_api.lib import metrics
+
+
+class TestHistograms(unittest.TestCase):
+    """A set of test cases for the Histograms object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.metrics_dir = tempfile.mkdtemp()
+        self.histograms = metrics.Histograms(directory=self.metrics_dir, buckets=(1, 10))
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.metrics_dir)
+
+    def test_observe(self):
+        """``Histograms.observe`` counts a value in every bucket it fits in"""
+        self.histograms.observe('some_metric', {'task': 'router.show'}, 5)
+        self.histograms.flush()
+
+        output = self.histograms.collect()
+        expected = {('some_metric', (('task', 'router.show'),)): {'buckets': [0, 1], 'sum': 5.0, 'count': 1}}
+
+        self.assertEqual(output, expected)
+
+    def test_collect(self):
+        """``Histograms.collect`` sums the snapshots of every process"""
+        other_process = [['some_metric', {'task': 'router.show'}, {'buckets': [0, 1], 'sum': 5.0, 'count': 1}]]
+        with open(os.path.join(self.metrics_dir, '1.json'), 'w') as the_file:
+            ujson.dump(other_process, the_file)
+        self.histograms.observe('some_metric', {'task': 'router.show'}, 0.5)
+        self.histograms.flush()
+
+        output = self.histograms.collect()
+        expected = {('some_metric', (('task', 'router.show'),)): {'buckets': [1, 2], 'sum': 5.5, 'count': 2}}
+
+        self.assertEqual(output, expected)
+
+    def test_flush_other_host(self):
+        """``Histograms.flush`` does not overwrite the snapshot of a process with the same PID on another host"""
+        with patch.object(metrics.socket, 'gethostname', return_value='other-container'):
+            other = metrics.Histograms(directory=self.metrics_dir, buckets=(1, 10))
+        other.observe('some_metric', {'task': 'router.show'}, 5)
+        other.flush()
+        self.histograms.observe('some_metric', {'task': 'router.show'}, 0.5)
+        self.histograms.flush()
+
+        output = self.histograms.collect()
+        expected = {('some_metric', (('task', 'router.show'),)): {'buckets': [1, 2], 'sum': 5.5, 'count': 2}}
+
+        self.assertEqual(output, expected)
+
+    def test_flush_threads(self):
+        """``Histograms.flush`` can run in many threads at once"""
+        self.histograms.observe('some_metric', {'task': 'router.show'}, 5)
+        threads = [Thread(target=self.histograms.flush) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        output = os.listdir(self.metrics_dir)
+        expected = ['{}-{}.json'.format(metrics.socket.gethostname(), os.getpid())]
+
+        self.assertEqual(output, expected)
+
+    def test_forked(self):
+        """``Histograms`` does not count the numbers of the parent process in a forked child"""
+        self.histograms.observe('some_metric', {'task': 'router.show'}, 5)
+        self.histograms._pid = -1
+        self.histograms.observe('some_metric', {'task': 'router.show'}, 0.5)
+
+        output = list(self.histograms._series.values())
+        expected = [{'buckets': [1, 1], 'sum': 0.5, 'count': 1}]
+
+        self.assertEqual(output, expected)
+
+    def test_prune(self):
+        """``Histograms.prune`` deletes the snapshots of processes on this host that are gone"""
+        hostname = metrics.socket.gethostname()
+        for name in ('{}-{}.json'.format(hostname, os.getpid()), '{}-99999999.json'.format(hostname),
+                     'other-host-99999999.json'):
+            with open(os.path.join(self.metrics_dir, name), 'w') as the_file:
+                ujson.dump([], the_file)
+
+        self.histograms.prune()
+        output = sorted(os.listdir(self.metrics_dir))
+        expected = sorted(['{}-{}.json'.format(hostname, os.getpid()), 'other-host-99999999.json'])
+
+        self.assertEqual(output, expected)
+
+    @patch.object(metrics.os, 'kill')
+    def test_is_running_other_user(self, fake_kill):
+        """``_is_running`` counts a process of another user as running"""
+        fake_kill.side_effect = PermissionError('testing')
+
+        self.assertTrue(metrics._is_running(1))
+
+    def test_collect_bad_file(self):
+        """``Histograms.collect`` ignores snapshots it cannot read"""
+        with open(os.path.join(self.metrics_dir, '1234.json'), 'w') as the_file:
+            the_file.write('not json')
+
+        output = self.histograms.collect()
+
+        self.assertEqual(output, {})
+
+
+class TestMetrics(unittest.TestCase):
+    """A set of test cases for the module level functions in metrics.py"""
+
+    def test_render(self):
+        """``render`` outputs cumulative buckets, sum and count of every histogram"""
+        series = {(metrics.TASK_METRIC, (('task', 'router.show'),)): {'buckets': [1] * len(metrics.BUCKETS), 'sum': 0.005, 'count': 1}}
+
+        output = metrics.render(series, {'celery': 3})
+
+        self.assertTrue('vlab_router_task_seconds_bucket{task="router.show",le="0.01"} 1' in output)
+        self.assertTrue('vlab_router_task_seconds_bucket{task="router.show",le="+Inf"} 1' in output)
+        self.assertTrue('vlab_router_task_seconds_count{task="router.show"} 1' in output)
+        self.assertTrue('vlab_router_queue_depth{queue="celery"} 3' in output)
+
+    def test_queue_depth(self):
+        """``queue_depth`` returns how many tasks are waiting in each queue"""
+        fake_celery_app = MagicMock()
+        fake_conn = fake_celery_app.connection_for_read.return_value.__enter__.return_value
+        fake_conn.default_channel.queue_declare.return_value.message_count = 7
+
+        output = metrics.queue_depth(fake_celery_app, ['celery'])
+        expected = {'celery': 7}
+
+        self.assertEqual(output, expected)
+
+    def test_queue_depth_error(self):
+        """``queue_depth`` returns no numbers instead of raising when the broker is unavailable"""
+        fake_celery_app = MagicMock()
+        fake_celery_app.connection_for_read.side_effect = OSError('testing')
+
+        output = metrics.queue_depth(fake_celery_app, ['celery'])
+
+        self.assertEqual(output, {})
+
+    @patch.object(metrics, 'histograms')
+    def test_phase_timer(self, fake_histograms):
+        """``phase_timer`` records the phase even when it raises"""
+        try:
+            with metrics.phase_timer('create_router', 'deploy'):
+                raise RuntimeError('testing')
+        except RuntimeError:
+            pass
+
+        the_args, _ = fake_histograms.observe.call_args
+
+        self.assertEqual(the_args[:2], (metrics.PHASE_METRIC, {'operation': 'create_router', 'phase': 'deploy'}))
+
+    @patch.object(metrics, 'histograms')
+    def test_observe_task(self, fake_histograms):
+        """``observe_task`` publishes the numbers of the process"""
+        metrics.observe_task('router.show', 0.5)
+
+        self.assertTrue(fake_histograms.flush.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,39 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of unit tests for the MetricsView object
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from flask import Flask
+
+from vlab_router_api.lib.views import metrics
+
+
+class TestMetricsView(unittest.TestCase):
+    """A suite of test cases for the MetricsView object"""
+
+    @classmethod
+    def setUp(cls):
+        """Runs before every test case"""
+        app = Flask(__name__)
+        metrics.MetricsView.register(app)
+        app.config['TESTING'] = True
+        app.celery_app = MagicMock()
+        cls.app = app.test_client()
+
+    @patch.object(metrics.metrics, 'queue_depth')
+    @patch.object(metrics.metrics, 'histograms')
+    def test_get(self, fake_histograms, fake_queue_depth):
+        """MetricsView for /api/1/inf/router/metrics supports GET"""
+        fake_histograms.collect.return_value = {}
+        fake_queue_depth.return_value = {'celery': 2}
+
+        resp = self.app.get('/api/1/inf/router/metrics')
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue(b'vlab_router_queue_depth{queue="celery"} 2' in resp.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in network_index.py
+"""
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+
+from vlab_router_api.lib.worker import network_index
+
+NETWORKS = [(network_index.vim.Network('network-1'), 'alice_frontend'),
+            (network_index.vim.Network('network-2'), 'alice_backend'),
+            (network_index.vim.dvs.DistributedVirtualPortgroup('dvportgroup-3'), 'bob_frontend'),
+           ]
+
+
+class TestNetworkIndex(unittest.TestCase):
+    """A set of test cases for the NetworkIndex object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.index = network_index.NetworkIndex(max_size=10, ttl=300)
+        self.fake_vcenter = MagicMock()
+
+    @patch.object(network_index, '_network_names')
+    def test_lookup(self, fake_network_names):
+        """``NetworkIndex.lookup`` returns the networks by name"""
+        fake_network_names.return_value = NETWORKS
+
+        output = self.index.lookup(self.fake_vcenter, ['alice_frontend'], scope='alice_')
+
+        self.assertEqual(list(output.keys()), ['alice_frontend'])
+        self.assertEqual(output['alice_frontend']._moId, 'network-1')
+
+    @patch.object(network_index, '_network_names')
+    def test_lookup_class(self, fake_network_names):
+        """``NetworkIndex.lookup`` keeps the type of the network, so distributed port groups work"""
+        fake_network_names.return_value = NETWORKS
+
+        output = self.index.lookup(self.fake_vcenter, ['bob_frontend'], scope='bob_')
+
+        self.assertTrue(isinstance(output['bob_frontend'], network_index.vim.dvs.DistributedVirtualPortgroup))
+
+    @patch.object(network_index, '_network_names')
+    def test_lookup_cached(self, fake_network_names):
+        """``NetworkIndex.lookup`` indexes every network of the user on a miss"""
+        fake_network_names.return_value = NETWORKS
+        self.index.lookup(self.fake_vcenter, ['alice_frontend'], scope='alice_')
+
+        self.index.lookup(self.fake_vcenter, ['alice_backend'], scope='alice_')
+
+        self.assertEqual(fake_network_names.call_count, 1)
+
+    @patch.object(network_index, '_network_names')
+    def test_invalidate(self, fake_network_names):
+        """``NetworkIndex.invalidate`` makes the next lookup read the networks from vCenter again"""
+        fake_network_names.return_value = NETWORKS
+        self.index.lookup(self.fake_vcenter, ['alice_frontend'], scope='alice_')
+        fake_network_names.return_value = [(network_index.vim.Network('network-9'), 'alice_frontend')]
+
+        self.index.invalidate(['alice_frontend'])
+        output = self.index.lookup(self.fake_vcenter, ['alice_frontend'], scope='alice_')
+
+        self.assertEqual(output['alice_frontend']._moId, 'network-9')
+
+    @patch.object(network_index, '_network_names')
+    def test_lookup_scope(self, fake_network_names):
+        """``NetworkIndex.lookup`` does not index the networks of other users"""
+        fake_network_names.return_value = NETWORKS
+        self.index.lookup(self.fake_vcenter, ['alice_frontend'], scope='alice_')
+
+        self.assertFalse('bob_frontend' in self.index._entries)
+
+    @patch.object(network_index, '_network_names')
+    def test_lookup_missing(self, fake_network_names):
+        """``NetworkIndex.lookup`` leaves out networks that do not exist"""
+        fake_network_names.return_value = NETWORKS
+
+        output = self.index.lookup(self.fake_vcenter, ['alice_nope'], scope='alice_')
+
+        self.assertEqual(output, {})
+
+    @patch.object(network_index, '_network_names')
+    def test_max_size(self, fake_network_names):
+        """``NetworkIndex`` forgets the least recently used networks once full"""
+        self.index.max_size = 2
+        fake_network_names.return_value = NETWORKS
+        self.index.lookup(self.fake_vcenter, ['alice_frontend'], scope='alice_')
+        self.index.lookup(self.fake_vcenter, ['bob_frontend'], scope='bob_')
+
+        output = list(self.index._entries.keys())
+        expected = ['alice_frontend', 'bob_frontend']
+
+        self.assertEqual(output, expected)
+
+    @patch.object(network_index, '_network_names')
+    def test_ttl(self, fake_network_names):
+        """``NetworkIndex`` re-reads networks that have been in the index longer than the TTL"""
+        fake_network_names.return_value = NETWORKS
+        self.index.lookup(self.fake_vcenter, ['alice_frontend'], scope='alice_')
+        vimtype, moid, added = self.index._entries['alice_frontend']
+        self.index._entries['alice_frontend'] = (vimtype, moid, added - 301)
+
+        self.index.lookup(self.fake_vcenter, ['alice_frontend'], scope='alice_')
+
+        self.assertEqual(fake_network_names.call_count, 2)
+
+    def test_network_names(self):
+        """``_network_names`` reads every network name with one PropertyCollector call"""
+        self.fake_vcenter.content.propertyCollector.RetrieveContents.return_value = [
+            SimpleNamespace(obj=NETWORKS[0][0], propSet=[SimpleNamespace(name='name', val='alice_frontend')])
+        ]
+        self.fake_vcenter.content.viewManager.CreateContainerView.return_value = network_index.vim.view.ContainerView('view-1')
+
+        with patch.object(network_index.vim.view.ContainerView, 'DestroyView') as fake_destroy_view:
+            output = network_index._network_names(self.fake_vcenter)
+
+        self.assertEqual(output, [NETWORKS[0]])
+        self.assertTrue(fake_destroy_view.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in nfc_upload.py
+"""
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+
+from vlab_router_api.lib.worker import nfc_upload, ova_index
+
+DISKS = {'router-disk1.vmdk': b'a' * 3000, 'router-disk2.vmdk': b'b' * 5000}
+
+
+def _make_ova(path):
+    """Create a tiny OVA file with two disks"""
+    with tarfile.open(path, 'w') as the_tar:
+        for name, data in [('router.ovf', b'<Envelope/>')] + sorted(DISKS.items()):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            the_tar.addfile(info, io.BytesIO(data))
+
+
+class FakeConnection(object):
+    """Records what's sent, like an ESXi host accepting a disk"""
+    def __init__(self, received, fail=0, status=200):
+        self.received = received
+        self.fail = fail
+        self.status = status
+        self.path = None
+        self.data = b''
+
+    def __call__(self, host, port, context=None):
+        return self
+
+    def putrequest(self, method, path):
+        self.path = path
+        self.data = b''
+
+    def putheader(self, header, value):
+        pass
+
+    def endheaders(self):
+        pass
+
+    def send(self, chunk):
+        if self.fail:
+            self.fail -= 1
+            raise ConnectionResetError('testing')
+        self.data += bytes(chunk)
+
+    def getresponse(self):
+        self.received[self.path] = self.data
+        return SimpleNamespace(status=self.status, reason='testing', read=lambda: b'')
+
+    def close(self):
+        pass
+
+
+class TestNfcUpload(unittest.TestCase):
+    """A set of test cases for the ``upload`` function"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.images_dir = tempfile.mkdtemp()
+        self.ova_path = os.path.join(self.images_dir, 'router-vyos-1.1.8.ova')
+        _make_ova(self.ova_path)
+        ova_meta = ova_index.parse_ova(self.ova_path)
+        self.disks = {name: (self.ova_path, ova_meta['offsets'][name], size) for name, size in ova_meta['disks'].items()}
+        self.spec = MagicMock()
+        self.spec.fileItem = [SimpleNamespace(path=x, deviceId='key-{}'.format(x)) for x in sorted(DISKS.keys())]
+        self.lease = MagicMock()
+        self.lease.state = 'ready'
+        self.lease.info.deviceUrl = [SimpleNamespace(importKey='key-{}'.format(x), url='https://*/nfc/{}'.format(x))
+                                     for x in sorted(DISKS.keys())]
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.images_dir)
+
+    def _upload(self, connection):
+        with patch.object(nfc_upload.http.client, 'HTTPSConnection', connection):
+            with patch.object(nfc_upload, 'get_context'):
+                with patch.object(nfc_upload, 'RETRY_DELAY', 0):
+                    nfc_upload.upload(self.disks, self.spec, self.lease, 'esxi1')
+
+    def test_upload(self):
+        """``upload`` sends every disk, byte for byte"""
+        received = {}
+        self._upload(lambda *a, **kw: FakeConnection(received)(*a, **kw))
+        expected = {'/nfc/{}'.format(k): v for k, v in DISKS.items()}
+
+        self.assertEqual(received, expected)
+
+    def test_upload_completes(self):
+        """``upload`` completes the lease when every disk is sent"""
+        self._upload(lambda *a, **kw: FakeConnection({})(*a, **kw))
+
+        self.assertTrue(self.lease.Complete.called)
+        self.assertFalse(self.lease.Abort.called)
+
+    def test_upload_retries(self):
+        """``upload`` sends a disk again when its connection breaks"""
+        received = {}
+        flaky = FakeConnection(received, fail=1)
+        connections = iter([flaky, FakeConnection(received), FakeConnection(received)])
+        self._upload(lambda *a, **kw: next(connections))
+
+        self.assertEqual(len(received), len(DISKS))
+        self.assertTrue(self.lease.Complete.called)
+
+    def test_upload_gives_up(self):
+        """``upload`` aborts the lease when a disk keeps failing"""
+        with self.assertRaises(ConnectionResetError):
+            self._upload(lambda *a, **kw: FakeConnection({}, fail=100))
+
+        self.assertTrue(self.lease.Abort.called)
+        self.assertFalse(self.lease.Complete.called)
+
+    def test_upload_no_retry_lease_error(self):
+        """``upload`` doesn't send a disk again once the lease is no longer ready"""
+        self.lease.state = 'error'
+        connection = MagicMock(side_effect=lambda *a, **kw: FakeConnection({}, fail=1))
+        with self.assertRaises(ConnectionResetError):
+            self._upload(connection)
+
+        self.assertEqual(connection.call_count, len(DISKS))
+
+    def test_upload_refused(self):
+        """``upload`` raises UploadError when ESXi refuses a disk"""
+        with self.assertRaises(nfc_upload.UploadError):
+            self._upload(lambda *a, **kw: FakeConnection({}, status=500))
+
+        self.assertTrue(self.lease.Abort.called)
+
+    def test_upload_no_device_url(self):
+        """``upload`` raises RuntimeError when the lease has no URL for a disk"""
+        self.lease.info.deviceUrl = []
+        with self.assertRaises(RuntimeError):
+            self._upload(lambda *a, **kw: FakeConnection({}))
+
+    def test_progress(self):
+        """``NfcUpload.progress`` is the percent of every disk that's been sent"""
+        uploader = nfc_upload.NfcUpload({'a': (self.ova_path, 0, 100), 'b': (self.ova_path, 100, 300)}, self.lease, 'esxi1')
+        uploader.sent = {'a': 100, 'b': 100}
+
+        self.assertEqual(uploader.progress(), 50)
+
+
+if __name__ == '__main__':
+    unittest.main()
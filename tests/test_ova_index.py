@@ -0,0 +1,125 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in ova_index.py
+"""
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from vlab_router_api.lib.worker import ova_index
+
+OVF = """<?xml version="1.0" encoding="UTF-8"?>
+<Envelope>
+  <NetworkSection>
+    <Network ovf:name="frontend">
+    </Network>
+    <Network ovf:name="backend">
+    </Network>
+  </NetworkSection>
+</Envelope>
+"""
+
+
+def _make_ova(path, ovf=OVF):
+    """Create a tiny OVA file"""
+    with tarfile.open(path, 'w') as the_tar:
+        for name, data in (('router.ovf', ovf.encode()), ('router-disk1.vmdk', b'\x00' * 512)):
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            the_tar.addfile(info, io.BytesIO(data))
+
+
+class TestOvaIndex(unittest.TestCase):
+    """A set of test cases for the OvaIndex object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.images_dir = tempfile.mkdtemp()
+        self.ova_path = os.path.join(self.images_dir, 'router-vyos-1.1.8.ova')
+        _make_ova(self.ova_path)
+        self.index_file = os.path.join(self.images_dir, 'index.json')
+        self.index = ova_index.OvaIndex(self.images_dir, self.index_file)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        shutil.rmtree(self.images_dir)
+
+    def test_lookup(self):
+        """``OvaIndex.lookup`` returns the networks defined in the OVF"""
+        output = self.index.lookup('router-vyos-1.1.8.ova')['networks']
+        expected = ['frontend', 'backend']
+
+        self.assertEqual(output, expected)
+
+    def test_lookup_disks(self):
+        """``OvaIndex.lookup`` returns the size of the disks within the OVA"""
+        output = self.index.lookup('router-vyos-1.1.8.ova')['disks']
+        expected = {'router-disk1.vmdk': 512}
+
+        self.assertEqual(output, expected)
+
+    def test_lookup_offsets(self):
+        """``OvaIndex.lookup`` returns where each disk starts within the OVA"""
+        offset = self.index.lookup('router-vyos-1.1.8.ova')['offsets']['router-disk1.vmdk']
+        with open(self.ova_path, 'rb') as the_file:
+            the_file.seek(offset)
+            output = the_file.read(512)
+
+        self.assertEqual(output, b'\x00' * 512)
+
+    def test_parse_manifest(self):
+        """``parse_manifest`` returns the algorithm and digest of each file"""
+        output = ova_index.parse_manifest('SHA1(router.ovf)= ABC123\nSHA256(router-disk1.vmdk)= def456\n')
+        expected = {'router.ovf': ['sha1', 'abc123'], 'router-disk1.vmdk': ['sha256', 'def456']}
+
+        self.assertEqual(output, expected)
+
+    def test_lookup_not_found(self):
+        """``OvaIndex.lookup`` raises FileNotFoundError for an unknown image"""
+        with self.assertRaises(FileNotFoundError):
+            self.index.lookup('router-vyos-9.9.9.ova')
+
+    def test_lookup_cached(self):
+        """``OvaIndex.lookup`` does not re-parse an OVA that has not changed"""
+        self.index.lookup('router-vyos-1.1.8.ova')
+        with patch.object(ova_index, 'parse_ova') as fake_parse_ova:
+            self.index.lookup('router-vyos-1.1.8.ova')
+
+        self.assertFalse(fake_parse_ova.called)
+
+    def test_lookup_persisted(self):
+        """``OvaIndex.lookup`` reuses the index another process stored on disk"""
+        self.index.lookup('router-vyos-1.1.8.ova')
+        new_index = ova_index.OvaIndex(self.images_dir, self.index_file)
+        with patch.object(ova_index, 'parse_ova') as fake_parse_ova:
+            new_index.lookup('router-vyos-1.1.8.ova')
+
+        self.assertFalse(fake_parse_ova.called)
+
+    def test_lookup_invalidated(self):
+        """``OvaIndex.lookup`` re-parses an OVA when its size or mtime changes"""
+        self.index.lookup('router-vyos-1.1.8.ova')
+        _make_ova(self.ova_path, ovf=OVF.replace('backend', 'sidecar'))
+        os.utime(self.ova_path, ns=(0, 1))
+
+        output = self.index.lookup('router-vyos-1.1.8.ova')['networks']
+        expected = ['frontend', 'sidecar']
+
+        self.assertEqual(output, expected)
+
+    def test_refresh(self):
+        """``OvaIndex.refresh`` forgets images that were removed"""
+        self.index.lookup('router-vyos-1.1.8.ova')
+        os.remove(self.ova_path)
+
+        self.index.refresh()
+
+        self.assertEqual(self.index._load(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in placement.py
+"""
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch, MagicMock
+
+from vlab_router_api.lib.worker import placement
+
+vim = placement.vim
+INVENTORY = {'datastores': [{'name': 'ds1', 'moid': 'datastore-1', 'free': 100, 'hosts': [('host-1', 'esxi1')]},
+                            {'name': 'ds2', 'moid': 'datastore-2', 'free': 100, 'hosts': [('host-2', 'esxi2')]}],
+             'pools': [{'name': 'pool1', 'moid': 'resgroup-1', 'hosts': ['host-1', 'host-2']},
+                       {'name': 'pool2', 'moid': 'resgroup-2', 'hosts': ['host-1', 'host-2']}],
+            }
+
+
+class TestPlacementEngine(unittest.TestCase):
+    """A set of test cases for the PlacementEngine object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.engine = placement.PlacementEngine(datastores=['ds1', 'ds2'], pools=['pool1', 'pool2'], ttl=30)
+        self.fake_vcenter = MagicMock()
+
+    @patch.object(placement, '_read_inventory')
+    def test_choose(self, fake_read_inventory):
+        """``PlacementEngine.choose`` returns objects that can be used in a deploy spec"""
+        fake_read_inventory.return_value = INVENTORY
+
+        output = self.engine.choose(self.fake_vcenter)
+
+        self.assertTrue(isinstance(output.datastore, vim.Datastore))
+        self.assertTrue(isinstance(output.pool, vim.ResourcePool))
+        self.assertTrue(isinstance(output.host, vim.HostSystem))
+
+    @patch.object(placement, '_read_inventory')
+    def test_choose_cached(self, fake_read_inventory):
+        """``PlacementEngine.choose`` reuses what it read from vCenter within the TTL"""
+        fake_read_inventory.return_value = INVENTORY
+
+        self.engine.choose(self.fake_vcenter)
+        self.engine.choose(self.fake_vcenter)
+
+        self.assertEqual(fake_read_inventory.call_count, 1)
+
+    @patch.object(placement, '_read_inventory')
+    def test_choose_in_flight(self, fake_read_inventory):
+        """``PlacementEngine.choose`` avoids the datastore and pool that are busy deploying"""
+        fake_read_inventory.return_value = INVENTORY
+        self.engine.in_flight.update({'ds1': 1000000, 'pool1': 1})
+
+        with patch.object(placement.random, 'uniform', return_value=1):
+            output = self.engine.choose(self.fake_vcenter)
+
+        self.assertEqual(output.datastore_name, 'ds2')
+        self.assertEqual(output.pool_name, 'pool2')
+
+    @patch.object(placement, '_read_inventory')
+    def test_choose_no_datastore(self, fake_read_inventory):
+        """``PlacementEngine.choose`` raises RuntimeError when no datastore can be used"""
+        fake_read_inventory.return_value = {'datastores': [{'name': 'ds1', 'moid': 'datastore-1', 'free': 0, 'hosts': []}],
+                                            'pools': INVENTORY['pools']}
+
+        with self.assertRaises(RuntimeError):
+            self.engine.choose(self.fake_vcenter)
+
+    @patch.object(placement, '_read_inventory')
+    def test_choose_clusters(self, fake_read_inventory):
+        """``PlacementEngine.choose`` only picks a host in the cluster of the pool"""
+        fake_read_inventory.return_value = {'datastores': INVENTORY['datastores'],
+                                            'pools': [{'name': 'pool1', 'moid': 'resgroup-1', 'hosts': ['host-1']},
+                                                      {'name': 'pool2', 'moid': 'resgroup-2', 'hosts': ['host-2']}]}
+
+        for _ in range(20):
+            output = self.engine.choose(self.fake_vcenter)
+            expected = {'pool1': ('ds1', 'esxi1'), 'pool2': ('ds2', 'esxi2')}[output.pool_name]
+
+            self.assertEqual((output.datastore_name, output.host_name), expected)
+
+    @patch.object(placement, '_read_inventory')
+    def test_choose_no_shared_host(self, fake_read_inventory):
+        """``PlacementEngine.choose`` raises RuntimeError when no datastore is mounted in the cluster of any pool"""
+        fake_read_inventory.return_value = {'datastores': INVENTORY['datastores'],
+                                            'pools': [{'name': 'pool1', 'moid': 'resgroup-1', 'hosts': ['host-3']}]}
+
+        with self.assertRaises(RuntimeError):
+            self.engine.choose(self.fake_vcenter)
+
+    def test_deploying(self):
+        """``PlacementEngine.deploying`` counts the deploy while it runs, and learns its latency"""
+        where = SimpleNamespace(datastore_name='ds1', pool_name='pool1')
+
+        with self.engine.deploying(where):
+            in_flight = self.engine.in_flight['ds1']
+
+        self.assertEqual(in_flight, 1)
+        self.assertEqual(self.engine.in_flight['ds1'], 0)
+        self.assertTrue('ds1' in self.engine.latency)
+
+    def test_weight_latency(self):
+        """``PlacementEngine`` prefers datastores whose recent deploys were quick"""
+        self.engine.latency = {'ds1': 300, 'ds2': 5}
+
+        slow = self.engine._weight(INVENTORY['datastores'][0])
+        fast = self.engine._weight(INVENTORY['datastores'][1])
+
+        self.assertTrue(fast > slow)
+
+
+class TestReadInventory(unittest.TestCase):
+    """A set of test cases for the ``_read_inventory`` function"""
+
+    def test_read_inventory(self):
+        """``_read_inventory`` expands datastore clusters, and skips hosts in maintenance mode"""
+        host1 = vim.HostSystem('host-1')
+        host2 = vim.HostSystem('host-2')
+        ds1 = vim.Datastore('datastore-1')
+        mounts = [vim.Datastore.HostMount(key=host1, mountInfo=vim.host.MountInfo(accessible=True)),
+                  vim.Datastore.HostMount(key=host2, mountInfo=vim.host.MountInfo(accessible=True))]
+        found = [(vim.StoragePod('group-p1'), {'name': 'VM-Storage', 'childEntity': [ds1]}),
+                 (ds1, {'name': 'ds1', 'summary.freeSpace': 10, 'summary.accessible': True, 'host': mounts}),
+                 (vim.Datastore('datastore-2'), {'name': 'ds2', 'summary.freeSpace': 10, 'summary.accessible': True, 'host': mounts}),
+                 (host1, {'name': 'esxi1', 'runtime.inMaintenanceMode': False}),
+                 (host2, {'name': 'esxi2', 'runtime.inMaintenanceMode': True}),
+                 (vim.ClusterComputeResource('domain-c1'), {'name': 'cluster1', 'host': [host1, host2]}),
+                 (vim.ResourcePool('resgroup-1'), {'name': 'Resources', 'owner': vim.ClusterComputeResource('domain-c1')}),
+                ]
+        fake_vcenter = MagicMock()
+        fake_vcenter.content.propertyCollector.RetrieveContents.return_value = \
+            [SimpleNamespace(obj=obj, propSet=[SimpleNamespace(name=k, val=v) for k, v in props.items()])
+             for obj, props in found]
+
+        fake_vcenter.content.viewManager.CreateContainerView.return_value = vim.view.ContainerView('view-1')
+
+        with patch.object(vim.view.ContainerView, 'DestroyView') as fake_destroy_view:
+            output = placement._read_inventory(fake_vcenter, ['VM-Storage'], ['Resources'])
+        expected = {'datastores': [{'name': 'ds1', 'moid': 'datastore-1', 'free': 10, 'hosts': [('host-1', 'esxi1')]}],
+                    'pools': [{'name': 'Resources', 'moid': 'resgroup-1', 'hosts': ['host-1', 'host-2']}]}
+
+        self.assertEqual(output, expected)
+        self.assertTrue(fake_destroy_view.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in properties.py
+"""
+import unittest
+from types import SimpleNamespace
+from unittest.mock import MagicMock
+
+from vlab_router_api.lib.worker import properties
+
+
+def _object_content(obj, **props):
+    """Make the kind of object returned by ``PropertyCollector.RetrieveContents``"""
+    prop_set = [SimpleNamespace(name=x, val=y) for x, y in props.items()]
+    return SimpleNamespace(obj=obj, propSet=prop_set)
+
+
+class TestProperties(unittest.TestCase):
+    """A set of test cases for the properties.py module"""
+
+    def test_retrieve_folder(self):
+        """``retrieve_folder`` reads every VM in the folder with one PropertyCollector call"""
+        fake_vcenter = MagicMock()
+        fake_vcenter.content.propertyCollector.RetrieveContents.return_value = [
+            _object_content(properties.vim.VirtualMachine('vm-1'), name='myRouter'),
+            _object_content(properties.vim.Network('net-1'), name='alice_frontend'),
+        ]
+
+        vms, network_names = properties.retrieve_folder(fake_vcenter, properties.vim.Folder('group-1'))
+
+        self.assertEqual(fake_vcenter.content.propertyCollector.RetrieveContents.call_count, 1)
+        self.assertEqual(list(vms.values()), [{'name': 'myRouter'}])
+        self.assertEqual(network_names, {'net-1': 'alice_frontend'})
+
+    def test_folder_filter_spec(self):
+        """``folder_filter_spec`` asks for the VMs of the folder and their network names"""
+        output = properties.folder_filter_spec(properties.vim.Folder('group-1'))
+        types = [x.type for x in output.propSet]
+
+        self.assertEqual(output.objectSet[0].obj._moId, 'group-1')
+        self.assertEqual(types, [properties.vim.VirtualMachine, properties.vim.Network])
+
+    def test_retrieve_vm(self):
+        """``retrieve_vm`` returns the properties of the VM, and the names of its networks"""
+        fake_vcenter = MagicMock()
+        the_vm = properties.vim.VirtualMachine('vm-1')
+        fake_vcenter.content.propertyCollector.RetrieveContents.return_value = [
+            _object_content(the_vm, name='myRouter'),
+            _object_content(properties.vim.Network('net-1'), name='alice_frontend'),
+        ]
+
+        props, network_names = properties.retrieve_vm(fake_vcenter, the_vm)
+
+        self.assertEqual(props, {'name': 'myRouter'})
+        self.assertEqual(network_names, {'net-1': 'alice_frontend'})
+
+    def test_parse_meta(self):
+        """``parse_meta`` returns the default meta data when a VM has no notes"""
+        output = properties.parse_meta(None)
+        expected = {'component': 'Unknown',
+                    'created': 0,
+                    'version': "Unknown",
+                    'generation': 0,
+                    'configured': False
+                   }
+
+        self.assertEqual(output, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,11 +2,16 @@
 """
 A suite of tests for the router object
 """
+import gzip
+import time
 import unittest
+from threading import Thread
+from urllib.request import urlopen, Request
 from unittest.mock import patch, MagicMock
 
 import ujson
 from flask import Flask
+from werkzeug.serving import make_server
 from vlab_api_common import flask_common
 from vlab_api_common.http_auth import generate_v2_test_token
 
@@ -33,6 +38,8 @@ class TestRouterView(unittest.TestCase):
         cls.fake_task = MagicMock()
         cls.fake_task.id = 'asdf-asdf-asdf'
         app.celery_app.send_task.return_value = cls.fake_task
+        # Every deploy is admitted
+        app.celery_app.backend.client.eval.return_value = 0
 
     def test_v1_deprecated(self):
         """RouterView - GET on /api/1/inf/router returns an HTTP 404"""
@@ -112,6 +119,61 @@ class TestRouterView(unittest.TestCase):
 
         self.assertEqual(task_id, expected)
 
+    def test_create_many_task(self):
+        """RouterView - POST on /api/2/inf/router/bulk returns a task-id"""
+        resp = self.app.post('/api/2/inf/router/bulk',
+                             headers={'X-Auth': self.token},
+                             json={'routers': [{'name': "router1", 'image': "1.0.32", 'networks': ['net1', 'net2']},
+                                               {'name': "router2", 'image': "1.0.32", 'networks': ['net3', 'net4']}]})
+
+        task_id = resp.json['content']['task-id']
+        expected = 'asdf-asdf-asdf'
+
+        self.assertEqual(task_id, expected)
+
+    def test_create_many_networks(self):
+        """RouterView - POST on /api/2/inf/router/bulk prefixes every network with the username"""
+        self.app.post('/api/2/inf/router/bulk',
+                      headers={'X-Auth': self.token},
+                      json={'routers': [{'name': "router1", 'image': "1.0.32", 'networks': ['net1', 'net2']}]})
+
+        the_args, _ = self.app.application.celery_app.send_task.call_args
+        networks = the_args[1][1][0]['networks']
+        expected = ['bob_net1', 'bob_net2']
+
+        self.assertEqual(networks, expected)
+
+    def test_create_many_unique_names(self):
+        """RouterView - POST on /api/2/inf/router/bulk requires every Router to have a unique name"""
+        resp = self.app.post('/api/2/inf/router/bulk',
+                             headers={'X-Auth': self.token},
+                             json={'routers': [{'name': "router1", 'image': "1.0.32", 'networks': ['net1', 'net2']},
+                                               {'name': "router1", 'image': "1.0.32", 'networks': ['net3', 'net4']}]})
+
+        self.assertEqual(resp.status_code, 400)
+
+    def test_delete_many_task(self):
+        """RouterView - DELETE on /api/2/inf/router/bulk returns a task-id"""
+        resp = self.app.delete('/api/2/inf/router/bulk',
+                               headers={'X-Auth': self.token},
+                               json={'names': ['router1', 'router2']})
+
+        task_id = resp.json['content']['task-id']
+        expected = 'asdf-asdf-asdf'
+
+        self.assertEqual(task_id, expected)
+
+    def test_delete_many_all(self):
+        """RouterView - DELETE on /api/2/inf/router/bulk without names deletes every Router"""
+        self.app.delete('/api/2/inf/router/bulk',
+                        headers={'X-Auth': self.token},
+                        json={})
+
+        the_args, _ = self.app.application.celery_app.send_task.call_args
+        machine_names = the_args[1][1]
+
+        self.assertEqual(machine_names, [])
+
     def test_images_task(self):
         """RouterView - GET on /api/2/inf/router/image returns a task-id"""
         resp = self.app.get('/api/2/inf/router/image',
@@ -132,6 +194,192 @@ class TestRouterView(unittest.TestCase):
 
         self.assertEqual(task_id, expected)
 
+    @patch.object(router.RouterView, 'IMAGE_INDEX')
+    @patch.object(router, 'const', router.const._replace(VLAB_ROUTER_INLINE_IMAGES=True))
+    def test_images_inline(self, fake_IMAGE_INDEX):
+        """RouterView - GET on /api/2/inf/router/image returns the images when inline mode is enabled"""
+        fake_IMAGE_INDEX.images.return_value = ['1.1.8']
+        resp = self.app.get('/api/2/inf/router/image',
+                            headers={'X-Auth': self.token})
+
+        images = resp.json['content']['image']
+        expected = ['1.1.8']
+
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(images, expected)
+
+    @patch.object(router.RouterView, 'IMAGE_INDEX')
+    @patch.object(router, 'const', router.const._replace(VLAB_ROUTER_INLINE_IMAGES=True))
+    def test_images_inline_respond_async(self, fake_IMAGE_INDEX):
+        """RouterView - GET on /api/2/inf/router/image honors 'Prefer: respond-async' when inline mode is enabled"""
+        resp = self.app.get('/api/2/inf/router/image',
+                            headers={'X-Auth': self.token, 'Prefer': 'respond-async'})
+
+        task_id = resp.json['content']['task-id']
+        expected = 'asdf-asdf-asdf'
+
+        self.assertEqual(resp.status_code, 202)
+        self.assertEqual(task_id, expected)
+
+
+    def _task_result(self, console='https://some-console?ticket=1', routers=1):
+        """Make the task link return the Routers of a finished show task"""
+        content = {'router{}'.format(x): {'state': 'poweredOn', 'console': console, 'ips': ['10.1.1.1']} for x in range(routers)}
+        fake_result = MagicMock()
+        fake_result.status = 'SUCCESS'
+        fake_result.result = {'content': content, 'error': None, 'params': {}}
+        self.app.application.celery_app.AsyncResult.return_value = fake_result
+
+    def test_task_etag(self):
+        """RouterView - GET on the task link sets an ETag"""
+        self._task_result()
+        resp = self.app.get('/api/2/inf/router/task/asdf-asdf-asdf',
+                            headers={'X-Auth': self.token})
+
+        self.assertTrue(resp.headers.get('ETag').startswith('W/"'))
+
+    def test_task_etag_console(self):
+        """RouterView - The ETag does not change when only the console ticket changes"""
+        self._task_result(console='https://some-console?ticket=1')
+        resp1 = self.app.get('/api/2/inf/router/task/asdf-asdf-asdf',
+                             headers={'X-Auth': self.token})
+        self._task_result(console='https://some-console?ticket=2')
+        resp2 = self.app.get('/api/2/inf/router/task/asdf-asdf-asdf',
+                             headers={'X-Auth': self.token})
+
+        self.assertEqual(resp1.headers['ETag'], resp2.headers['ETag'])
+
+    def test_task_not_modified(self):
+        """RouterView - GET on the task link returns an HTTP 304 when If-None-Match has the ETag"""
+        self._task_result()
+        etag = self.app.get('/api/2/inf/router/task/asdf-asdf-asdf',
+                            headers={'X-Auth': self.token}).headers['ETag']
+        resp = self.app.get('/api/2/inf/router/task/asdf-asdf-asdf',
+                            headers={'X-Auth': self.token, 'If-None-Match': etag})
+
+        self.assertEqual(resp.status_code, 304)
+        self.assertEqual(resp.data, b'')
+
+    def test_task_not_modified_strong(self):
+        """RouterView - GET on the task link also matches an If-None-Match without the weak prefix"""
+        self._task_result()
+        etag = self.app.get('/api/2/inf/router/task/asdf-asdf-asdf',
+                            headers={'X-Auth': self.token}).headers['ETag']
+        resp = self.app.get('/api/2/inf/router/task/asdf-asdf-asdf',
+                            headers={'X-Auth': self.token, 'If-None-Match': etag[2:]})
+
+        self.assertEqual(resp.status_code, 304)
+
+    def test_task_gzip(self):
+        """RouterView - Large responses are gzipped when the client accepts it"""
+        self._task_result(routers=50)
+        resp = self.app.get('/api/2/inf/router/task/asdf-asdf-asdf',
+                            headers={'X-Auth': self.token, 'Accept-Encoding': 'gzip'})
+
+        self.assertEqual(resp.headers.get('Content-Encoding'), 'gzip')
+        self.assertEqual(len(ujson.loads(gzip.decompress(resp.data))['content']), 50)
+
+    def test_task_gzip_small(self):
+        """RouterView - Small responses are not gzipped"""
+        self._task_result(routers=1)
+        resp = self.app.get('/api/2/inf/router/task/asdf-asdf-asdf',
+                            headers={'X-Auth': self.token, 'Accept-Encoding': 'gzip'})
+
+        self.assertTrue(resp.headers.get('Content-Encoding') is None)
+
+    def test_task_no_gzip(self):
+        """RouterView - Responses are not gzipped when the client does not accept it"""
+        self._task_result(routers=50)
+        resp = self.app.get('/api/2/inf/router/task/asdf-asdf-asdf',
+                            headers={'X-Auth': self.token})
+
+        self.assertTrue(resp.headers.get('Content-Encoding') is None)
+
+
+    @patch.object(router.time, 'sleep')
+    def test_task_events(self, fake_sleep):
+        """RouterView - GET on /task/<id>/events streams each change of the task status"""
+        fake_result = MagicMock()
+        states = iter([('PENDING', None),
+                       ('PROGRESS', {'phase': 'deploying'}),
+                       ('PROGRESS', {'phase': 'deploying'}),
+                       ('SUCCESS', None)])
+        def next_state(*args, **kwargs):
+            fake_result.status, fake_result.info = next(states)
+        fake_sleep.side_effect = next_state
+        next_state()
+        fake_result.result = {'content': {'myRouter': {}}, 'error': None, 'params': {}}
+        self.app.application.celery_app.AsyncResult.return_value = fake_result
+
+        resp = self.app.get('/api/2/inf/router/task/asdf-asdf-asdf/events',
+                            headers={'X-Auth': self.token})
+        events = [x for x in resp.data.decode().split('\n\n') if x]
+        expected = ['retry: 500',
+                    'event: status\ndata: {"status":"PENDING"}',
+                    'event: status\ndata: {"status":"PROGRESS","phase":"deploying"}',
+                    'event: done\ndata: {"status":"SUCCESS","content":{"myRouter":{}},"error":null,"params":{}}']
+
+        self.assertEqual(resp.mimetype, 'text/event-stream')
+        self.assertEqual(events, expected)
+
+    @patch.object(router.time, 'sleep')
+    @patch.object(router, 'const', router.const._replace(VLAB_ROUTER_EVENTS_TIMEOUT=0))
+    def test_task_events_timeout(self, fake_sleep):
+        """RouterView - The stream of task events ends after the timeout"""
+        self.app.application.celery_app.AsyncResult.return_value.status = 'PENDING'
+
+        resp = self.app.get('/api/2/inf/router/task/asdf-asdf-asdf/events',
+                            headers={'X-Auth': self.token})
+
+        self.assertTrue(resp.data.decode().endswith('event: timeout\ndata: {}\n\n'))
+
+    @patch.object(router, 'const', router.const._replace(VLAB_ROUTER_EVENTS_TIMEOUT=1, VLAB_ROUTER_EVENTS_POLL=0.05))
+    def test_task_events_single_worker(self):
+        """RouterView - An API with one worker still serves other requests while a client follows a task"""
+        self.app.application.celery_app.AsyncResult.return_value.status = 'PENDING'
+        server = make_server('127.0.0.1', 0, self.app.application, threaded=False)
+        Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.shutdown)
+        url = 'http://127.0.0.1:{}/api/2/inf/router'.format(server.server_port)
+        headers = {'X-Auth': self.token}
+        stream = urlopen(Request(url + '/task/asdf-asdf-asdf/events', headers=headers))
+        self.addCleanup(stream.close)
+        stream.readline()  # the stream is open
+
+        started = time.time()
+        resp = urlopen(Request(url, headers=headers), timeout=10)
+        waited = time.time() - started
+
+        self.assertEqual(resp.status, 202)
+        self.assertLess(waited, 5)
+
+
+    @patch.object(router.admission, 'leases')
+    def test_post_busy(self, fake_leases):
+        """RouterView - POST on /api/2/inf/router returns an HTTP 429 when too many Routers are being deployed"""
+        fake_leases.acquire.return_value = 'user:bob'
+        resp = self.app.post('/api/2/inf/router',
+                             headers={'X-Auth': self.token},
+                             json={'name': "myRouter",
+                                   'image': "1.0.32",
+                                   'networks': ['net1', 'net2']})
+
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp.headers['Retry-After'], str(router.const.VLAB_ROUTER_RETRY_AFTER))
+        self.assertFalse(self.app.application.celery_app.send_task.called)
+
+    @patch.object(router.admission, 'leases')
+    def test_bulk_post_busy(self, fake_leases):
+        """RouterView - POST on /api/2/inf/router/bulk returns an HTTP 429 when too many Routers are being deployed"""
+        fake_leases.acquire.return_value = 'user:bob'
+        resp = self.app.post('/api/2/inf/router/bulk',
+                             headers={'X-Auth': self.token},
+                             json={'routers': [{'name': "myRouter",
+                                                'image': "1.0.32",
+                                                'networks': ['net1', 'net2']}]})
+
+        self.assertEqual(resp.status_code, 429)
+
 
 if __name__ == '__main__':
     unittest.main()
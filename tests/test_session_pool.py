@@ -0,0 +1,153 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in session_pool.py
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_router_api.lib.worker import session_pool
+
+
+class TestSessionPool(unittest.TestCase):
+    """A set of test cases for the SessionPool object"""
+
+    @patch.object(session_pool, 'vCenter')
+    def test_session(self, fake_vCenter):
+        """``SessionPool.session`` yields a connection to vCenter"""
+        pool = session_pool.SessionPool(host='localhost', user='bob', password='IloveCats')
+
+        with pool.session() as vcenter:
+            pass
+
+        self.assertTrue(vcenter is fake_vCenter.return_value)
+
+    @patch.object(session_pool, 'vCenter')
+    def test_session_reused(self, fake_vCenter):
+        """``SessionPool.session`` reuses idle sessions"""
+        pool = session_pool.SessionPool(host='localhost', user='bob', password='IloveCats')
+
+        with pool.session():
+            pass
+        with pool.session():
+            pass
+
+        self.assertEqual(fake_vCenter.call_count, 1)
+
+    @patch.object(session_pool, 'vCenter')
+    def test_stats(self, fake_vCenter):
+        """``SessionPool.stats`` counts the hits and misses"""
+        pool = session_pool.SessionPool(host='localhost', user='bob', password='IloveCats')
+
+        with pool.session():
+            pass
+        with pool.session():
+            pass
+        output = pool.stats()
+        expected = {'hits': 1, 'misses': 1, 'reconnects': 0, 'open': 1, 'idle': 1, 'max_size': 4}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(session_pool, 'vCenter')
+    def test_max_size(self, fake_vCenter):
+        """``SessionPool.session`` opens a new session when all the idle ones are in use"""
+        pool = session_pool.SessionPool(host='localhost', user='bob', password='IloveCats')
+
+        with pool.session():
+            with pool.session():
+                pass
+
+        self.assertEqual(fake_vCenter.call_count, 2)
+
+    @patch.object(session_pool, 'vCenter')
+    def test_max_size_timeout(self, fake_vCenter):
+        """``SessionPool.session`` raises RuntimeError if no session frees up in time"""
+        pool = session_pool.SessionPool(host='localhost', user='bob', password='IloveCats',
+                                        max_size=1, timeout=0)
+
+        with self.assertRaises(RuntimeError):
+            with pool.session():
+                with pool.session():
+                    pass
+
+    @patch.object(session_pool, 'vCenter')
+    def test_expired(self, fake_vCenter):
+        """``SessionPool.session`` logs out of sessions that sat idle for too long"""
+        pool = session_pool.SessionPool(host='localhost', user='bob', password='IloveCats')
+
+        with pool.session() as vcenter:
+            pass
+        pool._idle = [(vcenter, session_pool.time.time() - 9000)]
+        with pool.session():
+            pass
+
+        self.assertTrue(fake_vCenter.return_value.close.called)
+
+    @patch.object(session_pool, '_is_alive')
+    @patch.object(session_pool, 'vCenter')
+    def test_reconnect(self, fake_vCenter, fake_is_alive):
+        """``SessionPool.session`` reconnects when a health check fails"""
+        fake_is_alive.return_value = False
+        pool = session_pool.SessionPool(host='localhost', user='bob', password='IloveCats')
+
+        with pool.session() as vcenter:
+            pass
+        pool._idle = [(vcenter, session_pool.time.time() - 120)]
+        with pool.session():
+            pass
+
+        self.assertEqual(pool.reconnects, 1)
+
+    @patch.object(session_pool, 'vCenter')
+    def test_not_authenticated(self, fake_vCenter):
+        """``SessionPool.session`` does not recycle a session vCenter logged out"""
+        pool = session_pool.SessionPool(host='localhost', user='bob', password='IloveCats')
+
+        try:
+            with pool.session():
+                raise session_pool.vim.fault.NotAuthenticated()
+        except session_pool.vim.fault.NotAuthenticated:
+            pass
+
+        self.assertEqual(pool.stats()['idle'], 0)
+
+    @patch.object(session_pool, 'vCenter')
+    def test_fork(self, fake_vCenter):
+        """``SessionPool.session`` does not share sessions with a forked process"""
+        pool = session_pool.SessionPool(host='localhost', user='bob', password='IloveCats')
+
+        with pool.session():
+            pass
+        pool._pid = -1 # as if the pool was made by the parent process
+        with pool.session():
+            pass
+
+        self.assertEqual(fake_vCenter.call_count, 2)
+
+    def test_is_alive(self):
+        """``_is_alive`` returns False if vCenter has no current session"""
+        fake_vcenter = MagicMock()
+        fake_vcenter.content.sessionManager.currentSession = None
+
+        self.assertFalse(session_pool._is_alive(fake_vcenter))
+
+    def test_is_alive_error(self):
+        """``_is_alive`` returns False if checking the session fails"""
+        fake_vcenter = MagicMock()
+        type(fake_vcenter).content = property(MagicMock(side_effect=RuntimeError('testing')))
+
+        self.assertFalse(session_pool._is_alive(fake_vcenter))
+
+    @patch.object(session_pool, '_POOL', None)
+    @patch.object(session_pool, 'const', session_pool.const._replace(VLAB_ROUTER_WORKER_ENGINE='threads',
+                                                                     VLAB_VCENTER_POOL_SIZE=4,
+                                                                     VLAB_ROUTER_FAST_THREADS=16,
+                                                                     VLAB_ROUTER_SLOW_THREADS=8))
+    def test_get_pool_threads(self):
+        """``get_pool`` has a session for every thread of the threads engine"""
+        pool = session_pool.get_pool()
+
+        self.assertEqual(pool.max_size, 24)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,6 +5,8 @@ A suite of tests for the functions in tasks.py
 import unittest
 from unittest.mock import patch, MagicMock
 
+from celery.exceptions import Retry
+
 from vlab_router_api.lib.worker import tasks
 
 
@@ -30,6 +32,41 @@ class TestTasks(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
+    @patch.object(tasks.worker_engine, 'engine', tasks.worker_engine.ThreadEngine(fast_threads=2, slow_threads=2))
+    @patch.object(tasks, 'vmware')
+    def test_show_threads(self, fake_vmware):
+        """``show`` works the same with the threads engine"""
+        fake_vmware.show_router.return_value = {'worked': True}
+
+        output = tasks.show(username='bob', txn_id='myId')
+        expected = {'content' : {'worked': True}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks.worker_engine, 'engine', tasks.worker_engine.ThreadEngine(fast_threads=2, slow_threads=2))
+    @patch.object(tasks, 'vmware')
+    def test_show_threads_value_error(self, fake_vmware):
+        """``show`` still returns the ValueError message with the threads engine"""
+        fake_vmware.show_router.side_effect = [ValueError("testing")]
+
+        output = tasks.show(username='bob', txn_id='myId')
+        expected = {'content' : {}, 'error': 'testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks.worker_engine, 'engine', tasks.worker_engine.AsyncioEngine(fast_threads=2, slow_threads=2))
+    @patch.object(tasks, 'vmware')
+    def test_show_asyncio_value_error(self, fake_vmware):
+        """``show`` still returns the ValueError message when a coroutine raises it with the asyncio engine"""
+        async def show_router(call, username):
+            raise ValueError('testing')
+
+        with patch.dict(tasks.worker_engine.async_vmware.COROUTINES, {fake_vmware.show_router: show_router}):
+            output = tasks.show(username='bob', txn_id='myId')
+        expected = {'content' : {}, 'error': 'testing', 'params': {}}
+
+        self.assertEqual(output, expected)
+
     @patch.object(tasks, 'vmware')
     def test_create_ok(self, fake_vmware):
         """``create`` returns a dictionary when everything works as expected"""
@@ -70,6 +107,125 @@ class TestTasks(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
+    @patch.object(tasks, 'vmware')
+    def test_delete_no_wait(self, fake_vmware):
+        """``delete`` does not block the worker on the vCenter task"""
+        fake_vmware.delete_router.return_value = 'task-1'
+        fake_vmware.task_done.return_value = True
+
+        tasks.delete(username='bob', machine_name='myRouter', txn_id='myId')
+        _, the_kwargs = fake_vmware.delete_router.call_args
+
+        self.assertFalse(the_kwargs['wait'])
+
+    @patch.object(tasks, 'vmware')
+    def test_delete_retry(self, fake_vmware):
+        """``delete`` retries itself while vCenter is still destroying the Router"""
+        fake_vmware.delete_router.return_value = 'task-1'
+        fake_vmware.task_done.return_value = False
+
+        with self.assertRaises(Retry):
+            tasks.delete(username='bob', machine_name='myRouter', txn_id='myId')
+
+    @patch.object(tasks, 'inventory')
+    @patch.object(tasks, 'vmware')
+    def test_delete_polled(self, fake_vmware, fake_inventory):
+        """``delete`` only checks on the vCenter task when retried"""
+        fake_vmware.task_done.return_value = True
+
+        output = tasks.delete(username='bob', machine_name='myRouter', txn_id='myId', delete_task='task-1')
+        expected = {'content' : {}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+        self.assertFalse(fake_vmware.delete_router.called)
+        fake_inventory.invalidate.assert_called_with('bob')
+
+    @patch.object(tasks, 'vmware')
+    def test_delete_task_error(self, fake_vmware):
+        """``delete`` fails when vCenter fails to destroy the Router"""
+        fake_vmware.task_done.side_effect = RuntimeError('testing')
+
+        with self.assertRaises(RuntimeError):
+            tasks.delete(username='bob', machine_name='myRouter', txn_id='myId', delete_task='task-1')
+
+    def test_progress(self):
+        """The progress of a task is published as the PROGRESS state"""
+        fake_task = MagicMock()
+        fake_task.request.called_directly = False
+
+        tasks._progress(fake_task)('deploying', percent=50)
+
+        fake_task.update_state.assert_called_with(task_id=fake_task.request.id, state='PROGRESS', meta={'phase': 'deploying', 'percent': 50})
+
+    def test_progress_called_directly(self):
+        """No progress is published when a task is not running in a worker"""
+        fake_task = MagicMock()
+        fake_task.request.called_directly = True
+
+        tasks._progress(fake_task)('deploying')
+
+        self.assertFalse(fake_task.update_state.called)
+
+    @patch.object(tasks, 'metrics')
+    def test_task_timer(self, fake_metrics):
+        """The duration of every task is recorded, by the name of the task"""
+        fake_task = MagicMock()
+        fake_task.name = 'router.show'
+        tasks.start_task_timer(task_id='1234', task=fake_task)
+        tasks.stop_task_timer(task_id='1234', task=fake_task)
+
+        the_args, _ = fake_metrics.observe_task.call_args
+
+        self.assertEqual(the_args[0], 'router.show')
+
+    @patch.object(tasks, 'admission')
+    def test_release_deploy_leases(self, fake_admission):
+        """The deploy leases of a create are given back when the task ends"""
+        fake_task = MagicMock()
+        fake_task.name = 'router.create_many'
+        tasks.release_deploy_leases(task_id='1234', task=fake_task, args=['bob', [{}, {}], 'txn'])
+
+        fake_admission.release.assert_called_with(tasks.app, 'bob', '1234', 2)
+
+    @patch.object(tasks, 'admission')
+    def test_release_deploy_leases_other(self, fake_admission):
+        """Only creates hold deploy leases"""
+        fake_task = MagicMock()
+        fake_task.name = 'router.show'
+        tasks.release_deploy_leases(task_id='1234', task=fake_task, args=['bob', 'txn'])
+
+        self.assertFalse(fake_admission.release.called)
+
+    @patch.object(tasks, 'vmware')
+    def test_create_many_ok(self, fake_vmware):
+        """``create_many`` returns the result of every Router when everything works as expected"""
+        fake_vmware.create_routers.return_value = ({'router1': {'content': {}, 'error': None}}, 0)
+
+        output = tasks.create_many(username='bob', routers=[{'name': 'router1'}], txn_id='myId')
+        expected = {'content' : {'router1': {'content': {}, 'error': None}}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_create_many_failures(self, fake_vmware):
+        """``create_many`` sets the error when any Router fails to be created"""
+        fake_vmware.create_routers.return_value = ({'router1': {'content': {}, 'error': 'testing'}}, 1)
+
+        output = tasks.create_many(username='bob', routers=[{'name': 'router1'}], txn_id='myId')
+        expected = '1 of 1 Routers failed to be created'
+
+        self.assertEqual(output['error'], expected)
+
+    @patch.object(tasks, 'vmware')
+    def test_delete_many_ok(self, fake_vmware):
+        """``delete_many`` returns the result of every Router when everything works as expected"""
+        fake_vmware.delete_routers.return_value = ({'router1': {'content': {}, 'error': None}}, 0)
+
+        output = tasks.delete_many(username='bob', machine_names=['router1'], txn_id='myId')
+        expected = {'content' : {'router1': {'content': {}, 'error': None}}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
     @patch.object(tasks, 'vmware')
     def test_image_ok(self, fake_vmware):
         """``image`` returns a dictionary when everything works as expected"""
@@ -80,6 +236,16 @@ class TestTasks(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
+    @patch.object(tasks, 'vmware')
+    def test_replenish_pool_ok(self, fake_vmware):
+        """``replenish_pool`` returns a dictionary when everything works as expected"""
+        fake_vmware.replenish_pool.return_value = {'1.1.8': 2}
+
+        output = tasks.replenish_pool(txn_id='myId')
+        expected = {'content' : {'deployed': {'1.1.8': 2}}, 'error': None, 'params': {}}
+
+        self.assertEqual(output, expected)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -3,33 +3,57 @@
 A suite of tests for the functions in vmware.py
 """
 import unittest
+from types import SimpleNamespace
 from unittest.mock import patch, MagicMock
 
 from vlab_router_api.lib.worker import vmware
 
 
+def _object_content(obj, **props):
+    """Make the kind of object returned by ``PropertyCollector.RetrieveContents``"""
+    prop_set = [SimpleNamespace(name=x, val=y) for x, y in props.items()]
+    return SimpleNamespace(obj=obj, propSet=prop_set)
+
+
 class TestVMware(unittest.TestCase):
     """A set of test cases for the vmware.py module"""
 
-    @patch.object(vmware.virtual_machine, 'get_info')
-    @patch.object(vmware, 'consume_task')
-    @patch.object(vmware, 'vCenter')
-    def test_show_router(self, fake_vCenter, fake_consume_task, fake_get_info):
+    def setUp(self):
+        """Runs before every test case"""
+        # Keep the Routers one test indexes from being found by the next
+        patcher = patch.object(vmware.meta_index, 'index', vmware.meta_index.MetaIndex(max_users=10))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @patch.object(vmware.virtual_machine, '_get_vm_console_url')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_show_router(self, fake_session_pool, fake_inventory, fake_get_vm_console_url):
         """``show_router`` returns a dictionary when everything works as expected"""
-        fake_vm = MagicMock()
-        fake_vm.name = 'myRouter'
-        fake_folder = MagicMock()
-        fake_folder.childEntity = [fake_vm]
-        fake_vCenter.return_value.__enter__.return_value.get_by_name.return_value = fake_folder
-        fake_get_info.return_value = {'meta' : {'component' : "Router",
-                                                'created': 1234,
-                                                'version': "1.1.8",
-                                                'configured': False,
-                                                'generation': 1,
-                                                }}
+        fake_inventory.get.return_value = None
+        fake_get_vm_console_url.return_value = 'https://some-console'
+        fake_vcenter = fake_session_pool.session.return_value.__enter__.return_value
+        fake_vcenter.get_by_name.return_value = vmware.vim.Folder('group-1')
+        fake_vcenter.content.propertyCollector.RetrieveContents.return_value = [
+            _object_content(vmware.vim.VirtualMachine('vm-1'),
+                            **{'name': 'myRouter',
+                               'config.annotation': '{"component": "Router", "created": 1234, "version": "1.1.8", "configured": false, "generation": 1}',
+                               'runtime.powerState': 'poweredOn',
+                               'guest.net': [MagicMock(ipAddress=['10.1.1.1', 'fe80::1'])],
+                               'network': [vmware.vim.Network('net-1')]}),
+            _object_content(vmware.vim.VirtualMachine('vm-2'),
+                            **{'name': 'someOtherVM',
+                               'config.annotation': '{"component": "Windows", "created": 1234, "version": "10", "configured": false, "generation": 1}'}),
+            _object_content(vmware.vim.Network('net-1'), name='alice_frontend'),
+        ]
 
         output = vmware.show_router(username='alice')
-        expected = {'myRouter': {'meta' : {'component' : "Router",
+        expected = {'myRouter': {'state': 'poweredOn',
+                                 'console': 'https://some-console',
+                                 'ips': ['10.1.1.1'],
+                                 'networks': ['frontend'],
+                                 'moid': 'vm-1',
+                                 'meta' : {'component' : "Router",
                                            'created': 1234,
                                            'version': "1.1.8",
                                            'configured': False,
@@ -38,58 +62,151 @@ class TestVMware(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
-    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'folder_diff')
+    @patch.object(vmware, 'retrieve_folder')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    @patch.object(vmware, 'const', vmware.const._replace(VLAB_ROUTER_SHOW_INCREMENTAL='true'))
+    def test_show_router_incremental(self, fake_session_pool, fake_inventory, fake_retrieve_folder, fake_folder_diff):
+        """``show_router`` only reads what changed in the folder, when incremental shows are on"""
+        fake_inventory.get.return_value = None
+        fake_folder_diff.retrieve.return_value = ({}, {})
+
+        vmware.show_router(username='alice')
+
+        self.assertTrue(fake_folder_diff.retrieve.called)
+        self.assertFalse(fake_retrieve_folder.called)
+
+    @patch.object(vmware.virtual_machine, '_get_vm_console_url')
+    @patch.object(vmware, 'retrieve_folder')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_show_router_cached(self, fake_session_pool, fake_inventory, fake_retrieve_folder, fake_get_vm_console_url):
+        """``show_router`` does not read the folder when the inventory is cached"""
+        fake_inventory.get.return_value = {'myRouter': {'moid': 'vm-1'}}
+        fake_get_vm_console_url.return_value = 'https://some-console'
+
+        output = vmware.show_router(username='alice')
+        expected = {'myRouter': {'moid': 'vm-1', 'console': 'https://some-console'}}
+
+        self.assertEqual(output, expected)
+        self.assertFalse(fake_retrieve_folder.called)
+
+    @patch.object(vmware, 'meta_index')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_delete_router_invalidates(self, fake_session_pool, fake_inventory, fake_consume_task, fake_meta_index):
+        """``delete_router`` invalidates the cached inventory of the user"""
+        fake_meta_index.find.return_value = (MagicMock(), {'component': 'Router'})
+
+        vmware.delete_router(username='alice', machine_name='myRouter', logger=MagicMock())
+
+        fake_inventory.invalidate.assert_called_with('alice')
+
+    @patch.object(vmware, 'meta_index')
     @patch.object(vmware, 'consume_task')
-    @patch.object(vmware, 'vCenter')
-    def test_delete_router(self, fake_vCenter, fake_consume_task, fake_get_info):
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_delete_router(self, fake_session_pool, fake_inventory, fake_consume_task, fake_meta_index):
         """``delete_router`` returns a None when everything works as expected"""
         fake_logger = MagicMock()
-        fake_vm = MagicMock()
-        fake_vm.name = 'myRouter'
-        fake_folder = MagicMock()
-        fake_folder.childEntity = [fake_vm]
-        fake_vCenter.return_value.__enter__.return_value.get_by_name.return_value = fake_folder
-        fake_get_info.return_value = {'meta' : {'component' : "Router",
-                                                'created': 1234,
-                                                'version': "1.1.8",
-                                                'configured': False,
-                                                'generation': 1,
-                                                }}
+        fake_meta_index.find.return_value = (MagicMock(), {'component': 'Router'})
 
         output = vmware.delete_router(username='alice', machine_name='myRouter', logger=fake_logger)
         expected = None
 
         self.assertEqual(output, expected)
 
-    @patch.object(vmware.virtual_machine, 'get_info')
+    @patch.object(vmware, 'meta_index')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_delete_router_unindexes(self, fake_session_pool, fake_inventory, fake_consume_task, fake_meta_index):
+        """``delete_router`` removes the destroyed Router from the meta index"""
+        fake_meta_index.find.return_value = (MagicMock(), {'component': 'Router'})
+
+        vmware.delete_router(username='alice', machine_name='myRouter', logger=MagicMock())
+
+        fake_meta_index.remove.assert_called_with('alice', 'Router', 'myRouter')
+
+    @patch.object(vmware, 'meta_index')
+    @patch.object(vmware, 'consume_task')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_delete_router_no_wait(self, fake_session_pool, fake_inventory, fake_consume_task, fake_meta_index):
+        """``delete_router`` returns the moId of the vCenter task when ``wait`` is False"""
+        fake_vm = MagicMock()
+        fake_vm.Destroy_Task.return_value = vmware.vim.Task('task-1')
+        fake_meta_index.find.return_value = (fake_vm, {'component': 'Router'})
+
+        output = vmware.delete_router(username='alice', machine_name='myRouter', logger=MagicMock(), wait=False)
+        expected = 'task-1'
+
+        self.assertEqual(output, expected)
+        self.assertFalse(fake_consume_task.called)
+
+    @patch.object(vmware.vim, 'Task')
+    @patch.object(vmware, 'session_pool')
+    def test_task_done(self, fake_session_pool, fake_Task):
+        """``task_done`` returns True once the vCenter task has succeeded"""
+        fake_Task.return_value.info.state = vmware.vim.TaskInfo.State.success
+
+        output = vmware.task_done('task-1')
+
+        self.assertTrue(output)
+
+    @patch.object(vmware.vim, 'Task')
+    @patch.object(vmware, 'session_pool')
+    def test_task_done_running(self, fake_session_pool, fake_Task):
+        """``task_done`` returns False while the vCenter task is running"""
+        fake_Task.return_value.info.state = vmware.vim.TaskInfo.State.running
+
+        output = vmware.task_done('task-1')
+
+        self.assertFalse(output)
+
+    @patch.object(vmware.vim, 'Task')
+    @patch.object(vmware, 'session_pool')
+    def test_task_done_error(self, fake_session_pool, fake_Task):
+        """``task_done`` raises RuntimeError when the vCenter task failed"""
+        fake_Task.return_value.info.state = vmware.vim.TaskInfo.State.error
+
+        with self.assertRaises(RuntimeError):
+            vmware.task_done('task-1')
+
+    @patch.object(vmware, 'meta_index')
     @patch.object(vmware, 'consume_task')
-    @patch.object(vmware, 'vCenter')
-    def test_delete_router_value_error(self, fake_vCenter, fake_consume_task, fake_get_info):
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_delete_router_value_error(self, fake_session_pool, fake_inventory, fake_consume_task, fake_meta_index):
         """``delete_router`` raises ValueError when supplied with an unknown router name"""
         fake_logger = MagicMock()
-        fake_vm = MagicMock()
-        fake_vm.name = 'myRouter'
-        fake_folder = MagicMock()
-        fake_folder.childEntity = [fake_vm]
-        fake_vCenter.return_value.__enter__.return_value.get_by_name.return_value = fake_folder
-        fake_get_info.return_value = {'worked': True, 'note': "Router=1.0.32"}
+        fake_meta_index.find.return_value = (None, None)
 
         with self.assertRaises(ValueError):
             vmware.delete_router(username='alice', machine_name='noSuchRouter', logger=fake_logger)
 
+    @patch.object(vmware, 'placement')
+    @patch.object(vmware, 'network_index')
+    @patch.object(vmware, 'retrieve_vm')
+    @patch.object(vmware.virtual_machine, 'power')
     @patch.object(vmware.virtual_machine, 'set_meta')
     @patch.object(vmware, 'map_networks')
     @patch.object(vmware, 'consume_task')
-    @patch.object(vmware.virtual_machine, 'get_info')
-    @patch.object(vmware.virtual_machine, 'deploy_from_ova')
-    @patch.object(vmware, 'Ova')
-    @patch.object(vmware, 'vCenter')
-    def test_create_router(self, fake_vCenter, fake_Ova, fake_deploy_from_ova, fake_get_info, fake_consume_task, fake_map_networks, fake_set_meta):
+    @patch.object(vmware, 'make_info')
+    @patch.object(vmware, '_deploy_ova')
+    @patch.object(vmware, 'ova_index')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_create_router(self, fake_session_pool, fake_inventory, fake_ova_index, fake_deploy_ova, fake_make_info, fake_consume_task, fake_map_networks, fake_set_meta, fake_power, fake_retrieve_vm, fake_network_index, fake_placement):
         """``create_router`` returns a dictionary when everything works"""
         fake_logger = MagicMock()
-        fake_deploy_from_ova.return_value.name = 'myRouter'
+        fake_ova_index.lookup.return_value = {'networks': ['network1', 'network2']}
+        fake_deploy_ova.return_value.name = 'myRouter'
         fake_map_networks.return_value = [vmware.vim.Network(moId='asdf')]
-        fake_get_info.return_value = {'worked': True}
+        fake_make_info.return_value = {'worked': True}
+        fake_retrieve_vm.return_value = ({'name': 'myRouter', 'parent': vmware.vim.Folder('group-1')}, {})
 
         output = vmware.create_router(username='alice',
                                      machine_name='myRouter',
@@ -99,19 +216,197 @@ class TestVMware(unittest.TestCase):
         expected = {'myRouter': {'worked': True}}
 
         self.assertEqual(output, expected)
+        self.assertEqual(vmware.meta_index.index.get('alice', 'Router', 'myRouter').folder, 'group-1')
 
+    @patch.object(vmware, 'placement')
+    @patch.object(vmware, 'network_index')
+    @patch.object(vmware, 'retrieve_vm')
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware.virtual_machine, 'set_meta')
     @patch.object(vmware, 'map_networks')
-    @patch.object(vmware, 'consume_task')
-    @patch.object(vmware.virtual_machine, 'get_info')
-    @patch.object(vmware.virtual_machine, 'deploy_from_ova')
-    @patch.object(vmware, 'Ova')
-    @patch.object(vmware, 'vCenter')
-    def test_create_router_value_error(self, fake_vCenter, fake_Ova, fake_deploy_from_ova, fake_get_info, fake_consume_task, fake_map_networks):
+    @patch.object(vmware, 'make_info')
+    @patch.object(vmware, '_deploy_ova')
+    @patch.object(vmware, 'ova_index')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_create_router_stale_network(self, fake_session_pool, fake_inventory, fake_ova_index, fake_deploy_ova, fake_make_info, fake_map_networks, fake_set_meta, fake_power, fake_retrieve_vm, fake_network_index, fake_placement):
+        """``create_router`` looks the networks up again when the index had one that no longer exists"""
+        fake_ova_index.lookup.return_value = {'networks': ['network1', 'network2']}
+        gone = vmware.vmodl.fault.ManagedObjectNotFound(obj=vmware.vim.Network('network-1'))
+        fake_deploy_ova.side_effect = [gone, MagicMock()]
+        fake_make_info.return_value = {'worked': True}
+        fake_retrieve_vm.return_value = ({'name': 'myRouter', 'parent': vmware.vim.Folder('group-1')}, {})
+
+        output = vmware.create_router(username='alice',
+                                      machine_name='myRouter',
+                                      image='1.0.32',
+                                      requested_networks=['alice_net1', 'alice_net2'],
+                                      logger=MagicMock())
+
+        self.assertEqual(output, {'myRouter': {'worked': True}})
+        fake_network_index.invalidate.assert_called_with(['alice_net1', 'alice_net2'])
+        self.assertEqual(fake_network_index.lookup.call_count, 2)
+
+    @patch.object(vmware, 'placement')
+    @patch.object(vmware, 'network_index')
+    @patch.object(vmware, 'map_networks')
+    @patch.object(vmware, '_deploy_ova')
+    @patch.object(vmware, 'ova_index')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_create_router_stale_network_once(self, fake_session_pool, fake_inventory, fake_ova_index, fake_deploy_ova, fake_map_networks, fake_network_index, fake_placement):
+        """``create_router`` only looks the networks up again once"""
+        fake_ova_index.lookup.return_value = {'networks': ['network1', 'network2']}
+        fake_deploy_ova.side_effect = vmware.vmodl.fault.ManagedObjectNotFound(obj=vmware.vim.Network('network-1'))
+
+        with self.assertRaises(vmware.vmodl.fault.ManagedObjectNotFound):
+            vmware.create_router(username='alice',
+                                 machine_name='myRouter',
+                                 image='1.0.32',
+                                 requested_networks=['alice_net1'],
+                                 logger=MagicMock())
+
+        self.assertEqual(fake_deploy_ova.call_count, 2)
+
+    @patch.object(vmware, 'placement')
+    @patch.object(vmware, 'network_index')
+    @patch.object(vmware, 'map_networks')
+    @patch.object(vmware, '_deploy_ova')
+    @patch.object(vmware, 'ova_index')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_create_router_other_object_gone(self, fake_session_pool, fake_inventory, fake_ova_index, fake_deploy_ova, fake_map_networks, fake_network_index, fake_placement):
+        """``create_router`` doesn't retry when something other than a network no longer exists"""
+        fake_ova_index.lookup.return_value = {'networks': ['network1', 'network2']}
+        fake_deploy_ova.side_effect = vmware.vmodl.fault.ManagedObjectNotFound(obj=vmware.vim.Datastore('datastore-1'))
+
+        with self.assertRaises(vmware.vmodl.fault.ManagedObjectNotFound):
+            vmware.create_router(username='alice',
+                                 machine_name='myRouter',
+                                 image='1.0.32',
+                                 requested_networks=['alice_net1'],
+                                 logger=MagicMock())
+
+        self.assertFalse(fake_network_index.invalidate.called)
+
+    @patch.object(vmware, 'placement')
+    @patch.object(vmware, 'network_index')
+    @patch.object(vmware, 'retrieve_vm')
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware.virtual_machine, 'set_meta')
+    @patch.object(vmware, 'map_networks')
+    @patch.object(vmware, 'make_info')
+    @patch.object(vmware, '_deploy_ova')
+    @patch.object(vmware, 'linked_clone')
+    @patch.object(vmware, 'ova_index')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    @patch.object(vmware, 'const', vmware.const._replace(VLAB_ROUTER_DEPLOY_MODE='clone'))
+    def test_create_router_clone(self, fake_session_pool, fake_inventory, fake_ova_index, fake_linked_clone, fake_deploy_ova, fake_make_info, fake_map_networks, fake_set_meta, fake_power, fake_retrieve_vm, fake_network_index, fake_placement):
+        """``create_router`` makes a linked clone instead of uploading the OVA in 'clone' deploy mode"""
+        fake_ova_index.lookup.return_value = {'networks': ['network1', 'network2']}
+        fake_linked_clone.clone_router.return_value.name = 'myRouter'
+        fake_make_info.return_value = {'worked': True}
+        fake_retrieve_vm.return_value = ({'name': 'myRouter', 'parent': vmware.vim.Folder('group-1')}, {})
+
+        output = vmware.create_router(username='alice',
+                                      machine_name='myRouter',
+                                      image='1.0.32',
+                                      requested_networks=['net1', 'net2'],
+                                      logger=MagicMock())
+        expected = {'myRouter': {'worked': True}}
+
+        self.assertEqual(output, expected)
+        self.assertFalse(fake_deploy_ova.called)
+
+    @patch.object(vmware, 'placement')
+    @patch.object(vmware, 'network_index')
+    @patch.object(vmware, 'retrieve_vm')
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware.virtual_machine, 'set_meta')
+    @patch.object(vmware, 'map_networks')
+    @patch.object(vmware, 'make_info')
+    @patch.object(vmware, 'ova_index')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_create_router_power(self, fake_session_pool, fake_inventory, fake_ova_index, fake_make_info, fake_map_networks, fake_set_meta, fake_power, fake_retrieve_vm, fake_network_index, fake_placement):
+        """``create_router`` deploys the Router powered off, and then powers it on"""
+        fake_ova_index.lookup.return_value = {'networks': ['network1', 'network2']}
+        fake_make_info.return_value = {'worked': True}
+        fake_retrieve_vm.return_value = ({'name': 'myRouter', 'parent': vmware.vim.Folder('group-1')}, {})
+
+        with patch.object(vmware, '_deploy') as fake_deploy:
+            vmware.create_router(username='alice',
+                                 machine_name='myRouter',
+                                 image='1.0.32',
+                                 requested_networks=['net1', 'net2'],
+                                 logger=MagicMock())
+
+        fake_power.assert_called_with(fake_deploy.return_value, state='on')
+
+    @patch.object(vmware, 'placement')
+    @patch.object(vmware, 'network_index')
+    @patch.object(vmware, 'retrieve_vm')
+    @patch.object(vmware.virtual_machine, 'power')
+    @patch.object(vmware.virtual_machine, 'set_meta')
+    @patch.object(vmware, 'map_networks')
+    @patch.object(vmware, 'make_info')
+    @patch.object(vmware, '_deploy')
+    @patch.object(vmware, 'ova_index')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_create_router_placement(self, fake_session_pool, fake_inventory, fake_ova_index, fake_deploy, fake_make_info, fake_map_networks, fake_set_meta, fake_power, fake_retrieve_vm, fake_network_index, fake_placement):
+        """``create_router`` records where the Router was deployed in its meta data"""
+        fake_ova_index.lookup.return_value = {'networks': ['network1', 'network2']}
+        fake_retrieve_vm.return_value = ({'name': 'myRouter', 'parent': vmware.vim.Folder('group-1')}, {})
+        fake_placement.choose.return_value.datastore_name = 'ds1'
+        fake_placement.choose.return_value.pool_name = 'pool1'
+
+        vmware.create_router(username='alice',
+                             machine_name='myRouter',
+                             image='1.0.32',
+                             requested_networks=['net1', 'net2'],
+                             logger=MagicMock())
+        meta = fake_set_meta.call_args[0][1]
+
+        self.assertEqual(meta['datastore'], 'ds1')
+        self.assertEqual(meta['pool'], 'pool1')
+
+    @patch.object(vmware, 'network_index')
+    @patch.object(vmware, 'retrieve_vm')
+    @patch.object(vmware.virtual_machine, 'set_meta')
+    @patch.object(vmware, 'map_networks')
+    @patch.object(vmware, 'make_info')
+    @patch.object(vmware, '_deploy')
+    @patch.object(vmware, 'warm_pool')
+    @patch.object(vmware, 'ova_index')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    @patch.object(vmware, 'const', vmware.const._replace(VLAB_ROUTER_WARM_POOL_SIZE=2))
+    def test_create_router_warm_pool(self, fake_session_pool, fake_inventory, fake_ova_index, fake_warm_pool, fake_deploy, fake_make_info, fake_map_networks, fake_set_meta, fake_retrieve_vm, fake_network_index):
+        """``create_router`` claims a Router from the warm pool instead of deploying one"""
+        fake_ova_index.lookup.return_value = {'networks': ['network1', 'network2']}
+        fake_warm_pool.claim.return_value.name = 'myRouter'
+        fake_make_info.return_value = {'worked': True}
+        fake_retrieve_vm.return_value = ({'name': 'myRouter', 'parent': vmware.vim.Folder('group-1')}, {})
+
+        output = vmware.create_router(username='alice',
+                                      machine_name='myRouter',
+                                      image='1.0.32',
+                                      requested_networks=['net1', 'net2'],
+                                      logger=MagicMock())
+        expected = {'myRouter': {'worked': True}}
+
+        self.assertEqual(output, expected)
+        self.assertFalse(fake_deploy.called)
+
+    @patch.object(vmware, 'ova_index')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_create_router_value_error(self, fake_session_pool, fake_inventory, fake_ova_index):
         """``create_router`` raises ValueError when supplied with an invalid image/version to deploy"""
         fake_logger = MagicMock()
-        fake_Ova.side_effect = FileNotFoundError('testing')
-        fake_map_networks.return_value = [vmware.vim.Network(moId='asdf')]
-        fake_get_info.return_value = {'worked': True}
+        fake_ova_index.lookup.side_effect = FileNotFoundError('testing')
 
         with self.assertRaises(ValueError):
             vmware.create_router(username='alice',
@@ -120,6 +415,155 @@ class TestVMware(unittest.TestCase):
                                      requested_networks=['net1', 'net2'],
                                      logger=fake_logger)
 
+    @patch.object(vmware, 'ova_index')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_create_router_too_many_networks(self, fake_session_pool, fake_inventory, fake_ova_index):
+        """``create_router`` raises ValueError, without touching vCenter, when the image has too few networks"""
+        fake_logger = MagicMock()
+        fake_ova_index.lookup.return_value = {'networks': ['network1', 'network2']}
+
+        with self.assertRaises(ValueError):
+            vmware.create_router(username='alice',
+                                 machine_name='myRouter',
+                                 image='1.0.32',
+                                 requested_networks=['net1', 'net2', 'net3'],
+                                 logger=fake_logger)
+        self.assertFalse(fake_session_pool.session.called)
+
+    @patch.object(vmware, 'create_router')
+    def test_create_routers(self, fake_create_router):
+        """``create_routers`` returns the result of every Router, and the number that failed"""
+        fake_create_router.side_effect = lambda username, name, image, networks, logger: {name: {}}
+        routers = [{'name': 'router1', 'image': '1.0.32', 'networks': ['net1', 'net2']},
+                   {'name': 'router2', 'image': '1.0.32', 'networks': ['net1', 'net2']}]
+
+        output = vmware.create_routers('alice', routers, MagicMock())
+        expected = ({'router1': {'content': {'router1': {}}, 'error': None},
+                     'router2': {'content': {'router2': {}}, 'error': None}}, 0)
+
+        self.assertEqual(output, expected)
+
+    @patch.object(vmware, 'create_router')
+    def test_create_routers_progress(self, fake_create_router):
+        """``create_routers`` reports progress as each Router is done"""
+        fake_progress = MagicMock()
+        routers = [{'name': 'router1', 'image': '1.0.32', 'networks': ['net1', 'net2']},
+                   {'name': 'router2', 'image': '1.0.32', 'networks': ['net1', 'net2']}]
+
+        vmware.create_routers('alice', routers, MagicMock(), progress=fake_progress)
+
+        fake_progress.assert_called_with('running', done=2, total=2, percent=100)
+
+    def _fake_routers(self, fake_session_pool, fake_retrieve_folder):
+        """Give the user two Routers, one powered on, and a VM that isn't a Router"""
+        vms = {}
+        for name, state, component in (('router1', 'poweredOn', 'Router'),
+                                        ('router2', 'poweredOff', 'Router'),
+                                        ('notRouter', 'poweredOn', 'Windows')):
+            fake_vm = MagicMock()
+            fake_vm.PowerOffVM_Task.return_value._moId = 'task-power-{}'.format(name)
+            fake_vm.Destroy_Task.return_value._moId = 'task-destroy-{}'.format(name)
+            vms[fake_vm] = {'name': name, 'runtime.powerState': state,
+                            'config.annotation': '{"component": "%s"}' % component}
+        fake_retrieve_folder.return_value = (vms, {})
+        return {props['name']: vm for vm, props in vms.items()}
+
+    @patch.object(vmware, 'wait_for_tasks')
+    @patch.object(vmware, 'retrieve_folder')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_delete_routers(self, fake_session_pool, fake_inventory, fake_retrieve_folder, fake_wait_for_tasks):
+        """``delete_routers`` powers off the Routers that are on, then destroys them all"""
+        vms = self._fake_routers(fake_session_pool, fake_retrieve_folder)
+        fake_wait_for_tasks.side_effect = lambda vcenter, tasks: {x._moId: None for x in tasks}
+
+        results, failures = vmware.delete_routers('alice', ['router1', 'router2'], MagicMock())
+
+        self.assertEqual(failures, 0)
+        self.assertEqual(sorted(results.keys()), ['router1', 'router2'])
+        self.assertTrue(vms['router1'].PowerOffVM_Task.called)
+        self.assertFalse(vms['router2'].PowerOffVM_Task.called)
+        self.assertTrue(vms['router2'].Destroy_Task.called)
+
+    @patch.object(vmware, 'wait_for_tasks')
+    @patch.object(vmware, 'retrieve_folder')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_delete_routers_all(self, fake_session_pool, fake_inventory, fake_retrieve_folder, fake_wait_for_tasks):
+        """``delete_routers`` destroys every Router of the user when no names are given"""
+        vms = self._fake_routers(fake_session_pool, fake_retrieve_folder)
+        fake_wait_for_tasks.side_effect = lambda vcenter, tasks: {x._moId: None for x in tasks}
+
+        results, _ = vmware.delete_routers('alice', [], MagicMock())
+
+        self.assertEqual(sorted(results.keys()), ['router1', 'router2'])
+        self.assertFalse(vms['notRouter'].Destroy_Task.called)
+
+    @patch.object(vmware, 'wait_for_tasks')
+    @patch.object(vmware, 'retrieve_folder')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    def test_delete_routers_error(self, fake_session_pool, fake_inventory, fake_retrieve_folder, fake_wait_for_tasks):
+        """``delete_routers`` records the error of a Router that failed, without failing the others"""
+        vms = self._fake_routers(fake_session_pool, fake_retrieve_folder)
+        fake_wait_for_tasks.side_effect = lambda vcenter, tasks: {x._moId: 'testing' if 'power' in x._moId else None for x in tasks}
+
+        results, failures = vmware.delete_routers('alice', ['router1', 'router2', 'nope'], MagicMock())
+
+        self.assertEqual(failures, 2)
+        self.assertEqual(results['router1']['error'], 'testing')
+        self.assertEqual(results['router2']['error'], None)
+        self.assertFalse(vms['router1'].Destroy_Task.called)
+
+    @patch.object(vmware, 'wait_for_tasks')
+    @patch.object(vmware, 'retrieve_folder')
+    @patch.object(vmware, 'inventory')
+    @patch.object(vmware, 'session_pool')
+    @patch.object(vmware, 'const', vmware.const._replace(VLAB_ROUTER_DESTROY_CONCURRENCY=1))
+    def test_delete_routers_concurrency(self, fake_session_pool, fake_inventory, fake_retrieve_folder, fake_wait_for_tasks):
+        """``delete_routers`` destroys at most VLAB_ROUTER_DESTROY_CONCURRENCY Routers at once"""
+        self._fake_routers(fake_session_pool, fake_retrieve_folder)
+        fake_wait_for_tasks.side_effect = lambda vcenter, tasks: {x._moId: None for x in tasks}
+
+        vmware.delete_routers('alice', ['router1', 'router2'], MagicMock())
+        batches = [len(x[0][1]) for x in fake_wait_for_tasks.call_args_list]
+
+        # one wait for the power offs, then one per destroy
+        self.assertEqual(batches, [1, 1, 1])
+
+    def test_wait_for_tasks(self):
+        """``wait_for_tasks`` returns the error of each task, waiting on them together"""
+        task1 = vmware.vim.Task('task-1')
+        task2 = vmware.vim.Task('task-2')
+        error = vmware.vmodl.MethodFault(msg='testing')
+        update = SimpleNamespace(version='1', filterSet=[SimpleNamespace(objectSet=[
+            SimpleNamespace(obj=task1, changeSet=[SimpleNamespace(name='info.state', val='success')]),
+            SimpleNamespace(obj=task2, changeSet=[SimpleNamespace(name='info.state', val='error'),
+                                                  SimpleNamespace(name='info.error', val=error)]),
+        ])])
+        fake_vcenter = MagicMock()
+        fake_collector = fake_vcenter.content.propertyCollector.CreatePropertyCollector.return_value
+        fake_collector.WaitForUpdatesEx.side_effect = [None, update]
+
+        output = vmware.wait_for_tasks(fake_vcenter, [task1, task2])
+        expected = {'task-1': None, 'task-2': 'testing'}
+
+        self.assertEqual(output, expected)
+        self.assertTrue(fake_collector.DestroyPropertyCollector.called)
+
+    @patch.object(vmware.time, 'time')
+    def test_wait_for_tasks_timeout(self, fake_time):
+        """``wait_for_tasks`` gives up on tasks that don't finish in time"""
+        fake_time.side_effect = [100, 100, 200]
+        fake_vcenter = MagicMock()
+        fake_collector = fake_vcenter.content.propertyCollector.CreatePropertyCollector.return_value
+        fake_collector.WaitForUpdatesEx.return_value = None
+
+        output = vmware.wait_for_tasks(fake_vcenter, [vmware.vim.Task('task-1')], timeout=50)
+
+        self.assertTrue(output['task-1'].startswith('Timed out'))
+
     def test_map_networks(self):
         """``map_networks`` returns a List when everything works as expected"""
         ova_networks = ['network1', 'network2']
@@ -149,20 +593,6 @@ class TestVMware(unittest.TestCase):
 
         self.assertEqual(output, expected)
 
-    def test_convert_name(self):
-        """``convert_name`` returns an image name from a supplied version by default"""
-        output = vmware.convert_name(name='1.1.8')
-        expected = 'router-vyos-1.1.8.ova'
-
-        self.assertEqual(output, expected)
-
-    def test_convert_name_to_version(self):
-        """``convert_name`` returns the version when supplied with a image name"""
-        output = vmware.convert_name(name='router-vyos-1.1.8.ova', to_version=True)
-        expected = '1.1.8'
-
-        self.assertEqual(output, expected)
-
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,129 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in warm_pool.py
+"""
+import unittest
+from unittest.mock import patch, MagicMock
+
+from vlab_router_api.lib.worker import warm_pool
+
+POOLED_META = '{"component": "RouterPool", "created": 1234, "version": "1.1.8", "configured": false, "generation": 1}'
+
+
+class TestWarmPool(unittest.TestCase):
+    """A set of test cases for warm_pool.py"""
+
+    @patch.object(warm_pool, 'retrieve_folder')
+    def test_pooled_vms(self, fake_retrieve_folder):
+        """``pooled_vms`` only returns unclaimed VMs of the requested version"""
+        fake_retrieve_folder.return_value = ({'vm-1': {'config.annotation': POOLED_META},
+                                              'vm-2': {'config.annotation': POOLED_META.replace('1.1.8', '1.2.0')},
+                                              'vm-3': {'config.annotation': POOLED_META.replace('RouterPool', 'RouterClaimed')}},
+                                             {})
+
+        output = list(warm_pool.pooled_vms(MagicMock(), '1.1.8').keys())
+        expected = ['vm-1']
+
+        self.assertEqual(output, expected)
+
+    @patch.object(warm_pool, 'pooled_vms')
+    def test_claim_empty(self, fake_pooled_vms):
+        """``claim`` returns None when the pool is empty"""
+        fake_pooled_vms.return_value = {}
+
+        output = warm_pool.claim(MagicMock(), '1.1.8', 'alice', 'myRouter', [], MagicMock())
+
+        self.assertTrue(output is None)
+
+    @patch.object(warm_pool.virtual_machine, 'power')
+    @patch.object(warm_pool.linked_clone, 'nic_specs')
+    @patch.object(warm_pool, 'consume_task')
+    @patch.object(warm_pool, '_take')
+    @patch.object(warm_pool, 'pooled_vms')
+    def test_claim(self, fake_pooled_vms, fake_take, fake_consume_task, fake_nic_specs, fake_power):
+        """``claim`` renames, moves and powers on a pooled VM"""
+        fake_vm = MagicMock()
+        fake_nic_specs.return_value = []
+        fake_pooled_vms.return_value = {fake_vm: {'name': 'pool-1.1.8-abcd'}}
+        fake_take.return_value = True
+
+        output = warm_pool.claim(MagicMock(), '1.1.8', 'alice', 'myRouter', [], MagicMock())
+
+        self.assertTrue(output is fake_vm)
+        fake_vm.Rename_Task.assert_called_with(newName='myRouter')
+        self.assertTrue(fake_power.called)
+
+    @patch.object(warm_pool, 'consume_task')
+    @patch.object(warm_pool, '_take')
+    @patch.object(warm_pool, 'pooled_vms')
+    def test_claim_lost_race(self, fake_pooled_vms, fake_take, fake_consume_task):
+        """``claim`` returns None when other workers claimed every pooled VM first"""
+        fake_pooled_vms.return_value = {MagicMock(): {'name': 'pool-1.1.8-abcd'}}
+        fake_take.return_value = False
+
+        output = warm_pool.claim(MagicMock(), '1.1.8', 'alice', 'myRouter', [], MagicMock())
+
+        self.assertTrue(output is None)
+
+    @patch.object(warm_pool.linked_clone, 'nic_specs')
+    @patch.object(warm_pool, 'consume_task')
+    @patch.object(warm_pool, '_take')
+    @patch.object(warm_pool, 'pooled_vms')
+    def test_claim_failure(self, fake_pooled_vms, fake_take, fake_consume_task, fake_nic_specs):
+        """``claim`` destroys the claimed VM if it cannot be setup for the user"""
+        fake_vm = MagicMock()
+        fake_pooled_vms.return_value = {fake_vm: {'name': 'pool-1.1.8-abcd'}}
+        fake_take.return_value = True
+        fake_nic_specs.side_effect = RuntimeError('testing')
+
+        with self.assertRaises(RuntimeError):
+            warm_pool.claim(MagicMock(), '1.1.8', 'alice', 'myRouter', [], MagicMock())
+
+        self.assertTrue(fake_vm.Destroy_Task.called)
+
+    def test_claim_bad_name(self):
+        """``claim`` raises ValueError for an invalid machine name"""
+        with self.assertRaises(ValueError):
+            warm_pool.claim(MagicMock(), '1.1.8', 'alice', 'my_router!', [], MagicMock())
+
+    @patch.object(warm_pool, 'consume_task')
+    def test_take(self, fake_consume_task):
+        """``_take`` reconfigures the VM with the changeVersion it was read with"""
+        fake_vm = MagicMock()
+
+        output = warm_pool._take(fake_vm, {'config.annotation': POOLED_META, 'config.changeVersion': 'v1'}, 'alice')
+        spec = fake_vm.ReconfigVM_Task.call_args[0][0]
+
+        self.assertTrue(output)
+        self.assertEqual(spec.changeVersion, 'v1')
+
+    @patch.object(warm_pool, 'consume_task')
+    def test_take_conflict(self, fake_consume_task):
+        """``_take`` returns False when another worker changed the VM first"""
+        fake_consume_task.side_effect = RuntimeError('The operation is not allowed in the current state.')
+
+        output = warm_pool._take(MagicMock(), {'config.annotation': POOLED_META, 'config.changeVersion': 'v1'}, 'alice')
+
+        self.assertFalse(output)
+
+    @patch.object(warm_pool, 'network_index')
+    @patch.object(warm_pool.virtual_machine, 'set_meta')
+    @patch.object(warm_pool, '_deploy')
+    @patch.object(warm_pool, 'ova_index')
+    @patch.object(warm_pool, 'retrieve_folder')
+    def test_replenish(self, fake_retrieve_folder, fake_ova_index, fake_deploy, fake_set_meta, fake_network_index):
+        """``replenish`` deploys enough VMs to fill the pool"""
+        fake_retrieve_folder.return_value = ({'vm-1': {'name': 'pool-1.1.8-abcd'}}, {})
+        fake_ova_index.lookup.return_value = {'networks': ['frontend', 'backend']}
+        fake_vcenter = MagicMock()
+        fake_network_index.lookup.return_value = {warm_pool.const.VLAB_ROUTER_WARM_POOL_NETWORK: warm_pool.vim.Network('net-1')}
+
+        with patch.object(warm_pool, 'const', warm_pool.const._replace(VLAB_ROUTER_WARM_POOL_SIZE=3)):
+            output = warm_pool.replenish(fake_vcenter, {'1.1.8': 'router-vyos-1.1.8.ova'}, MagicMock())
+        expected = {'1.1.8': 2}
+
+        self.assertEqual(output, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,210 @@
+# -*- coding: UTF-8 -*-
+"""
+A suite of tests for the functions in worker_engine.py
+"""
+import time
+import asyncio
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+from concurrent.futures import ThreadPoolExecutor
+
+from vlab_router_api.lib.worker import worker_engine
+
+
+class TestThreadEngine(unittest.TestCase):
+    """A set of test cases for the ThreadEngine object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.engine = worker_engine.ThreadEngine(fast_threads=2, slow_threads=2)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        self.engine.stop()
+
+    def test_run(self):
+        """``ThreadEngine.run`` returns what the call returns"""
+        output = self.engine.run('router.show', lambda x, y=0: x + y, 1, y=2)
+
+        self.assertEqual(output, 3)
+
+    def test_run_raises(self):
+        """``ThreadEngine.run`` raises what the call raises"""
+        def fail():
+            raise ValueError('testing')
+
+        with self.assertRaises(ValueError):
+            self.engine.run('router.show', fail)
+
+    def test_run_other_thread(self):
+        """``ThreadEngine.run`` runs the call on the executor, not the caller's thread"""
+        output = self.engine.run('router.show', threading.get_ident)
+
+        self.assertNotEqual(output, threading.get_ident())
+
+    def test_run_bounded(self):
+        """``ThreadEngine.run`` never runs more calls of a class at once than it has threads"""
+        lock = threading.Lock()
+        running = []
+        most = []
+        def call():
+            with lock:
+                running.append(1)
+                most.append(len(running))
+            time.sleep(0.02)
+            with lock:
+                running.pop()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            for future in [executor.submit(self.engine.run, 'router.create', call) for _ in range(8)]:
+                future.result()
+
+        self.assertEqual(max(most), 2)
+
+    def test_run_fast_not_blocked(self):
+        """``ThreadEngine.run`` runs reads while every slow thread is busy deploying"""
+        release = threading.Event()
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            deploys = [executor.submit(self.engine.run, 'router.create', release.wait, 5) for _ in range(2)]
+            started = time.time()
+            output = self.engine.run('router.show', lambda: 'shown')
+            waited = time.time() - started
+            release.set()
+            for deploy in deploys:
+                deploy.result()
+
+        self.assertEqual(output, 'shown')
+        self.assertLess(waited, 1)
+
+    def test_stop(self):
+        """``ThreadEngine.run`` makes new executors after a stop"""
+        self.engine.run('router.show', lambda: None)
+        self.engine.stop()
+        output = self.engine.run('router.show', lambda: 'again')
+
+        self.assertEqual(output, 'again')
+
+
+class TestAsyncioEngine(unittest.TestCase):
+    """A set of test cases for the AsyncioEngine object"""
+
+    def setUp(self):
+        """Runs before every test case"""
+        self.engine = worker_engine.AsyncioEngine(fast_threads=2, slow_threads=2)
+
+    def tearDown(self):
+        """Runs after every test case"""
+        self.engine.stop()
+
+    def test_run_coroutine(self):
+        """``AsyncioEngine.run`` runs the coroutine of a vmware function on the event loop"""
+        async def show_router(call, username):
+            return 'shown {}'.format(username)
+        fake_func = MagicMock()
+
+        with patch.dict(worker_engine.async_vmware.COROUTINES, {fake_func: show_router}):
+            output = self.engine.run('router.show', fake_func, 'bob')
+
+        self.assertEqual(output, 'shown bob')
+        self.assertFalse(fake_func.called)
+
+    def test_run_coroutine_steps(self):
+        """``AsyncioEngine.run`` gives the coroutine a way to run blocking steps on the executor"""
+        async def show_router(call):
+            return await call(threading.current_thread)
+        fake_func = MagicMock()
+
+        with patch.dict(worker_engine.async_vmware.COROUTINES, {fake_func: show_router}):
+            output = self.engine.run('router.show', fake_func)
+
+        self.assertTrue(output.name.startswith('engine-fast'))
+
+    def test_run_coroutine_raises(self):
+        """``AsyncioEngine.run`` raises what the coroutine raises"""
+        async def create_router(call):
+            raise ValueError('testing')
+        fake_func = MagicMock()
+
+        with patch.dict(worker_engine.async_vmware.COROUTINES, {fake_func: create_router}):
+            with self.assertRaises(ValueError):
+                self.engine.run('router.create', fake_func)
+
+    def test_run_no_coroutine(self):
+        """``AsyncioEngine.run`` runs a function without a coroutine on the executor"""
+        output = self.engine.run('router.delete', threading.current_thread)
+
+        self.assertTrue(output.name.startswith('engine-slow'))
+
+    def test_run_many_waiting(self):
+        """``AsyncioEngine.run`` has more coroutines waiting at once than it has threads"""
+        lock = threading.Lock()
+        waiting = []
+        async def create_router(call):
+            with lock:
+                waiting.append(1)
+            await asyncio.sleep(0.2)
+            return len(waiting)
+        fake_func = MagicMock()
+
+        with patch.dict(worker_engine.async_vmware.COROUTINES, {fake_func: create_router}):
+            with ThreadPoolExecutor(max_workers=10) as executor:
+                output = list(executor.map(lambda _: self.engine.run('router.create', fake_func), range(10)))
+
+        self.assertEqual(max(output), 10)
+
+
+class TestEngines(unittest.TestCase):
+    """A set of test cases for picking and setting up an engine"""
+
+    def test_make_engine_prefork(self):
+        """``make_engine`` returns a DirectEngine for prefork"""
+        output = worker_engine.make_engine('prefork')
+
+        self.assertTrue(isinstance(output, worker_engine.DirectEngine))
+
+    def test_make_engine_threads(self):
+        """``make_engine`` returns a ThreadEngine for threads"""
+        output = worker_engine.make_engine('threads')
+
+        self.assertTrue(isinstance(output, worker_engine.ThreadEngine))
+
+    def test_make_engine_asyncio(self):
+        """``make_engine`` returns an AsyncioEngine for asyncio"""
+        output = worker_engine.make_engine('asyncio')
+
+        self.assertTrue(isinstance(output, worker_engine.AsyncioEngine))
+
+    def test_make_engine_unknown(self):
+        """``make_engine`` raises ValueError for an unknown engine"""
+        with self.assertRaises(ValueError):
+            worker_engine.make_engine('gevent')
+
+    @patch.object(worker_engine, 'const', worker_engine.const._replace(VLAB_ROUTER_WORKER_ENGINE='threads'))
+    def test_configure(self):
+        """``configure`` switches the Celery worker to the thread pool for threads"""
+        fake_app = MagicMock()
+        worker_engine.configure(fake_app)
+
+        fake_app.conf.update.assert_called_with(worker_pool='threads',
+                                                worker_concurrency=worker_engine.const.VLAB_ROUTER_WORKER_THREADS)
+
+    @patch.object(worker_engine, 'const', worker_engine.const._replace(VLAB_ROUTER_WORKER_ENGINE='asyncio'))
+    def test_configure_asyncio(self):
+        """``configure`` switches the Celery worker to the thread pool for asyncio"""
+        fake_app = MagicMock()
+        worker_engine.configure(fake_app)
+
+        fake_app.conf.update.assert_called_with(worker_pool='threads',
+                                                worker_concurrency=worker_engine.const.VLAB_ROUTER_WORKER_THREADS)
+
+    def test_configure_prefork(self):
+        """``configure`` leaves the Celery worker alone for prefork"""
+        fake_app = MagicMock()
+        worker_engine.configure(fake_app)
+
+        self.assertFalse(fake_app.conf.update.called)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,16 +1,16 @@
 # -*- coding: UTF-8 -*-
 from flask import Flask
-from celery import Celery
 
-from vlab_router_api.lib import const
-from vlab_router_api.lib.views import HealthView, RouterView
+from vlab_router_api.lib.celery_config import make_celery
+from vlab_router_api.lib.views import HealthView, RouterView, MetricsView
 
 app = Flask(__name__)
-app.celery_app = Celery('router', backend='rpc://', broker=const.VLAB_MESSAGE_BROKER)
+app.celery_app = make_celery()
 app.celery_app.conf.broker_heartbeat = 0 #https://github.com/celery/celery/issues/4895
 
 HealthView.register(app)
 RouterView.register(app)
+MetricsView.register(app)
 
 
 if __name__ == '__main__':
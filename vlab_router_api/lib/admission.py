@@ -0,0 +1,255 @@
+# -*- coding: UTF-8 -*-
+"""
+Bounds how many Routers are being deployed at once, so a burst of creates
+can't overload vCenter and slow down everyone's deploy.
+
+Every create holds one lease per Router in two scopes: the user, capped at
+``VLAB_ROUTER_MAX_DEPLOYS_PER_USER``, and the vCenter, capped at
+``VLAB_ROUTER_MAX_DEPLOYS``. The cap is for the whole vCenter, not one
+datastore: the API takes the leases before it sends the task, and only the
+worker knows which of ``VLAB_ROUTER_DATASTORES`` a Router lands on (see
+``placement``, which spreads deploys over them). The API answers with an HTTP
+429 when either scope is full. The worker gives
+them back when the task ends. A lease also expires after
+``VLAB_ROUTER_LEASE_TTL`` seconds, so a worker that died doesn't leak it.
+
+Leases live in the Redis result backend, so every replica of the API and every
+worker share them. With any other backend they're files in
+``VLAB_ROUTER_ADMISSION_DIR``, which the API and the workers must share.
+"""
+import os
+import time
+import fcntl
+from urllib.parse import quote
+from collections import OrderedDict
+
+from vlab_api_common import get_logger
+
+from vlab_router_api.lib import const
+from vlab_router_api.lib.celery_config import redis_client
+
+
+logger = get_logger(__name__, loglevel=const.VLAB_ROUTER_LOG_LEVEL)
+KEY_PREFIX = 'vlab-router-lease-'
+# Takes the leases of every scope, or none of them. Returns 0, or the number of the full scope
+ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local expires = tonumber(ARGV[2])
+local count = tonumber(ARGV[3])
+local holder = ARGV[4]
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+    if redis.call('ZCARD', key) + count > tonumber(ARGV[4 + i]) then
+        return i
+    end
+end
+for _, key in ipairs(KEYS) do
+    for n = 1, count do
+        redis.call('ZADD', key, expires, holder .. '/' .. n)
+    end
+    redis.call('EXPIREAT', key, math.ceil(expires))
+end
+return 0
+"""
+
+
+class Busy(RuntimeError):
+    """Too many Routers are being deployed; try again later
+
+    :param scope: The scope that's full
+    :type scope: String
+
+    :param retry_after: How many seconds until trying again is worth it
+    :type retry_after: Integer
+    """
+    def __init__(self, scope, retry_after):
+        super(Busy, self).__init__('Too many Routers are being deployed for {}'.format(scope))
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class Leases(object):
+    """Counted leases, shared by every process that uses the same backend
+
+    :param directory: Where to keep leases when the result backend isn't Redis
+    :type directory: String
+
+    :param ttl: How many seconds until an unreturned lease expires
+    :type ttl: Integer
+    """
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+
+    def acquire(self, celery_app, holder, count, caps):
+        """Take ``count`` leases in every scope, or none if any scope is full
+
+        :Returns: None, or the name of the scope that's full
+
+        :param celery_app: The Celery app of the Router service
+        :type celery_app: celery.Celery
+
+        :param holder: Who takes the leases, like the ID of a task
+        :type holder: String
+
+        :param count: How many leases to take
+        :type count: Integer
+
+        :param caps: Mapping of scope -> the most leases it has
+        :type caps: collections.OrderedDict
+        """
+        client = redis_client(celery_app)
+        if client is not None:
+            now = time.time()
+            keys = [KEY_PREFIX + x for x in caps.keys()]
+            args = [now, now + self.ttl, count, holder] + list(caps.values())
+            full = client.eval(ACQUIRE_SCRIPT, len(keys), *(keys + args))
+            if not full:
+                return None
+            return list(caps.keys())[int(full) - 1]
+        with self._locked():
+            for scope, cap in caps.items():
+                if len(self._files(scope)) + count > cap:
+                    return scope
+            expires = str(time.time() + self.ttl)
+            for scope in caps.keys():
+                for n in range(1, count + 1):
+                    with open(os.path.join(self._scope_dir(scope), '{}.{}'.format(holder, n)), 'w') as the_file:
+                        the_file.write(expires)
+        return None
+
+    def release(self, celery_app, holder, count, scopes):
+        """Give back the leases of a holder
+
+        :Returns: None
+
+        :param celery_app: The Celery app of the Router service
+        :type celery_app: celery.Celery
+
+        :param holder: Who took the leases
+        :type holder: String
+
+        :param count: How many leases were taken
+        :type count: Integer
+
+        :param scopes: The scopes the leases were taken in
+        :type scopes: List
+        """
+        client = redis_client(celery_app)
+        members = ['{}/{}'.format(holder, n) for n in range(1, count + 1)]
+        for scope in scopes:
+            if client is not None:
+                client.zrem(KEY_PREFIX + scope, *members)
+                continue
+            for n in range(1, count + 1):
+                try:
+                    os.unlink(os.path.join(self._scope_dir(scope), '{}.{}'.format(holder, n)))
+                except FileNotFoundError:
+                    pass
+
+    def _scope_dir(self, scope):
+        path = os.path.join(self.directory, quote(scope, safe=''))
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _files(self, scope):
+        """The leases of a scope that haven't expired; deletes the ones that have"""
+        scope_dir = self._scope_dir(scope)
+        now = time.time()
+        alive = []
+        for name in os.listdir(scope_dir):
+            path = os.path.join(scope_dir, name)
+            try:
+                with open(path) as the_file:
+                    expires = float(the_file.read() or 0)
+            except (OSError, ValueError):
+                continue
+            if expires < now:
+                os.unlink(path)
+            else:
+                alive.append(name)
+        return alive
+
+    def _locked(self):
+        """Serialize the file based leases across processes"""
+        os.makedirs(self.directory, exist_ok=True)
+        return _FileLock(os.path.join(self.directory, '.lock'))
+
+
+class _FileLock(object):
+    """An exclusive ``flock``, held for the life of a ``with`` block"""
+    def __init__(self, path):
+        self.path = path
+        self._handle = None
+
+    def __enter__(self):
+        self._handle = open(self.path, 'a')
+        fcntl.flock(self._handle, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc_value, the_traceback):
+        fcntl.flock(self._handle, fcntl.LOCK_UN)
+        self._handle.close()
+
+
+leases = Leases(directory=const.VLAB_ROUTER_ADMISSION_DIR, ttl=const.VLAB_ROUTER_LEASE_TTL)
+
+
+def _caps(username):
+    """The scopes a deploy for a user counts against, and their caps"""
+    return OrderedDict([('user:{}'.format(username), const.VLAB_ROUTER_MAX_DEPLOYS_PER_USER),
+                        ('vcenter:{}'.format(const.INF_VCENTER_SERVER), const.VLAB_ROUTER_MAX_DEPLOYS)])
+
+
+def _leases_for(count):
+    """A bulk create only deploys ``VLAB_ROUTER_BULK_CONCURRENCY`` Routers at a time"""
+    return min(count, const.VLAB_ROUTER_BULK_CONCURRENCY)
+
+
+def admit(celery_app, username, count=1):
+    """Make a function that takes the deploy leases for a new task
+
+    :Returns: Function, that raises Busy when the deploy must wait. Its ``release``
+              attribute gives the leases back, for a task that never got sent.
+
+    :param celery_app: The Celery app of the Router service
+    :type celery_app: celery.Celery
+
+    :param username: The user creating the Routers
+    :type username: String
+
+    :param count: How many Routers the task creates
+    :type count: Integer
+    """
+    count = _leases_for(count)
+    def take(task_id):
+        full = leases.acquire(celery_app, task_id, count, _caps(username))
+        if full is not None:
+            logger.info('Refused {} deploys for {}; {} is full'.format(count, username, full))
+            raise Busy(full, const.VLAB_ROUTER_RETRY_AFTER)
+    take.release = lambda task_id: release(celery_app, username, task_id, count)
+    return take
+
+
+def release(celery_app, username, task_id, count=1):
+    """Give back the deploy leases of a task that's done
+
+    :Returns: None
+
+    :param celery_app: The Celery app of the Router service
+    :type celery_app: celery.Celery
+
+    :param username: The user who created the Routers
+    :type username: String
+
+    :param task_id: The ID of the task
+    :type task_id: String
+
+    :param count: How many Routers the task created
+    :type count: Integer
+    """
+    try:
+        leases.release(celery_app, task_id, _leases_for(count), list(_caps(username).keys()))
+    except Exception as doh:
+        # The leases expire on their own
+        logger.error('Unable to release the deploy leases of task {}: {}'.format(task_id, doh))
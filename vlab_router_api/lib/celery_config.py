@@ -0,0 +1,81 @@
+# -*- coding: UTF-8 -*-
+"""
+The Celery app shared by the API and the worker, so both agree on where task
+results live and how they're encoded.
+
+Results go to ``VLAB_ROUTER_RESULT_BACKEND``, which any replica of the API can
+read from (unlike ``rpc://``, which only delivers a result to the process that
+sent the task). Results expire after ``VLAB_ROUTER_RESULT_TTL`` seconds, so
+the backend doesn't grow forever.
+
+Tasks are routed by how long they take. Reads (show, image) go to
+``VLAB_ROUTER_FAST_QUEUE`` and deploys/deletes go to ``VLAB_ROUTER_SLOW_QUEUE``,
+each consumed by its own pool of workers, so a burst of creates never makes a
+show wait behind it. Slow tasks are acknowledged once they finish, so a worker
+process only ever holds the one message it's running.
+"""
+from celery import Celery
+from kombu import Queue
+
+from vlab_router_api.lib import const
+
+
+MAX_PRIORITY = 9
+FAST_TASKS = ('router.show', 'router.image')
+# Deletes free up resources, so they go ahead of creates waiting in the same queue
+SLOW_TASKS = {'router.delete': 7,
+              'router.delete_many': 7,
+              'router.create': 5,
+              'router.create_many': 4,
+              'router.replenish_pool': 0,
+             }
+
+
+def task_routes():
+    """Map each task to its queue, and its priority in that queue
+
+    :Returns: Dictionary
+    """
+    routes = {}
+    for name in FAST_TASKS:
+        routes[name] = {'queue': const.VLAB_ROUTER_FAST_QUEUE, 'priority': 5}
+    for name, priority in SLOW_TASKS.items():
+        routes[name] = {'queue': const.VLAB_ROUTER_SLOW_QUEUE, 'priority': priority}
+    return routes
+
+
+def make_celery():
+    """Create the Celery app for the Router service
+
+    :Returns: celery.Celery
+    """
+    app = Celery('router', backend=const.VLAB_ROUTER_RESULT_BACKEND, broker=const.VLAB_MESSAGE_BROKER)
+    app.conf.update(task_serializer='json',
+                    result_serializer='json',
+                    accept_content=['json'],
+                    result_expires=const.VLAB_ROUTER_RESULT_TTL,
+                    # Inventories are mostly repeated keys; they shrink a lot
+                    result_compression=const.VLAB_ROUTER_RESULT_COMPRESSION or None,
+                    # Don't store the args of every task next to its result
+                    result_extended=False,
+                    task_queues=[Queue(x, routing_key=x, queue_arguments={'x-max-priority': MAX_PRIORITY})
+                                 for x in (const.VLAB_ROUTER_FAST_QUEUE, const.VLAB_ROUTER_SLOW_QUEUE)],
+                    task_default_queue=const.VLAB_ROUTER_FAST_QUEUE,
+                    task_routes=task_routes(),
+                    task_queue_max_priority=MAX_PRIORITY,
+                    # A worker busy deploying shouldn't sit on messages another could run;
+                    # without acks_late, each process would still reserve one more
+                    worker_prefetch_multiplier=1,
+                    task_annotations={name: {'acks_late': True} for name in SLOW_TASKS})
+    return app
+
+
+def redis_client(celery_app):
+    """The Redis client of the result backend, if the backend is Redis
+
+    :Returns: redis.Redis, or None
+
+    :param celery_app: The Celery app of the Router service
+    :type celery_app: celery.Celery
+    """
+    return getattr(celery_app.backend, 'client', None)
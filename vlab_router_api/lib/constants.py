@@ -24,6 +24,58 @@ DEFINED = OrderedDict([
             ('VLAB_URL', environ.get('VLAB_URL', 'https://localhost')),
             ('VLAB_ROUTER_IMAGES_DIR', environ.get('VLAB_ROUTER_IMAGES_DIR', '/images')),
             ('VLAB_VERIFY_TOKEN', environ.get('VLAB_VERIFY_TOKEN', False)),
+            ('VLAB_VCENTER_POOL_SIZE', int(environ.get('VLAB_VCENTER_POOL_SIZE', 4))),
+            ('VLAB_VCENTER_SESSION_IDLE', int(environ.get('VLAB_VCENTER_SESSION_IDLE', 1500))),
+            ('VLAB_VCENTER_SESSION_CHECK', int(environ.get('VLAB_VCENTER_SESSION_CHECK', 60))),
+            ('VLAB_ROUTER_INVENTORY_DIR', environ.get('VLAB_ROUTER_INVENTORY_DIR', '/tmp/router-inventory')),
+            ('VLAB_ROUTER_INVENTORY_TTL', int(environ.get('VLAB_ROUTER_INVENTORY_TTL', 30))),
+            ('VLAB_ROUTER_INVENTORY_WATCH', environ.get('VLAB_ROUTER_INVENTORY_WATCH', False)),
+            ('VLAB_ROUTER_SHOW_INCREMENTAL', environ.get('VLAB_ROUTER_SHOW_INCREMENTAL', False)),
+            ('VLAB_ROUTER_SHOW_VIEWS', int(environ.get('VLAB_ROUTER_SHOW_VIEWS', 256))),
+            ('VLAB_ROUTER_META_INDEX_USERS', int(environ.get('VLAB_ROUTER_META_INDEX_USERS', 1000))),
+            ('VLAB_ROUTER_INLINE_IMAGES', environ.get('VLAB_ROUTER_INLINE_IMAGES', False)),
+            ('VLAB_ROUTER_OVA_INDEX', environ.get('VLAB_ROUTER_OVA_INDEX', '/tmp/router-ova-index.json')),
+            ('VLAB_ROUTER_IMAGE_CACHE_DIR', environ.get('VLAB_ROUTER_IMAGE_CACHE_DIR', '/tmp/router-image-cache')),
+            ('VLAB_ROUTER_IMAGE_CACHE_MB', int(environ.get('VLAB_ROUTER_IMAGE_CACHE_MB', 20480))),
+            ('VLAB_ROUTER_DEPLOY_MODE', environ.get('VLAB_ROUTER_DEPLOY_MODE', 'ova')),
+            ('VLAB_ROUTER_TEMPLATE_FOLDER', environ.get('VLAB_ROUTER_TEMPLATE_FOLDER', 'router_templates')),
+            ('VLAB_ROUTER_WARM_POOL_SIZE', int(environ.get('VLAB_ROUTER_WARM_POOL_SIZE', 0))),
+            ('VLAB_ROUTER_WARM_POOL_FOLDER', environ.get('VLAB_ROUTER_WARM_POOL_FOLDER', 'router_warm_pool')),
+            ('VLAB_ROUTER_WARM_POOL_NETWORK', environ.get('VLAB_ROUTER_WARM_POOL_NETWORK', 'router_warm_pool')),
+            ('VLAB_ROUTER_WARM_POOL_INTERVAL', int(environ.get('VLAB_ROUTER_WARM_POOL_INTERVAL', 300))),
+            ('VLAB_ROUTER_WORKER_ENGINE', environ.get('VLAB_ROUTER_WORKER_ENGINE', 'prefork')),
+            ('VLAB_ROUTER_WORKER_THREADS', int(environ.get('VLAB_ROUTER_WORKER_THREADS', 200))),
+            ('VLAB_ROUTER_FAST_THREADS', int(environ.get('VLAB_ROUTER_FAST_THREADS', 16))),
+            ('VLAB_ROUTER_SLOW_THREADS', int(environ.get('VLAB_ROUTER_SLOW_THREADS', 16))),
+            ('VLAB_ROUTER_TASK_POLL', float(environ.get('VLAB_ROUTER_TASK_POLL', 1))),
+            ('VLAB_ROUTER_BULK_CONCURRENCY', int(environ.get('VLAB_ROUTER_BULK_CONCURRENCY', 4))),
+            ('VLAB_ROUTER_BULK_MAX', int(environ.get('VLAB_ROUTER_BULK_MAX', 100))),
+            ('VLAB_ROUTER_DELETE_POLL', int(environ.get('VLAB_ROUTER_DELETE_POLL', 5))),
+            ('VLAB_ROUTER_DELETE_TIMEOUT', int(environ.get('VLAB_ROUTER_DELETE_TIMEOUT', 600))),
+            ('VLAB_ROUTER_DESTROY_CONCURRENCY', int(environ.get('VLAB_ROUTER_DESTROY_CONCURRENCY', 8))),
+            ('VLAB_ROUTER_UPLOAD_STREAMS', int(environ.get('VLAB_ROUTER_UPLOAD_STREAMS', 4))),
+            ('VLAB_ROUTER_UPLOAD_RETRIES', int(environ.get('VLAB_ROUTER_UPLOAD_RETRIES', 3))),
+            ('VLAB_ROUTER_NETWORK_INDEX_SIZE', int(environ.get('VLAB_ROUTER_NETWORK_INDEX_SIZE', 10000))),
+            ('VLAB_ROUTER_NETWORK_INDEX_TTL', int(environ.get('VLAB_ROUTER_NETWORK_INDEX_TTL', 300))),
+            ('VLAB_ROUTER_GZIP_MIN_SIZE', int(environ.get('VLAB_ROUTER_GZIP_MIN_SIZE', 1024))),
+            ('VLAB_ROUTER_EVENTS_POLL', float(environ.get('VLAB_ROUTER_EVENTS_POLL', 0.5))),
+            ('VLAB_ROUTER_EVENTS_TIMEOUT', int(environ.get('VLAB_ROUTER_EVENTS_TIMEOUT', 5))),
+            ('VLAB_ROUTER_RESULT_BACKEND', environ.get('VLAB_ROUTER_RESULT_BACKEND', 'redis://router-results:6379/0')),
+            ('VLAB_ROUTER_RESULT_TTL', int(environ.get('VLAB_ROUTER_RESULT_TTL', 3600))),
+            ('VLAB_ROUTER_RESULT_COMPRESSION', environ.get('VLAB_ROUTER_RESULT_COMPRESSION', 'zlib')),
+            ('VLAB_ROUTER_FAST_QUEUE', environ.get('VLAB_ROUTER_FAST_QUEUE', 'router_fast')),
+            ('VLAB_ROUTER_SLOW_QUEUE', environ.get('VLAB_ROUTER_SLOW_QUEUE', 'router_slow')),
+            ('VLAB_ROUTER_DEDUPE_WINDOW', int(environ.get('VLAB_ROUTER_DEDUPE_WINDOW', 600))),
+            ('VLAB_ROUTER_SHOW_COALESCE', int(environ.get('VLAB_ROUTER_SHOW_COALESCE', 60))),
+            ('VLAB_ROUTER_MAX_DEPLOYS_PER_USER', int(environ.get('VLAB_ROUTER_MAX_DEPLOYS_PER_USER', 4))),
+            ('VLAB_ROUTER_MAX_DEPLOYS', int(environ.get('VLAB_ROUTER_MAX_DEPLOYS', 16))),
+            ('VLAB_ROUTER_LEASE_TTL', int(environ.get('VLAB_ROUTER_LEASE_TTL', 1800))),
+            ('VLAB_ROUTER_RETRY_AFTER', int(environ.get('VLAB_ROUTER_RETRY_AFTER', 30))),
+            ('VLAB_ROUTER_ADMISSION_DIR', environ.get('VLAB_ROUTER_ADMISSION_DIR', '/tmp/router-admission')),
+            ('VLAB_ROUTER_DATASTORES', environ.get('VLAB_ROUTER_DATASTORES', environ.get('INF_VCENTER_DATASTORE', 'VM-Storage')).split(',')),
+            ('VLAB_ROUTER_RESOURCE_POOLS', environ.get('VLAB_ROUTER_RESOURCE_POOLS', environ.get('INF_VCENTER_RESORUCE_POOL', 'Resources')).split(',')),
+            ('VLAB_ROUTER_PLACEMENT_TTL', int(environ.get('VLAB_ROUTER_PLACEMENT_TTL', 30))),
+            ('VLAB_ROUTER_METRICS_DIR', environ.get('VLAB_ROUTER_METRICS_DIR', '/tmp/router-metrics')),
           ])
 
 Constants = namedtuple('Constants', list(DEFINED.keys()))
@@ -0,0 +1,221 @@
+# -*- coding: UTF-8 -*-
+"""
+Stops retried requests from starting the same work twice.
+
+Clients retry a POST or DELETE when it times out. Each submission is keyed by
+the user, the task, the ``X-REQUEST-ID`` and a hash of the payload; a repeat
+within ``VLAB_ROUTER_DEDUPE_WINDOW`` seconds gets the task ID of the first one
+instead of a new task. Shows are coalesced the same way, minus the request ID,
+for as long as the first show is still running.
+
+The keys live in the Redis result backend, so every replica of the API sees
+them. With any other backend, each API process keeps its own keys.
+"""
+import time
+import hashlib
+import threading
+from uuid import uuid4
+
+import ujson
+from vlab_api_common import get_logger
+
+from vlab_router_api.lib import const
+from vlab_router_api.lib.celery_config import redis_client
+
+
+logger = get_logger(__name__, loglevel=const.VLAB_ROUTER_LOG_LEVEL)
+KEY_PREFIX = 'vlab-router-submit-'
+
+
+def make_key(username, task_name, txn_id='', payload=None):
+    """Identify a submission
+
+    :Returns: String
+
+    :param username: The user making the request
+    :type username: String
+
+    :param task_name: The Celery task the request starts, like router.create
+    :type task_name: String
+
+    :param txn_id: The X-REQUEST-ID of the request
+    :type txn_id: String
+
+    :param payload: The arguments of the task
+    :type payload: Object
+    """
+    digest = hashlib.sha1(ujson.dumps([username, task_name, txn_id, payload], sort_keys=True).encode())
+    return KEY_PREFIX + digest.hexdigest()
+
+
+class Deduper(object):
+    """Remembers which task was started for a submission
+
+    :param window: How many seconds to remember a submission for
+    :type window: Integer
+    """
+    def __init__(self, window):
+        self.window = window
+        self._local = {}
+        self._lock = threading.Lock()
+
+    def submit(self, celery_app, key, task_name, args, ttl=None, reuse=None, admit=None):
+        """Send a task, unless the same submission already sent one
+
+        :Returns: String, the ID of the task
+
+        :param celery_app: The Celery app to send the task with
+        :type celery_app: celery.Celery
+
+        :param key: Identifies the submission, see ``make_key``
+        :type key: String
+
+        :param task_name: The task to send
+        :type task_name: String
+
+        :param args: The arguments of the task
+        :type args: List
+
+        :param ttl: How long to remember the submission. Defaults to the window.
+        :type ttl: Integer
+
+        :param reuse: Decides if the task of an earlier submission should be reused
+        :type reuse: Function
+
+        :param admit: Called with the ID of a new task before it's sent; raises to refuse it.
+                      Its ``release`` attribute, if any, is called when the task then can't be sent.
+        :type admit: Function
+        """
+        ttl = ttl or self.window
+        task_id = str(uuid4())
+        existing = self._claim(celery_app, key, task_id, ttl)
+        if existing is not None:
+            if reuse is None or reuse(existing):
+                logger.info('Reusing task {} for duplicate submission of {}'.format(existing, task_name))
+                return existing
+            # The earlier task is done; this submission gets a task of its own
+            self._store(celery_app, key, task_id, ttl)
+        try:
+            return _send(celery_app, task_name, args, task_id, admit)
+        except Exception:
+            self.forget(celery_app, key)
+            raise
+
+    def forget(self, celery_app, key):
+        """Stop deduplicating a submission
+
+        :Returns: None
+        """
+        client = redis_client(celery_app)
+        if client is not None:
+            client.delete(key)
+        else:
+            with self._lock:
+                self._local.pop(key, None)
+
+    def _claim(self, celery_app, key, task_id, ttl):
+        """Record ``task_id`` for ``key``, unless another task already has it
+
+        :Returns: The ID of the task that already had the key, or None
+        """
+        client = redis_client(celery_app)
+        if client is not None:
+            if client.set(key, task_id, nx=True, ex=ttl):
+                return None
+            existing = client.get(key)
+            if existing is None:
+                # Expired between the calls
+                return self._claim(celery_app, key, task_id, ttl)
+            return existing.decode() if isinstance(existing, bytes) else existing
+        now = time.time()
+        with self._lock:
+            for stale in [k for k, (_, expires) in self._local.items() if expires < now]:
+                del self._local[stale]
+            entry = self._local.get(key)
+            if entry is not None:
+                return entry[0]
+            self._local[key] = (task_id, now + ttl)
+            return None
+
+    def _store(self, celery_app, key, task_id, ttl):
+        """Record ``task_id`` for ``key``, replacing whatever task had it"""
+        client = redis_client(celery_app)
+        if client is not None:
+            client.set(key, task_id, ex=ttl)
+        else:
+            with self._lock:
+                self._local[key] = (task_id, time.time() + ttl)
+
+
+def _send(celery_app, task_name, args, task_id, admit):
+    """Admit a new task and send it; if it can't be sent, give back what admitting it took
+
+    :Returns: String, the ID of the task
+    """
+    if admit is None:
+        return celery_app.send_task(task_name, args, task_id=task_id).id
+    admit(task_id)
+    try:
+        return celery_app.send_task(task_name, args, task_id=task_id).id
+    except Exception:
+        release = getattr(admit, 'release', None)
+        if release is not None:
+            release(task_id)
+        raise
+
+
+deduper = Deduper(window=const.VLAB_ROUTER_DEDUPE_WINDOW)
+
+
+def submit(celery_app, username, task_name, args, txn_id, payload, admit=None):
+    """Send a task, unless a retry of this request already did
+
+    :Returns: String, the ID of the task
+
+    :param celery_app: The Celery app to send the task with
+    :type celery_app: celery.Celery
+
+    :param username: The user making the request
+    :type username: String
+
+    :param task_name: The task to send
+    :type task_name: String
+
+    :param args: The arguments of the task
+    :type args: List
+
+    :param txn_id: The X-REQUEST-ID of the request
+    :type txn_id: String
+
+    :param payload: What makes this request unique, besides the request ID
+    :type payload: Object
+
+    :param admit: Called with the ID of a new task before it's sent; raises to refuse it.
+                  Its ``release`` attribute, if any, is called when the task then can't be sent.
+    :type admit: Function
+    """
+    if txn_id == 'noId':
+        # Without a request ID, two identical requests are two different asks
+        return _send(celery_app, task_name, args, str(uuid4()), admit)
+    key = make_key(username, task_name, txn_id, payload)
+    return deduper.submit(celery_app, key, task_name, args, admit=admit)
+
+
+def show(celery_app, username, txn_id):
+    """Send a router.show task, or join the one already running for the user
+
+    :Returns: String, the ID of the task
+
+    :param celery_app: The Celery app to send the task with
+    :type celery_app: celery.Celery
+
+    :param username: The user whose Routers to show
+    :type username: String
+
+    :param txn_id: The X-REQUEST-ID of the request
+    :type txn_id: String
+    """
+    key = make_key(username, 'router.show')
+    running = lambda task_id: not celery_app.AsyncResult(task_id).ready()
+    return deduper.submit(celery_app, key, 'router.show', [username, txn_id],
+                          ttl=const.VLAB_ROUTER_SHOW_COALESCE, reuse=running)
@@ -0,0 +1,57 @@
+# -*- coding: UTF-8 -*-
+"""
+An in-memory index of the Router images that can be deployed, so the API can
+answer without dispatching a task to a worker.
+"""
+import os
+import threading
+
+
+class ImageIndex(object):
+    """Lists the images in a directory, only re-reading the directory when its
+    modification time changes.
+
+    .. note::
+        The images directory is normally an NFS mount, where inotify does not see
+        changes made by other clients; a ``stat`` per request works everywhere and
+        costs a few microseconds.
+
+    :param directory: The directory that contains the OVA files
+    :type directory: String
+    """
+    def __init__(self, directory):
+        self.directory = directory
+        self._mtime = None
+        self._images = []
+        self._lock = threading.Lock()
+
+    def images(self):
+        """Obtain the available versions of Router
+
+        :Returns: List
+        """
+        mtime = os.stat(self.directory).st_mtime_ns
+        with self._lock:
+            if mtime != self._mtime:
+                images = os.listdir(self.directory)
+                self._images = [convert_name(x, to_version=True) for x in images]
+                self._mtime = mtime
+            return list(self._images)
+
+
+def convert_name(name, to_version=False):
+    """This function centralizes converting between the name of the OVA, and the
+    version of software it contains.
+
+    The naming convention is ``router-<software>-<version>.ova``, like router-vyos-1.1.8.ova
+
+    :param name: The thing to covert
+    :type name: String
+
+    :param to_version: Set to True to covert the name of an OVA to the version
+    :type to_version: Boolean
+    """
+    if to_version:
+        return name.split('-')[2].rstrip('.ova')
+    else:
+        return 'router-vyos-{}.ova'.format(name)
@@ -0,0 +1,264 @@
+# -*- coding: UTF-8 -*-
+"""
+Timing of the Celery tasks, and of the phases inside them, as Prometheus
+histograms.
+
+Every process records into memory, and writes a snapshot of its own numbers
+to ``VLAB_ROUTER_METRICS_DIR`` after each task. The metrics end point sums
+the snapshots of every process, so all the children of a prefork worker are
+reported together. Snapshots are named after the host and PID of the process,
+because containers sharing the directory each have their own PID namespace.
+When a worker starts, it deletes the snapshots its host left for processes
+that are no longer running; give each worker container a fixed hostname so a
+recreated one finds the snapshots of the container it replaced.
+"""
+import os
+import glob
+import time
+import socket
+import tempfile
+import threading
+from contextlib import contextmanager
+
+import ujson
+from vlab_api_common import get_logger
+
+from vlab_router_api.lib import const
+
+
+logger = get_logger(__name__, loglevel=const.VLAB_ROUTER_LOG_LEVEL)
+BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+TASK_METRIC = 'vlab_router_task_seconds'
+PHASE_METRIC = 'vlab_router_phase_seconds'
+QUEUE_METRIC = 'vlab_router_queue_depth'
+DEPLOY_METRIC = 'vlab_router_deploy_seconds'
+HELP = {TASK_METRIC : 'Time spent running a Celery task',
+        PHASE_METRIC : 'Time spent in one phase of an operation',
+        QUEUE_METRIC : 'Number of tasks waiting in a queue',
+        DEPLOY_METRIC : 'Time spent deploying a Router, by datastore',
+       }
+
+
+class Histograms(object):
+    """A set of histograms, keyed by metric name and labels
+
+    :param directory: Where to write the snapshot of this process
+    :type directory: String
+
+    :param buckets: The upper bounds of the buckets, in seconds
+    :type buckets: Tuple
+    """
+    def __init__(self, directory, buckets=BUCKETS):
+        self.directory = directory
+        self.buckets = buckets
+        self._series = {}
+        self._pid = os.getpid()
+        self._hostname = socket.gethostname()
+        self._lock = threading.Lock()
+        # Keeps a flush from replacing the snapshot of a later one
+        self._flush_lock = threading.Lock()
+
+    def observe(self, metric, labels, seconds):
+        """Record how long something took
+
+        :Returns: None
+
+        :param metric: The name of the histogram
+        :type metric: String
+
+        :param labels: The labels of the series
+        :type labels: Dictionary
+
+        :param seconds: How long it took
+        :type seconds: Float
+        """
+        key = (metric, tuple(sorted(labels.items())))
+        with self._lock:
+            self._check_fork()
+            series = self._series.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+            for index, bound in enumerate(self.buckets):
+                if seconds <= bound:
+                    series['buckets'][index] += 1
+            series['sum'] += seconds
+            series['count'] += 1
+
+    def flush(self):
+        """Write the numbers of this process to disk, for ``collect`` to find
+
+        :Returns: None
+        """
+        with self._flush_lock:
+            with self._lock:
+                self._check_fork()
+                snapshot = [[m, dict(l), s] for (m, l), s in self._series.items()]
+            os.makedirs(self.directory, exist_ok=True)
+            the_file = os.path.join(self.directory, '{}-{}.json'.format(self._hostname, self._pid))
+            fd, tmp_file = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            try:
+                with os.fdopen(fd, 'w') as handle:
+                    ujson.dump(snapshot, handle)
+                os.replace(tmp_file, the_file)
+            except Exception:
+                os.unlink(tmp_file)
+                raise
+
+    def collect(self):
+        """Sum up the snapshots of every process
+
+        :Returns: Dictionary of (metric, labels) -> series
+        """
+        merged = {}
+        for snapshot_file in glob.glob(os.path.join(self.directory, '*.json')):
+            try:
+                with open(snapshot_file) as handle:
+                    snapshot = ujson.load(handle)
+            except (OSError, ValueError) as doh:
+                logger.error('Unable to read {}: {}'.format(snapshot_file, doh))
+                continue
+            for metric, labels, series in snapshot:
+                key = (metric, tuple(sorted(labels.items())))
+                total = merged.setdefault(key, {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0})
+                total['buckets'] = [x + y for x, y in zip(total['buckets'], series['buckets'])]
+                total['sum'] += series['sum']
+                total['count'] += series['count']
+        return merged
+
+    def prune(self):
+        """Delete the snapshots of processes on this host that are no longer running
+
+        :Returns: None
+        """
+        prefix = '{}-'.format(self._hostname)
+        for snapshot_file in glob.glob(os.path.join(self.directory, '{}*.json'.format(glob.escape(prefix)))):
+            pid = os.path.basename(snapshot_file)[len(prefix):-len('.json')]
+            if not pid.isdigit() or _is_running(int(pid)):
+                continue
+            logger.info('Deleting {}, its process is gone'.format(snapshot_file))
+            try:
+                os.unlink(snapshot_file)
+            except FileNotFoundError:
+                pass
+
+    def _check_fork(self):
+        """A forked child starts with the numbers of its parent; don't count them twice"""
+        if os.getpid() != self._pid:
+            self._series = {}
+            self._pid = os.getpid()
+
+
+def _is_running(pid):
+    """Check if a process of this host is still running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Running, as another user
+        pass
+    return True
+
+
+def render(series, queue_depth):
+    """Format metrics in the Prometheus text exposition format
+
+    :Returns: String
+
+    :param series: The histograms, as returned by ``Histograms.collect``
+    :type series: Dictionary
+
+    :param queue_depth: Mapping of queue name to the number of tasks waiting in it
+    :type queue_depth: Dictionary
+    """
+    lines = []
+    for metric in (TASK_METRIC, PHASE_METRIC, DEPLOY_METRIC):
+        lines.append('# HELP {} {}'.format(metric, HELP[metric]))
+        lines.append('# TYPE {} histogram'.format(metric))
+        for (name, labels), data in sorted(series.items()):
+            if name != metric:
+                continue
+            for bound, count in zip(histograms.buckets, data['buckets']):
+                lines.append('{}_bucket{} {}'.format(metric, _labels(labels, le=bound), count))
+            lines.append('{}_bucket{} {}'.format(metric, _labels(labels, le='+Inf'), data['count']))
+            lines.append('{}_sum{} {}'.format(metric, _labels(labels), data['sum']))
+            lines.append('{}_count{} {}'.format(metric, _labels(labels), data['count']))
+    lines.append('# HELP {} {}'.format(QUEUE_METRIC, HELP[QUEUE_METRIC]))
+    lines.append('# TYPE {} gauge'.format(QUEUE_METRIC))
+    for queue, depth in sorted(queue_depth.items()):
+        lines.append('{}{} {}'.format(QUEUE_METRIC, _labels((('queue', queue),)), depth))
+    return '\n'.join(lines) + '\n'
+
+
+def _labels(labels, **extra):
+    """Format the labels of one sample, like ``{task="router.show",le="0.5"}``"""
+    pairs = list(labels) + list(extra.items())
+    return '{' + ','.join('{}="{}"'.format(k, v) for k, v in pairs) + '}'
+
+
+def queue_depth(celery_app, queues):
+    """Ask the broker how many tasks are waiting in each queue
+
+    :Returns: Dictionary of queue name -> Integer
+
+    :param celery_app: The Celery app that's connected to the broker
+    :type celery_app: celery.Celery
+
+    :param queues: The names of the queues to check
+    :type queues: List
+    """
+    depth = {}
+    try:
+        with celery_app.connection_for_read() as conn:
+            for queue in queues:
+                depth[queue] = conn.default_channel.queue_declare(queue=queue, passive=True).message_count
+    except Exception as doh:
+        # Missing numbers beat failing the whole scrape
+        logger.error('Unable to read the depth of queues {}: {}'.format(queues, doh))
+    return depth
+
+
+histograms = Histograms(directory=const.VLAB_ROUTER_METRICS_DIR)
+
+
+@contextmanager
+def phase_timer(operation, phase):
+    """Time one phase of an operation, like the "deploy" phase of "create_router"
+
+    :Returns: None
+
+    :param operation: The function the phase is part of
+    :type operation: String
+
+    :param phase: The name of the phase
+    :type phase: String
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histograms.observe(PHASE_METRIC, {'operation': operation, 'phase': phase}, time.perf_counter() - start)
+
+
+def observe_task(task, seconds):
+    """Record how long a Celery task ran, and publish the numbers of this process
+
+    :Returns: None
+
+    :param task: The name of the Celery task, like router.create
+    :type task: String
+
+    :param seconds: How long the task ran
+    :type seconds: Float
+    """
+    histograms.observe(TASK_METRIC, {'task': task}, seconds)
+    try:
+        histograms.flush()
+    except OSError as doh:
+        logger.error('Unable to write metrics: {}'.format(doh))
+
+
+def prune():
+    """Delete the snapshots of processes on this host that are no longer running
+
+    :Returns: None
+    """
+    histograms.prune()
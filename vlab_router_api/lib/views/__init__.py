@@ -1,3 +1,4 @@
 # -*- coding: UTF-8 -*-
 from .healthcheck import HealthView
 from .router import RouterView
+from .metrics import MetricsView
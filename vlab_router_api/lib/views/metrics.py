@@ -0,0 +1,26 @@
+# -*- coding: UTF-8 -*-
+"""
+Exposes task timings and queue depth for Prometheus to scrape
+"""
+from flask import current_app
+from flask_classy import FlaskView, Response
+
+from vlab_router_api.lib import metrics
+
+
+class MetricsView(FlaskView):
+    """
+    End point for Prometheus to scrape
+    """
+    route_base = '/api/1/inf/router/metrics'
+    trailing_slash = False
+
+    def get(self):
+        """End point for metrics, in the Prometheus text format"""
+        celery_app = current_app.celery_app
+        queues = [x.name for x in celery_app.conf.task_queues]
+        queue_depth = metrics.queue_depth(celery_app, queues)
+        response = Response(metrics.render(metrics.histograms.collect(), queue_depth))
+        response.status_code = 200
+        response.headers['Content-Type'] = 'text/plain; version=0.0.4'
+        return response
@@ -2,6 +2,10 @@
 """
 Defines the RESTful API for managing routers in vLab
 """
+import gzip
+import time
+import hashlib
+
 import ujson
 from flask import current_app
 from flask_classy import request, route, Response
@@ -10,7 +14,8 @@ from vlab_inf_common.vmware import vCenter, vim
 from vlab_api_common import describe, get_logger, requires, validate_input
 
 
-from vlab_router_api.lib import const
+from vlab_router_api.lib import const, dedupe, admission
+from vlab_router_api.lib.image_index import ImageIndex
 
 
 logger = get_logger(__name__, loglevel=const.VLAB_ROUTER_LOG_LEVEL)
@@ -57,6 +62,67 @@ class RouterView(TaskView):
     IMAGES_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
                      "description": "View available versions of Router that can be created"
                     }
+    BULK_POST_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
+                        "type": "object",
+                        "description": "Create many Routers at once",
+                        "properties": {
+                            "routers": {
+                                "description": "The Routers to create",
+                                "type": "array",
+                                "minItems": 1,
+                                "maxItems": const.VLAB_ROUTER_BULK_MAX,
+                                "items": {
+                                    "type": "object",
+                                    "properties": POST_SCHEMA['properties'],
+                                    "required": POST_SCHEMA['required'],
+                                }
+                            }
+                        },
+                        "required": ["routers"]
+                       }
+    BULK_DELETE_SCHEMA = {"$schema": "http://json-schema.org/draft-04/schema#",
+                          "type": "object",
+                          "description": "Destroy many Routers at once",
+                          "properties": {
+                              "names": {
+                                  "description": "The names of the Routers to destroy. Leave out to destroy every Router you own",
+                                  "type": "array",
+                                  "maxItems": const.VLAB_ROUTER_BULK_MAX,
+                                  "uniqueItems": True,
+                                  "items": {"type": "string"}
+                              }
+                          }
+                         }
+    IMAGE_INDEX = ImageIndex(const.VLAB_ROUTER_IMAGES_DIR)
+
+    def after_request(self, name, response):
+        """Adds an ETag to successful GETs, answering with an HTTP 304 when the
+        client already has that version, and gzips large responses.
+
+        The ETag is weak because it ignores the console URLs (see ``_etag``):
+        two responses with the same ETag can differ in their console tickets.
+        A client that gets an HTTP 304 keeps the console URLs it already had,
+        and their tickets may have expired; to open a console, GET without
+        If-None-Match for a fresh ticket.
+
+        :Returns: flask.wrappers.Response
+        """
+        if response.is_streamed:
+            # Reading the body of a stream would wait until the stream ends
+            return response
+        response = super(RouterView, self).after_request(name, response)
+        if request.method == 'GET' and response.status_code == 200:
+            etag = _etag(response.get_data())
+            response.set_etag(etag, weak=True)
+            if request.if_none_match.contains_weak(etag):
+                response.status_code = 304
+                response.set_data(b'')
+                return response
+        response.vary.add('Accept-Encoding')
+        if request.accept_encodings['gzip'] and response.content_length >= const.VLAB_ROUTER_GZIP_MIN_SIZE:
+            response.set_data(gzip.compress(response.get_data()))
+            response.headers['Content-Encoding'] = 'gzip'
+        return response
 
 
     @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
@@ -66,11 +132,11 @@ class RouterView(TaskView):
         username = kwargs['token']['username']
         txn_id = request.headers.get('X-REQUEST-ID', 'noId')
         resp_data = {'user' : username}
-        task = current_app.celery_app.send_task('router.show', [username, txn_id])
-        resp_data['content'] = {'task-id': task.id}
+        task_id = dedupe.show(current_app.celery_app, username, txn_id)
+        resp_data['content'] = {'task-id': task_id}
         resp = Response(ujson.dumps(resp_data))
         resp.status_code = 202
-        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task_id))
         return resp
 
     @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
@@ -85,11 +151,16 @@ class RouterView(TaskView):
         image = body['image']
         requested_networks = body['networks']
         requested_networks = ['{}_{}'.format(username, x) for x in requested_networks]
-        task = current_app.celery_app.send_task('router.create', [username, machine_name, image, requested_networks, txn_id])
-        resp_data['content'] = {'task-id': task.id}
+        try:
+            task_id = dedupe.submit(current_app.celery_app, username, 'router.create',
+                                    [username, machine_name, image, requested_networks, txn_id],
+                                    txn_id, body, admit=admission.admit(current_app.celery_app, username))
+        except admission.Busy as doh:
+            return _too_busy(resp_data, doh)
+        resp_data['content'] = {'task-id': task_id}
         resp = Response(ujson.dumps(resp_data))
         resp.status_code = 202
-        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task_id))
         return resp
 
     @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
@@ -100,11 +171,73 @@ class RouterView(TaskView):
         txn_id = request.headers.get('X-REQUEST-ID', 'noId')
         resp_data = {'user' : username}
         machine_name = kwargs['body']['name']
-        task = current_app.celery_app.send_task('router.delete', [username, machine_name, txn_id])
-        resp_data['content'] = {'task-id': task.id}
+        task_id = dedupe.submit(current_app.celery_app, username, 'router.delete',
+                                [username, machine_name, txn_id], txn_id, kwargs['body'])
+        resp_data['content'] = {'task-id': task_id}
         resp = Response(ujson.dumps(resp_data))
         resp.status_code = 202
-        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task_id))
+        return resp
+
+    @route('/bulk', methods=["POST"])
+    @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+    @validate_input(schema=BULK_POST_SCHEMA)
+    def create_many(self, *args, **kwargs):
+        """Create many Routers with a single task"""
+        username = kwargs['token']['username']
+        txn_id = request.headers.get('X-REQUEST-ID', 'noId')
+        resp_data = {'user' : username}
+        routers = kwargs['body']['routers']
+        if len({x['name'] for x in routers}) != len(routers):
+            resp_data['error'] = 'Every Router must have a unique name'
+            return ujson.dumps(resp_data), 400
+        for router in routers:
+            router['networks'] = ['{}_{}'.format(username, x) for x in router['networks']]
+        try:
+            task_id = dedupe.submit(current_app.celery_app, username, 'router.create_many',
+                                    [username, routers, txn_id], txn_id, routers,
+                                    admit=admission.admit(current_app.celery_app, username, len(routers)))
+        except admission.Busy as doh:
+            return _too_busy(resp_data, doh)
+        resp_data['content'] = {'task-id': task_id}
+        resp = Response(ujson.dumps(resp_data))
+        resp.status_code = 202
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task_id))
+        return resp
+
+    @route('/bulk', methods=["DELETE"])
+    @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+    @validate_input(schema=BULK_DELETE_SCHEMA)
+    def delete_many(self, *args, **kwargs):
+        """Destroy many Routers with a single task"""
+        username = kwargs['token']['username']
+        txn_id = request.headers.get('X-REQUEST-ID', 'noId')
+        resp_data = {'user' : username}
+        machine_names = kwargs['body'].get('names', [])
+        task_id = dedupe.submit(current_app.celery_app, username, 'router.delete_many',
+                                [username, machine_names, txn_id], txn_id, machine_names)
+        resp_data['content'] = {'task-id': task_id}
+        resp = Response(ujson.dumps(resp_data))
+        resp.status_code = 202
+        resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task_id))
+        return resp
+
+    @route('/task/<tid>/events', methods=["GET"])
+    @requires(verify=const.VLAB_VERIFY_TOKEN, version=2)
+    def task_events(self, *args, **kwargs):
+        """Stream the status of a task as Server-Sent Events, instead of making
+        the client poll the task link. The stream ends once the task is done, or
+        after ``VLAB_ROUTER_EVENTS_TIMEOUT`` seconds; reconnect to keep following.
+        EventSource clients reconnect on their own.
+
+        Each stream holds an API worker the whole time it's open, so it's a long
+        poll of a few seconds rather than a connection that lasts the whole task.
+        """
+        result = current_app.celery_app.AsyncResult(kwargs['tid'])
+        resp = Response(_task_events(result), mimetype='text/event-stream')
+        resp.headers['Cache-Control'] = 'no-cache'
+        # Stops nginx from buffering the stream
+        resp.headers['X-Accel-Buffering'] = 'no'
         return resp
 
     @route('/image', methods=["GET"])
@@ -115,9 +248,94 @@ class RouterView(TaskView):
         username = kwargs['token']['username']
         txn_id = request.headers.get('X-REQUEST-ID', 'noId')
         resp_data = {'user' : username}
+        if const.VLAB_ROUTER_INLINE_IMAGES and 'respond-async' not in request.headers.get('Prefer', ''):
+            # Same body a client would get from the task link of router.image
+            resp_data['content'] = {'image': self.IMAGE_INDEX.images()}
+            resp_data['error'] = None
+            resp_data['params'] = {}
+            resp = Response(ujson.dumps(resp_data))
+            resp.status_code = 200
+            return resp
         task = current_app.celery_app.send_task('router.image', [txn_id])
         resp_data['content'] = {'task-id': task.id}
         resp = Response(ujson.dumps(resp_data))
         resp.status_code = 202
         resp.headers.add('Link', '<{0}{1}/task/{2}>; rel=status'.format(const.VLAB_URL, self.route_base, task.id))
         return resp
+
+
+def _too_busy(resp_data, error):
+    """Tell the client to try again later, because too many Routers are being deployed
+
+    :Returns: flask.Response
+
+    :param resp_data: The body of the response
+    :type resp_data: Dictionary
+
+    :param error: Why the request was refused
+    :type error: vlab_router_api.lib.admission.Busy
+    """
+    resp_data['error'] = '{}'.format(error)
+    resp = Response(ujson.dumps(resp_data))
+    resp.status_code = 429
+    resp.headers['Retry-After'] = str(error.retry_after)
+    return resp
+
+
+def _task_events(result):
+    """Generate Server-Sent Events as the state of a task changes. Each event
+    has the status of the task, and the phase it's in; the last event has the
+    same body as the task link would return.
+
+    :Returns: Generator
+
+    :param result: The task to follow
+    :type result: celery.result.AsyncResult
+    """
+    # How soon an EventSource should reconnect once the stream ends
+    yield 'retry: {}\n\n'.format(int(const.VLAB_ROUTER_EVENTS_POLL * 1000))
+    last = None
+    started = time.time()
+    while time.time() - started < const.VLAB_ROUTER_EVENTS_TIMEOUT:
+        status = result.status
+        if status in ('SUCCESS', 'FAILURE'):
+            data = {'status': status, 'content': {}, 'error': None, 'params': {}}
+            if status == 'SUCCESS':
+                data.update(result.result)
+            else:
+                data['error'] = 'Task failed'
+            yield 'event: done\ndata: {}\n\n'.format(ujson.dumps(data))
+            return
+        event = {'status': status}
+        if isinstance(result.info, dict):
+            event.update(result.info)
+        if event != last:
+            yield 'event: status\ndata: {}\n\n'.format(ujson.dumps(event))
+            last = event
+        time.sleep(const.VLAB_ROUTER_EVENTS_POLL)
+    yield 'event: timeout\ndata: {}\n\n'
+
+
+def _etag(body):
+    """Compute an ETag from the Routers in a response. The console URLs are left
+    out; they contain a new session ticket every time the inventory is read, even
+    when nothing about the Routers changed.
+
+    :Returns: String
+
+    :param body: The JSON body of the response
+    :type body: Bytes
+    """
+    try:
+        data = _without_console(ujson.loads(body))
+    except ValueError:
+        return hashlib.sha1(body).hexdigest()
+    return hashlib.sha1(ujson.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def _without_console(data):
+    if isinstance(data, dict):
+        return {k: _without_console(v) for k, v in data.items() if k != 'console'}
+    elif isinstance(data, list):
+        return [_without_console(x) for x in data]
+    return data
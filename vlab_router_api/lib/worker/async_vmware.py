@@ -0,0 +1,233 @@
+# -*- coding: UTF-8 -*-
+"""Coroutines of the vmware functions, for the asyncio worker engine"""
+import asyncio
+
+import ujson
+from vlab_inf_common.vmware import vim
+
+from vlab_router_api.lib import const, metrics
+from vlab_router_api.lib.worker import vmware, session_pool, inventory, meta_index, placement
+
+# Same as consume_task
+TASK_TIMEOUT = 600
+
+
+async def show_router(call, username):
+    """Obtain basic information about Router; every step of it is a short call
+
+    :Returns: Dictionary
+
+    :param call: Runs a blocking call on the executor of the task, and returns an awaitable
+    :type call: Function
+
+    :param username: The user requesting info about their Router
+    :type username: String
+    """
+    return await call(vmware.show_router, username)
+
+
+async def list_images(call):
+    """Obtain a list of available versions of Router that can be created
+
+    :Returns: List
+
+    :param call: Runs a blocking call on the executor of the task, and returns an awaitable
+    :type call: Function
+    """
+    return await call(vmware.list_images)
+
+
+async def create_router(call, username, machine_name, image, requested_networks, logger, progress=vmware._no_progress):
+    """Deploy a new instance of Router, without holding a thread while vCenter powers it on and sets its meta data
+
+    :Returns: Dictionary
+
+    :param call: Runs a blocking call on the executor of the task, and returns an awaitable
+    :type call: Function
+
+    :param username: The name of the user who wants to create a new Router
+    :type username: String
+
+    :param machine_name: The name of the new instance of Router
+    :type machine_name: String
+
+    :param image: The image/version of Router to create
+    :type image: String
+
+    :param requested_networks: The name of the networks to connect the new Router instance up to
+    :type requested_networks: List
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+
+    :param progress: Called with the name of each phase as it starts, for reporting progress
+    :type progress: Function
+    """
+    image_name, ova_meta, user_networks = await call(vmware.check_image, image, requested_networks, logger)
+    vm_id, where = await call(_deploy, username, machine_name, image, image_name, ova_meta,
+                              requested_networks, user_networks, logger, progress)
+    power_task = await call(_start, vm_id, 'on')
+    if power_task is not None:
+        with metrics.phase_timer('create_router', 'power'):
+            await _wait_quietly(call, power_task, logger)
+    progress('powered_on')
+    with metrics.phase_timer('create_router', 'set_meta'):
+        meta_task = await call(_start_set_meta, vm_id, vmware.router_meta(image, where))
+        await wait_task(call, meta_task)
+    return await call(_created_info, username, vm_id)
+
+
+async def delete_router(call, username, machine_name, logger, wait=True, progress=vmware._no_progress):
+    """Unregister and destroy a user's Router, without holding a thread while vCenter powers it off
+
+    :Returns: None, or the moId of the vCenter task destroying the VM when ``wait`` is False
+
+    :param call: Runs a blocking call on the executor of the task, and returns an awaitable
+    :type call: Function
+
+    :param username: The user who wants to delete their jumpbox
+    :type username: String
+
+    :param machine_name: The name of the VM to delete
+    :type machine_name: String
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+
+    :param wait: Set to False to return as soon as vCenter starts destroying the VM. Default True
+    :type wait: Boolean
+
+    :param progress: Called with the name of each phase as it starts, for reporting progress
+    :type progress: Function
+    """
+    progress('session_opened')
+    vm_id, meta = await call(_find, username, machine_name)
+    logger.debug('powering off VM')
+    progress('powering_off')
+    power_task = await call(_start, vm_id, 'off')
+    if power_task is not None:
+        with metrics.phase_timer('delete_router', 'power'):
+            await _wait_quietly(call, power_task, logger)
+    progress('destroying')
+    delete_task = await call(_start_destroy, username, machine_name, vm_id)
+    if not wait:
+        return delete_task
+    logger.debug('blocking while VM is being destroyed')
+    with metrics.phase_timer('delete_router', 'destroy'):
+        with placement.engine.busy(meta.get('datastore')):
+            await wait_task(call, delete_task)
+    inventory.invalidate(username)
+
+
+async def wait_task(call, task_id, timeout=TASK_TIMEOUT):
+    """Wait on a vCenter task like ``consume_task`` does, but between short checks instead of in a thread
+
+    :Returns: None
+
+    :Raises: RuntimeError if the task fails, or isn't done within the timeout
+
+    :param call: Runs a blocking call on the executor of the task, and returns an awaitable
+    :type call: Function
+
+    :param task_id: The moId of the vCenter task, like task-1234
+    :type task_id: String
+
+    :param timeout: How many seconds to wait on the task
+    :type timeout: Integer
+    """
+    loop = asyncio.get_event_loop()
+    deadline = loop.time() + timeout
+    while not await call(vmware.task_done, task_id):
+        if loop.time() > deadline:
+            error = 'Timeout of {} seconds exceeded for task {}'.format(timeout, task_id)
+            raise RuntimeError(error)
+        await asyncio.sleep(const.VLAB_ROUTER_TASK_POLL)
+
+
+async def _wait_quietly(call, task_id, logger):
+    """Like ``virtual_machine.power``, a power task that fails isn't an error"""
+    try:
+        await wait_task(call, task_id)
+    except RuntimeError as doh:
+        logger.debug('Power task {} failed: {}'.format(task_id, doh))
+
+
+def _deploy(username, machine_name, image, image_name, ova_meta, requested_networks, user_networks, logger, progress):
+    """Get a Router on the requested networks, and leave powering it on to the caller
+
+    :Returns: Tuple (moId of the VM, placement.Placement or None when claimed)
+    """
+    with session_pool.session() as vcenter:
+        progress('session_opened')
+        the_vm, where = vmware.place_router(vcenter, username, machine_name, image, image_name, ova_meta,
+                                            requested_networks, user_networks, logger, progress, power_on=False)
+    return the_vm._moId, where
+
+
+def _find(username, machine_name):
+    """Look up a Router by name
+
+    :Returns: Tuple (moId of the VM, meta data of the VM)
+
+    :Raises: ValueError if the user has no such Router
+    """
+    with session_pool.session() as vcenter:
+        with metrics.phase_timer('delete_router', 'get_info'):
+            the_vm, meta = meta_index.find(vcenter, username, 'Router', machine_name)
+    if the_vm is None:
+        raise ValueError('No {} named {} found'.format('router', machine_name))
+    return the_vm._moId, meta
+
+
+def _start(vm_id, state):
+    """Start powering a VM on or off
+
+    :Returns: The moId of the vCenter task, or None if the VM is already in that state
+    """
+    with session_pool.session() as vcenter:
+        the_vm = vim.VirtualMachine(vm_id, vcenter._conn._stub)
+        if the_vm.runtime.powerState == 'powered{}'.format(state.capitalize()):
+            return None
+        elif state == 'on':
+            return the_vm.PowerOn()._moId
+        return the_vm.PowerOff()._moId
+
+
+def _start_set_meta(vm_id, meta_data):
+    """Start replacing the meta data of a VM, like ``virtual_machine.set_meta``
+
+    :Returns: The moId of the vCenter task
+    """
+    with session_pool.session() as vcenter:
+        the_vm = vim.VirtualMachine(vm_id, vcenter._conn._stub)
+        return the_vm.ReconfigVM_Task(vim.vm.ConfigSpec(annotation=ujson.dumps(meta_data)))._moId
+
+
+def _start_destroy(username, machine_name, vm_id):
+    """Start destroying a VM, and drop it from the indexes of the user's Routers
+
+    :Returns: The moId of the vCenter task
+    """
+    with session_pool.session() as vcenter:
+        the_vm = vim.VirtualMachine(vm_id, vcenter._conn._stub)
+        delete_task = the_vm.Destroy_Task()
+    meta_index.remove(username, 'Router', machine_name)
+    inventory.invalidate(username)
+    return delete_task._moId
+
+
+def _created_info(username, vm_id):
+    """Describe a new Router
+
+    :Returns: Dictionary
+    """
+    with session_pool.session() as vcenter:
+        return vmware.created_info(vcenter, username, vim.VirtualMachine(vm_id, vcenter._conn._stub))
+
+
+# The coroutine the asyncio engine runs in place of each vmware function
+COROUTINES = {vmware.show_router: show_router,
+              vmware.list_images: list_images,
+              vmware.create_router: create_router,
+              vmware.delete_router: delete_router,
+             }
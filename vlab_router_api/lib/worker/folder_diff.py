@@ -0,0 +1,201 @@
+# -*- coding: UTF-8 -*-
+"""
+Remembers what ``show_router`` last read of each user's folder, and from then
+on reads only the VMs that were added, removed or changed.
+
+Each user gets a PropertyCollector with a filter over their folder. The first
+``WaitForUpdatesEx`` reports every VM; after that, passing the version of the
+last update gets just what changed since, so a show costs as much as the churn
+in the folder instead of its size.
+
+Collectors belong to a vCenter session, and each worker process has a pool of
+sessions. So a user has a view per session it was shown with, and at most
+``VLAB_ROUTER_SHOW_VIEWS`` views are kept per process. The collector of an
+evicted view is destroyed the next time its session is used, and one whose
+session is gone went with it.
+"""
+import threading
+import weakref
+from collections import OrderedDict
+
+from pyVmomi import vmodl
+from vlab_api_common import get_logger
+from vlab_inf_common.vmware import vim
+
+from vlab_router_api.lib import const
+from vlab_router_api.lib.worker.properties import folder_filter_spec
+
+
+logger = get_logger(__name__, loglevel=const.VLAB_ROUTER_LOG_LEVEL)
+# The collector is gone, like after vCenter restarted, or the version is no good
+STALE = (vmodl.fault.ManagedObjectNotFound, vmodl.query.InvalidCollectorVersion)
+
+
+class FolderView(object):
+    """The VMs of one folder, as read through one vCenter session
+
+    :param vcenter: The session the collector of the view belongs to
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param folder: The folder to watch
+    :type folder: vim.Folder
+    """
+    def __init__(self, vcenter, folder):
+        self.session = weakref.ref(vcenter)
+        self.folder = folder._moId
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Forget everything, so the next sync reads the whole folder
+
+        :Returns: None
+        """
+        self.collector = None
+        self.version = ''
+        self.vms = {}
+        self.network_names = {}
+
+    def sync(self, vcenter, folder):
+        """Read what changed in the folder since the last sync
+
+        :Returns: None
+
+        :param vcenter: The session the collector of the view belongs to
+        :type vcenter: vlab_inf_common.vmware.vCenter
+
+        :param folder: The folder to watch
+        :type folder: vim.Folder
+        """
+        if self.collector is None:
+            self.collector = vcenter.content.propertyCollector.CreatePropertyCollector()
+            self.collector.CreateFilter(folder_filter_spec(folder), partialUpdates=True)
+        # Don't block; an empty result just means nothing changed
+        options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=0)
+        while True:
+            update = self.collector.WaitForUpdatesEx(self.version, options)
+            if update is None:
+                return
+            self.apply(update)
+            self.version = update.version
+            if not getattr(update, 'truncated', False):
+                return
+
+    def apply(self, update):
+        """Merge the changes reported by vCenter into the view
+
+        :Returns: None
+
+        :param update: The changes reported by vCenter
+        :type update: vmodl.query.PropertyCollector.UpdateSet
+        """
+        for filter_update in update.filterSet:
+            for obj_update in filter_update.objectSet:
+                moid = obj_update.obj._moId
+                if obj_update.kind == 'leave':
+                    self.vms.pop(moid, None)
+                    self.network_names.pop(moid, None)
+                    continue
+                if isinstance(obj_update.obj, vim.Network):
+                    for change in obj_update.changeSet:
+                        if change.name == 'name':
+                            self.network_names[moid] = change.val or ''
+                    continue
+                if obj_update.kind == 'enter':
+                    props = {}
+                else:
+                    props = self.vms.get(moid, (obj_update.obj, {}))[1]
+                for change in obj_update.changeSet:
+                    if change.op in ('remove', 'indirectRemove'):
+                        props.pop(change.name, None)
+                    else:
+                        props[change.name] = change.val
+                self.vms[moid] = (obj_update.obj, props)
+
+    def destroy(self):
+        """Destroy the collector of the view, if it's still around. Only call it
+        while holding the session of the view.
+
+        :Returns: None
+        """
+        if self.collector is None:
+            return
+        try:
+            self.collector.DestroyPropertyCollector()
+        except Exception as doh:
+            logger.debug('Unable to destroy collector {}: {}'.format(self.collector._moId, doh))
+
+
+class FolderDiffs(object):
+    """The folder views of every user this process has shown
+
+    :param max_views: The most views to keep
+    :type max_views: Integer
+    """
+    def __init__(self, max_views):
+        self.max_views = max_views
+        self._views = OrderedDict()
+        self._evicted = []
+        self._lock = threading.Lock()
+
+    def retrieve(self, vcenter, username, folder):
+        """Read the VMs of a user's folder; only what changed if it was read before
+
+        :Returns: Tuple (Dictionary of vim.VirtualMachine -> properties, Dictionary of network moId -> name)
+
+        :param vcenter: The connection to vCenter
+        :type vcenter: vlab_inf_common.vmware.vCenter
+
+        :param username: The user who owns the folder
+        :type username: String
+
+        :param folder: The folder that contains the VMs
+        :type folder: vim.Folder
+        """
+        self._destroy_evicted(vcenter)
+        key = (username, id(vcenter))
+        with self._lock:
+            view = self._views.get(key)
+            if view is None or view.session() is not vcenter or view.folder != folder._moId:
+                # A new session can reuse the id of a dead one; a new folder needs a new filter
+                if view is not None:
+                    self._evicted.append(view)
+                view = FolderView(vcenter, folder)
+                self._views[key] = view
+            self._views.move_to_end(key)
+            while len(self._views) > self.max_views:
+                self._evicted.append(self._views.popitem(last=False)[1])
+        with view.lock:
+            try:
+                view.sync(vcenter, folder)
+            except STALE as doh:
+                logger.info('Reading the whole folder of {}: {}'.format(username, doh))
+                view.reset()
+                view.sync(vcenter, folder)
+            except Exception:
+                # Don't trust a view that only got part of an update
+                view.destroy()
+                view.reset()
+                raise
+            vms = {vm: dict(props) for vm, props in view.vms.values()}
+            return vms, dict(view.network_names)
+
+    def _destroy_evicted(self, vcenter):
+        """Destroy the collectors of evicted views that belong to this session"""
+        with self._lock:
+            mine = [x for x in self._evicted if x.session() is vcenter]
+            # A view whose session is gone lost its collector with it
+            self._evicted = [x for x in self._evicted if x.session() is not None and x.session() is not vcenter]
+        for view in mine:
+            view.destroy()
+
+
+diffs = FolderDiffs(max_views=const.VLAB_ROUTER_SHOW_VIEWS)
+
+
+def retrieve(vcenter, username, folder):
+    """Read the VMs of a user's folder; only what changed if it was read before
+
+    :Returns: Tuple (Dictionary of vim.VirtualMachine -> properties, Dictionary of network moId -> name)
+    """
+    return diffs.retrieve(vcenter, username, folder)
@@ -0,0 +1,287 @@
+# -*- coding: UTF-8 -*-
+"""
+Keeps local copies of the disks inside the Router OVAs, so a deploy doesn't
+read the whole OVA from the network mounted images directory.
+
+Each disk is stored once, named after its checksum from the OVA manifest, in
+``VLAB_ROUTER_IMAGE_CACHE_DIR``. A copy is verified against the manifest
+when it's made, and a marker next to it records the checksum, size, inode and
+modification time it was verified with. A copy is only used while its marker
+still matches it and the manifest; anything else, like a copy changed or
+replaced after it was verified, is copied again. Every worker process on the
+host shares the copies; a lock per disk makes sure only one of them copies it.
+When the copies take more than ``VLAB_ROUTER_IMAGE_CACHE_MB``, the least
+recently used are deleted.
+Setting that to 0 turns the cache off, and disks are read from the OVA.
+"""
+import os
+import time
+import fcntl
+import hashlib
+import tempfile
+from contextlib import contextmanager
+
+import ujson
+from vlab_api_common import get_logger
+
+from vlab_router_api.lib import const
+from vlab_router_api.lib.worker import ova_index
+
+
+logger = get_logger(__name__, loglevel=const.VLAB_ROUTER_LOG_LEVEL)
+CHUNK_SIZE = 1024 * 1024
+# A disk used this recently might be mid-upload, so it isn't evicted
+IN_USE_SECONDS = 900
+# Appended to the name of a copy for its marker of verification
+MARKER_SUFFIX = '.verified'
+
+
+class ImageCache(object):
+    """Local, content-addressed copies of OVA disks
+
+    :param images_dir: The directory that contains the OVA files
+    :type images_dir: String
+
+    :param cache_dir: Where to keep the copies
+    :type cache_dir: String
+
+    :param budget: The most bytes the copies can take; 0 turns the cache off
+    :type budget: Integer
+    """
+    def __init__(self, images_dir, cache_dir, budget):
+        self.images_dir = images_dir
+        self.cache_dir = cache_dir
+        self.budget = budget
+
+    def disks(self, image_name, ova_meta):
+        """Find where to read each disk of an OVA from, copying it into the cache if needed
+
+        :Returns: Dictionary of disk name -> (path, offset, size)
+
+        :param image_name: The file name of the OVA, like router-vyos-1.1.8.ova
+        :type image_name: String
+
+        :param ova_meta: The metadata of the OVA, from ``ova_index.lookup``
+        :type ova_meta: Dictionary
+        """
+        ova_path = os.path.join(self.images_dir, image_name)
+        found = {name: (ova_path, ova_meta['offsets'][name], size) for name, size in ova_meta['disks'].items()}
+        if not self.budget:
+            return found
+        for name, size in ova_meta['disks'].items():
+            try:
+                found[name] = (self.fetch(ova_path, ova_meta, name), 0, size)
+            except OSError as doh:
+                # Like a full local disk; the OVA still works, just slower
+                logger.error('Unable to cache {} of {}: {}'.format(name, image_name, doh))
+        self.evict()
+        return found
+
+    def fetch(self, ova_path, ova_meta, name):
+        """Obtain the local copy of a disk, copying it out of the OVA if there isn't one
+
+        :Returns: String, the path to the copy
+
+        :Raises: RuntimeError when the disk doesn't match the OVA manifest
+
+        :param ova_path: The absolute path to the OVA file
+        :type ova_path: String
+
+        :param ova_meta: The metadata of the OVA, from ``ova_index.lookup``
+        :type ova_meta: Dictionary
+
+        :param name: The name of the disk within the OVA
+        :type name: String
+        """
+        key = cache_key(ova_meta, name)
+        path = os.path.join(self.cache_dir, key)
+        checksum = ova_meta['manifest'].get(name)
+        with self._locked(key):
+            if _verified(path, ova_meta['disks'][name], checksum):
+                # Mark it as recently used; touching the copy would change what was verified
+                os.utime(path + MARKER_SUFFIX)
+                return path
+            logger.info('Caching {} of {}'.format(name, os.path.basename(ova_path)))
+            self._copy(ova_path, ova_meta['offsets'][name], ova_meta['disks'][name], path, checksum)
+        return path
+
+    def evict(self):
+        """Delete the least recently used copies until the cache fits its budget
+
+        :Returns: None
+        """
+        with self._locked('evict'):
+            entries = []
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(('.lock', '.tmp', MARKER_SUFFIX)):
+                    continue
+                path = os.path.join(self.cache_dir, name)
+                try:
+                    size = os.stat(path).st_size
+                    # The marker is touched when the copy is used
+                    mtime = os.stat(path + MARKER_SUFFIX).st_mtime
+                except FileNotFoundError:
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    size, mtime = stat.st_size, stat.st_mtime
+                entries.append((mtime, size, name))
+            total = sum(x[1] for x in entries)
+            in_use = time.time() - IN_USE_SECONDS
+            for mtime, size, name in sorted(entries):
+                if total <= self.budget:
+                    break
+                if mtime > in_use:
+                    continue
+                logger.info('Evicting {} from the image cache'.format(name))
+                path = os.path.join(self.cache_dir, name)
+                # The marker goes first, so a copy is never used without one that matches it
+                try:
+                    os.unlink(path + MARKER_SUFFIX)
+                except FileNotFoundError:
+                    pass
+                os.unlink(path)
+                total -= size
+
+    def warm(self):
+        """Copy the disks of the newest OVAs into the cache, as many as fit in its budget
+
+        :Returns: None
+        """
+        if not self.budget:
+            return
+        ovas = [x for x in os.listdir(self.images_dir) if x.endswith('.ova')]
+        ovas.sort(key=lambda x: os.stat(os.path.join(self.images_dir, x)).st_mtime, reverse=True)
+        used = 0
+        for image_name in ovas:
+            try:
+                ova_meta = ova_index.lookup(image_name)
+                used += sum(ova_meta['disks'].values())
+                if used > self.budget:
+                    break
+                self.disks(image_name, ova_meta)
+            except Exception as doh:
+                logger.error('Unable to warm the image cache with {}: {}'.format(image_name, doh))
+
+
+    def _copy(self, ova_path, offset, size, path, checksum):
+        """Copy a disk out of the OVA, verify it, and put it in place with its marker"""
+        algorithm, expected = checksum or ['sha256', None]
+        digest = hashlib.new(algorithm)
+        tmp_file = '{}.{}.tmp'.format(path, os.getpid())
+        try:
+            with open(ova_path, 'rb') as source, open(tmp_file, 'wb') as dest:
+                source.seek(offset)
+                remaining = size
+                while remaining:
+                    chunk = source.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise RuntimeError('{} ended before the end of the disk'.format(ova_path))
+                    digest.update(chunk)
+                    dest.write(chunk)
+                    remaining -= len(chunk)
+            if expected is not None and digest.hexdigest() != expected:
+                error = 'Checksum of {} in {} does not match its manifest'.format(os.path.basename(path), ova_path)
+                raise RuntimeError(error)
+            try:
+                # A copy changed or replaced before it's marked mustn't be trusted
+                os.unlink(path + MARKER_SUFFIX)
+            except FileNotFoundError:
+                pass
+            os.replace(tmp_file, path)
+        finally:
+            if os.path.exists(tmp_file):
+                os.unlink(tmp_file)
+        _write_marker(path, [algorithm, digest.hexdigest()])
+
+    @contextmanager
+    def _locked(self, key):
+        """Hold an exclusive lock shared by every process on the host"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(os.path.join(self.cache_dir, '{}.lock'.format(key)), 'a') as handle:
+            fcntl.flock(handle, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(handle, fcntl.LOCK_UN)
+
+
+def _verified(path, size, checksum):
+    """Check that a copy is still what was verified when it was made
+
+    :Returns: Boolean
+
+    :param path: The path to the copy
+    :type path: String
+
+    :param size: The size of the disk in the OVA
+    :type size: Integer
+
+    :param checksum: The algorithm and digest of the disk from the OVA manifest, if it has one
+    :type checksum: List
+    """
+    try:
+        stat = os.stat(path)
+        with open(path + MARKER_SUFFIX) as the_file:
+            marker = ujson.load(the_file)
+    except (OSError, ValueError):
+        return False
+    if checksum and list(checksum) != marker.get('checksum'):
+        return False
+    return (stat.st_size == size and marker.get('size') == size
+            and marker.get('inode') == stat.st_ino and marker.get('mtime_ns') == stat.st_mtime_ns)
+
+
+def _write_marker(path, checksum):
+    """Record what a copy was verified with, replacing the marker in one step"""
+    stat = os.stat(path)
+    marker = {'checksum': checksum, 'size': stat.st_size, 'inode': stat.st_ino, 'mtime_ns': stat.st_mtime_ns}
+    handle, tmp_file = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'w') as the_file:
+            ujson.dump(marker, the_file)
+        os.replace(tmp_file, path + MARKER_SUFFIX)
+    except Exception:
+        os.unlink(tmp_file)
+        raise
+
+
+def cache_key(ova_meta, name):
+    """Name the copy of a disk after its content
+
+    :Returns: String
+
+    :param ova_meta: The metadata of the OVA, from ``ova_index.lookup``
+    :type ova_meta: Dictionary
+
+    :param name: The name of the disk within the OVA
+    :type name: String
+    """
+    checksum = ova_meta['manifest'].get(name)
+    if checksum:
+        return '{}-{}'.format(*checksum)
+    # No manifest; the checksum of the whole OVA, plus which disk, is still unique
+    member = hashlib.sha256('{}/{}'.format(ova_meta['sha256'], name).encode())
+    return 'ova-{}'.format(member.hexdigest())
+
+
+cache = ImageCache(images_dir=const.VLAB_ROUTER_IMAGES_DIR,
+                   cache_dir=const.VLAB_ROUTER_IMAGE_CACHE_DIR,
+                   budget=const.VLAB_ROUTER_IMAGE_CACHE_MB * 1024 * 1024)
+
+
+def disks(image_name, ova_meta):
+    """Find where to read each disk of an OVA from
+
+    :Returns: Dictionary of disk name -> (path, offset, size)
+    """
+    return cache.disks(image_name, ova_meta)
+
+
+def warm():
+    """Copy the disks of the newest OVAs into the cache
+
+    :Returns: None
+    """
+    cache.warm()
@@ -0,0 +1,262 @@
+# -*- coding: UTF-8 -*-
+"""
+Caches each user's Router inventory, so polling clients don't hit vCenter for
+data that hasn't changed.
+
+The cache lives on local disk so that every worker process on a host sees the
+same entries, and more importantly, the same invalidations.
+
+.. note::
+    The console URL of a Router embeds a single use vCenter clone ticket, so
+    consoles are left out of the cache; ``show_router`` makes new ones for
+    every cache hit.
+"""
+import os
+import time
+import tempfile
+import threading
+from urllib.parse import quote
+
+import ujson
+from pyVmomi import vmodl
+from vlab_api_common import get_logger
+from vlab_inf_common.vmware import vCenter, vim
+
+from vlab_router_api.lib import const
+
+
+logger = get_logger(__name__, loglevel=const.VLAB_ROUTER_LOG_LEVEL)
+
+
+class InventoryCache(object):
+    """A TTL cache of Router inventories, keyed by username
+
+    :param directory: Where to store the cache entries
+    :type directory: String
+
+    :param ttl: How many seconds an entry is valid. Zero disables the cache.
+    :type ttl: Integer
+    """
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+
+    def _path(self, username, suffix='.json'):
+        return os.path.join(self.directory, quote(username, safe='') + suffix)
+
+    def get(self, username):
+        """Obtain the cached Router inventory of a user
+
+        :Returns: Dictionary, or None when there's no fresh entry
+
+        :param username: The user who owns the Routers
+        :type username: String
+        """
+        if not self.ttl:
+            return None
+        try:
+            with open(self._path(username)) as the_file:
+                entry = ujson.load(the_file)
+        except (OSError, ValueError):
+            return None
+        if time.time() - entry['created'] > self.ttl:
+            return None
+        return entry['routers']
+
+    def set(self, username, routers, fetched_at):
+        """Store the Router inventory of a user
+
+        :Returns: None
+
+        :param username: The user who owns the Routers
+        :type username: String
+
+        :param routers: The Router inventory, as returned by ``show_router``. Console URLs are not stored.
+        :type routers: Dictionary
+
+        :param fetched_at: When the inventory started to be read from vCenter.
+                           If the user's inventory was invalidated since then, the
+                           inventory is stale and not stored.
+        :type fetched_at: Float
+        """
+        if not self.ttl:
+            return
+        try:
+            if os.stat(self._path(username, suffix='.invalidated')).st_mtime >= fetched_at:
+                return
+        except FileNotFoundError:
+            pass
+        os.makedirs(self.directory, exist_ok=True)
+        routers = {name: {k: v for k, v in info.items() if k != 'console'} for name, info in routers.items()}
+        # Every thread gets its own tmp file, even threads of one process
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as the_file:
+                ujson.dump({'created': fetched_at, 'routers': routers}, the_file)
+            os.replace(tmp_path, self._path(username))
+        except Exception:
+            os.unlink(tmp_path)
+            raise
+
+    def invalidate(self, username):
+        """Throw away the cached Router inventory of a user
+
+        :Returns: None
+
+        :param username: The user who owns the Routers
+        :type username: String
+        """
+        if not self.ttl:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Marks the time of invalidation, so a show that was already reading
+        # from vCenter doesn't store what it found.
+        with open(self._path(username, suffix='.invalidated'), 'w'):
+            pass
+        try:
+            os.remove(self._path(username))
+        except FileNotFoundError:
+            pass
+
+
+class InventoryWatcher(threading.Thread):
+    """Invalidates cached inventories as soon as vCenter reports a change to
+    a VM within a user's folder, via ``WaitForUpdatesEx``.
+
+    :param cache: The cache to keep fresh
+    :type cache: InventoryCache
+
+    :param wait: How many seconds a single ``WaitForUpdatesEx`` call blocks
+    :type wait: Integer
+    """
+    VM_PROPERTIES = ['name', 'parent', 'config.annotation', 'runtime.powerState', 'guest.net', 'network']
+
+    def __init__(self, cache, wait=60):
+        super(InventoryWatcher, self).__init__(daemon=True)
+        self.cache = cache
+        self.wait = wait
+        self.folders = {}
+        self.owners = {}
+        self._keep_running = True
+
+    def stop(self):
+        """Ask the watcher to exit after its current ``WaitForUpdatesEx`` call"""
+        self._keep_running = False
+
+    def run(self):
+        while self._keep_running:
+            try:
+                with vCenter(host=const.INF_VCENTER_SERVER, user=const.INF_VCENTER_USER,
+                             password=const.INF_VCENTER_PASSWORD, port=const.INF_VCENTER_PORT) as vcenter:
+                    self._watch(vcenter)
+            except Exception as doh:
+                logger.exception('Inventory watcher failed: {}'.format(doh))
+                time.sleep(self.wait)
+
+    def _watch(self, vcenter):
+        """Block on vCenter, invalidating inventories as VMs change"""
+        collector = vcenter.content.propertyCollector.CreatePropertyCollector()
+        collector.CreateFilter(self._filter_spec(vcenter), partialUpdates=True)
+        options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=self.wait)
+        version = ''
+        try:
+            while self._keep_running:
+                update = collector.WaitForUpdatesEx(version, options)
+                if update is None:
+                    continue
+                self.handle_update(update, initial=not version)
+                version = update.version
+        finally:
+            collector.DestroyPropertyCollector()
+
+    def _filter_spec(self, vcenter):
+        """Watch every VM and folder below the top level vLab directory"""
+        to_children = vmodl.query.PropertyCollector.TraversalSpec(name='folderToChildren',
+                                                                  type=vim.Folder,
+                                                                  path='childEntity',
+                                                                  skip=False)
+        to_children.selectSet = [vmodl.query.PropertyCollector.SelectionSpec(name='folderToChildren')]
+        top_folder = vcenter.get_vm_folder(path=const.INF_VCENTER_TOP_LVL_DIR)
+        obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=top_folder, skip=False,
+                                                            selectSet=[to_children])
+        prop_specs = [vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine,
+                                                                 pathSet=self.VM_PROPERTIES),
+                      vmodl.query.PropertyCollector.PropertySpec(type=vim.Folder,
+                                                                 pathSet=['name'])]
+        return vmodl.query.PropertyCollector.FilterSpec(objectSet=[obj_spec], propSet=prop_specs)
+
+    def handle_update(self, update, initial=False):
+        """Invalidate the inventory of every user who had a VM change
+
+        :Returns: None
+
+        :param update: The changes reported by vCenter
+        :type update: vmodl.query.PropertyCollector.UpdateSet
+
+        :param initial: Set to True for the first update, which reports every
+                        object being watched rather than what changed.
+        :type initial: Boolean
+        """
+        changed_folders = set()
+        for filter_update in update.filterSet:
+            for obj_update in filter_update.objectSet:
+                moid = obj_update.obj._moId
+                if isinstance(obj_update.obj, vim.Folder):
+                    for change in obj_update.changeSet:
+                        if change.name == 'name':
+                            self.folders[moid] = change.val
+                    continue
+                # A VM that moves changes the inventory of the old and new folder
+                changed_folders.add(self.owners.get(moid))
+                for change in obj_update.changeSet:
+                    if change.name == 'parent' and change.val is not None:
+                        self.owners[moid] = change.val._moId
+                if obj_update.kind == 'leave':
+                    changed_folders.add(self.owners.pop(moid, None))
+                else:
+                    changed_folders.add(self.owners.get(moid))
+        if initial:
+            return
+        usernames = {self.folders.get(x) for x in changed_folders}
+        usernames.discard(None)
+        for username in usernames:
+            logger.debug('Invalidating Router inventory of {}'.format(username))
+            self.cache.invalidate(username)
+
+
+cache = InventoryCache(directory=const.VLAB_ROUTER_INVENTORY_DIR,
+                       ttl=const.VLAB_ROUTER_INVENTORY_TTL)
+
+
+def get(username):
+    """Obtain the cached Router inventory of a user; None if there's no fresh entry
+
+    :Returns: Dictionary
+    """
+    return cache.get(username)
+
+
+def store(username, routers, fetched_at):
+    """Cache the Router inventory of a user
+
+    :Returns: None
+    """
+    cache.set(username, routers, fetched_at)
+
+
+def invalidate(username):
+    """Throw away the cached Router inventory of a user
+
+    :Returns: None
+    """
+    cache.invalidate(username)
+
+
+def start_watcher():
+    """Keep the cache fresh by listening for changes in vCenter
+
+    :Returns: InventoryWatcher
+    """
+    watcher = InventoryWatcher(cache)
+    watcher.start()
+    return watcher
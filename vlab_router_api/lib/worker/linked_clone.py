@@ -0,0 +1,247 @@
+# -*- coding: UTF-8 -*-
+"""
+Deploys Routers as linked clones of a per-version template, instead of uploading
+the whole OVA into vCenter for every new Router.
+
+The first create of a given image imports the OVA once, into the template folder,
+and snapshots it. Every create after that is a linked clone off that snapshot,
+with the user's networks applied as part of the clone.
+"""
+import re
+import time
+import os.path
+
+from vlab_inf_common.vmware import Ova, vim, virtual_machine, consume_task
+
+from vlab_router_api.lib import const
+
+SNAPSHOT_NAME = 'base'
+# The faults vCenter gives when another worker is busy with the template
+BUSY_FAULTS = (vim.fault.TaskInProgress, vim.fault.InvalidState)
+HOSTNAME_REGEX = r'^(([a-zA-Z0-9]|[a-zA-Z0-9][a-zA-Z0-9\-]*[a-zA-Z0-9])\.)*([A-Za-z0-9]|[A-Za-z0-9][A-Za-z0-9\-]*[A-Za-z0-9])$'
+
+
+def template_name(image_name, ova_meta):
+    """The name of the template VM for an image. The checksum is part of the name
+    so that replacing an OVA with different content results in a new template.
+
+    :Returns: String
+
+    :param image_name: The file name of the OVA, like router-vyos-1.1.8.ova
+    :type image_name: String
+
+    :param ova_meta: The metadata of the OVA, from the OVA index
+    :type ova_meta: Dictionary
+    """
+    return '{}-{}'.format(os.path.splitext(image_name)[0], ova_meta['sha256'][:8])
+
+
+def get_template(vcenter, image_name, ova_meta, network_map, logger):
+    """Find the template for an image, importing the OVA if there isn't one yet
+
+    :Returns: vim.VirtualMachine
+
+    :param vcenter: The connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param image_name: The file name of the OVA, like router-vyos-1.1.8.ova
+    :type image_name: String
+
+    :param ova_meta: The metadata of the OVA, from the OVA index
+    :type ova_meta: Dictionary
+
+    :param network_map: Networks to use while importing the OVA; clones replace them
+    :type network_map: List of vim.OvfManager.NetworkMapping
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    name = template_name(image_name, ova_meta)
+    the_vm = _lookup(vcenter, name)
+    if the_vm is None:
+        logger.info('Importing template {}'.format(name))
+        ova = Ova(os.path.join(const.VLAB_ROUTER_IMAGES_DIR, image_name))
+        try:
+            the_vm = virtual_machine.deploy_from_ova(vcenter, ova, network_map,
+                                                     const.VLAB_ROUTER_TEMPLATE_FOLDER,
+                                                     name, logger, power_on=False)
+        except vim.fault.DuplicateName:
+            logger.info('Template {} is being imported by another worker'.format(name))
+            return _wait_for_template(vcenter, name)
+        finally:
+            ova.close()
+    elif the_vm.snapshot is not None:
+        return the_vm
+    else:
+        # Either another worker is still importing it, or one died before taking the snapshot
+        logger.info('Template {} has no snapshot'.format(name))
+    return _snapshot(vcenter, the_vm, name, logger)
+
+
+def _snapshot(vcenter, the_vm, name, logger):
+    """Take the snapshot linked clones are based off, unless another worker is busy with the template
+
+    :Returns: vim.VirtualMachine
+    """
+    try:
+        task = the_vm.CreateSnapshot_Task(name=SNAPSHOT_NAME,
+                                          description='Linked clones of Router are based off this snapshot',
+                                          memory=False,
+                                          quiesce=False)
+    except BUSY_FAULTS as doh:
+        logger.info('Unable to snapshot template {}, waiting on another worker: {}'.format(name, doh))
+        return _wait_for_template(vcenter, name)
+    try:
+        consume_task(task)
+    except RuntimeError as doh:
+        if not isinstance(task.info.error, BUSY_FAULTS):
+            # Like a full datastore; waiting wouldn't fix it
+            logger.error('Unable to snapshot template {}: {}'.format(name, doh))
+            raise
+        logger.info('Unable to snapshot template {}, waiting on another worker: {}'.format(name, doh))
+        return _wait_for_template(vcenter, name)
+    return the_vm
+
+
+def _lookup(vcenter, name):
+    """Look up a template by name, whether or not it's ready to be cloned
+
+    :Returns: vim.VirtualMachine, or None if there's no such template
+    """
+    folder = vcenter.get_by_name(name=const.VLAB_ROUTER_TEMPLATE_FOLDER, vimtype=vim.Folder)
+    for entity in folder.childEntity:
+        if entity.name == name:
+            return entity
+    return None
+
+
+def _find_template(vcenter, name):
+    """Look up a template that's ready to be cloned
+
+    :Returns: vim.VirtualMachine, or None if there's no such template (yet)
+    """
+    template = _lookup(vcenter, name)
+    if template is not None and template.snapshot is not None:
+        return template
+    return None
+
+
+def _wait_for_template(vcenter, name, timeout=1800):
+    """Block while another worker finishes importing a template
+
+    :Returns: vim.VirtualMachine
+
+    :Raises: RuntimeError if the template doesn't become ready within the timeout
+    """
+    for _ in range(timeout):
+        template = _find_template(vcenter, name)
+        if template is not None:
+            return template
+        time.sleep(1)
+    error = 'Template {} not ready after {} seconds'.format(name, timeout)
+    raise RuntimeError(error)
+
+
+def clone_router(vcenter, template, folder, machine_name, network_map, logger, power_on=True, where=None):
+    """Create a new Router as a linked clone of a template
+
+    :Returns: vim.VirtualMachine
+
+    :Raises: ValueError if the machine name is not valid
+
+    :param vcenter: The connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param template: The template to clone
+    :type template: vim.VirtualMachine
+
+    :param folder: The folder to put the new Router in
+    :type folder: vim.Folder
+
+    :param machine_name: The name of the new Router
+    :type machine_name: String
+
+    :param network_map: The networks to attach, in the order of the NICs in the OVF
+    :type network_map: List of vim.OvfManager.NetworkMapping
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+
+    :param power_on: Set to True to have the new Router powered on. Default True
+    :type power_on: Boolean
+
+    :param where: The datastore and resource pool to put the new Router on. Default is the configured pool
+    :type where: vlab_router_api.lib.worker.placement.Placement
+    """
+    if not re.match(HOSTNAME_REGEX, machine_name):
+        error = 'Invalid machine name. Names can only contain characters a-z, A-Z, 0-9, periods (".") and dashes ("-"). Supplied: {}'.format(machine_name)
+        raise ValueError(error)
+    relocate_spec = vim.vm.RelocateSpec()
+    relocate_spec.diskMoveType = 'createNewChildDiskBacking'
+    if where is None:
+        relocate_spec.pool = vcenter.resource_pools[const.INF_VCENTER_RESORUCE_POOL]
+    else:
+        relocate_spec.pool = where.pool
+        # Only the delta disk goes here; it keeps reading from the template's disk
+        relocate_spec.datastore = where.datastore
+    clone_spec = vim.vm.CloneSpec()
+    clone_spec.location = relocate_spec
+    clone_spec.powerOn = False
+    clone_spec.template = False
+    clone_spec.snapshot = template.snapshot.currentSnapshot
+    clone_spec.config = vim.vm.ConfigSpec(deviceChange=nic_specs(template, network_map))
+    logger.debug('Cloning {} to {}'.format(template.name, machine_name))
+    the_vm = consume_task(template.CloneVM_Task(folder=folder, name=machine_name, spec=clone_spec))
+    if power_on:
+        virtual_machine.power(the_vm, state='on')
+    return the_vm
+
+
+def nic_specs(the_vm, network_map):
+    """Make the device changes that connect each NIC of a VM to the requested network.
+    NICs without a requested network are left disconnected.
+
+    :Returns: List of vim.vm.device.VirtualDeviceSpec
+
+    :param the_vm: The VM that owns the NICs
+    :type the_vm: vim.VirtualMachine
+
+    :param network_map: The networks to attach, in the order of the NICs
+    :type network_map: List of vim.OvfManager.NetworkMapping
+    """
+    nics = [x for x in the_vm.config.hardware.device if isinstance(x, vim.vm.device.VirtualEthernetCard)]
+    nics.sort(key=lambda x: x.key)
+    specs = []
+    for index, nic in enumerate(nics):
+        nic_spec = vim.vm.device.VirtualDeviceSpec()
+        nic_spec.operation = vim.vm.device.VirtualDeviceSpec.Operation.edit
+        nic_spec.device = nic
+        nic.connectable = vim.vm.device.VirtualDevice.ConnectInfo()
+        nic.connectable.allowGuestControl = True
+        if index < len(network_map):
+            nic.backing = _nic_backing(network_map[index].network)
+            nic.connectable.startConnected = True
+            nic.connectable.connected = True
+        else:
+            nic.connectable.startConnected = False
+            nic.connectable.connected = False
+        specs.append(nic_spec)
+    return specs
+
+
+def _nic_backing(network):
+    """Make the NIC backing for a standard or distributed port group
+
+    :Returns: vim.vm.device.VirtualDevice.BackingInfo
+    """
+    if isinstance(network, vim.dvs.DistributedVirtualPortgroup):
+        port = vim.dvs.PortConnection()
+        port.portgroupKey = network.key
+        port.switchUuid = network.config.distributedVirtualSwitch.uuid
+        backing = vim.vm.device.VirtualEthernetCard.DistributedVirtualPortBackingInfo()
+        backing.port = port
+    else:
+        backing = vim.vm.device.VirtualEthernetCard.NetworkBackingInfo()
+        backing.network = network
+        backing.deviceName = network.name
+    return backing
@@ -0,0 +1,199 @@
+# -*- coding: UTF-8 -*-
+"""
+A per-worker index of (username, component, name) -> VM moId, so finding a
+Router to delete doesn't scan the user's folder reading the name of each VM.
+
+Creates add their Router, deletes remove it, and every show re-indexes the
+folder it just read, for free. Other worker processes don't see those writes,
+so an entry is checked against vCenter before it's used: the one property read
+a delete makes anyway also confirms the VM still has that name, component and
+folder. A miss, or an entry that's wrong, re-reads the whole folder in one
+PropertyCollector call and indexes every VM in it.
+
+At most ``VLAB_ROUTER_META_INDEX_USERS`` users are indexed; the least recently
+used are forgotten first.
+"""
+import threading
+from collections import OrderedDict, namedtuple
+
+from pyVmomi import vmodl
+from vlab_inf_common.vmware import vim
+
+from vlab_router_api.lib import const
+from vlab_router_api.lib.worker.properties import retrieve_folder, retrieve_vm, parse_meta
+
+# What a lookup reads to check an entry, and a miss reads to rebuild the index
+CHECK_PROPERTIES = ['name', 'config.annotation', 'parent']
+Entry = namedtuple('Entry', 'moid folder')
+
+
+class MetaIndex(object):
+    """Bounded index of the VMs of each user, by component and name
+
+    :param max_users: The most users to index
+    :type max_users: Integer
+    """
+    def __init__(self, max_users):
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def find(self, vcenter, username, component, name):
+        """Find a user's VM by its component and name
+
+        :Returns: Tuple (vim.VirtualMachine, Dictionary of its meta data), or (None, None) if there's no such VM
+
+        :param vcenter: The connection to vCenter
+        :type vcenter: vlab_inf_common.vmware.vCenter
+
+        :param username: The user who owns the VM
+        :type username: String
+
+        :param component: The kind of VM, like Router
+        :type component: String
+
+        :param name: The name of the VM
+        :type name: String
+        """
+        entry = self.get(username, component, name)
+        if entry is not None:
+            found = self._check(vcenter, entry, component, name)
+            if found[0] is not None:
+                with self._lock:
+                    self.hits += 1
+                return found
+            self.forget(username)
+        with self._lock:
+            self.misses += 1
+        folder = vcenter.get_by_name(name=username, vimtype=vim.Folder)
+        vms, _ = retrieve_folder(vcenter, folder, vm_properties=CHECK_PROPERTIES)
+        self.rebuild(username, folder, vms)
+        for the_vm, props in vms.items():
+            meta = parse_meta(props.get('config.annotation'))
+            if props.get('name') == name and meta['component'] == component:
+                return the_vm, meta
+        return None, None
+
+    def _check(self, vcenter, entry, component, name):
+        """Confirm an entry against vCenter, in case another worker changed the VM"""
+        the_vm = vim.VirtualMachine(entry.moid, vcenter._conn._stub)
+        try:
+            props, _ = retrieve_vm(vcenter, the_vm, vm_properties=CHECK_PROPERTIES)
+        except vmodl.fault.ManagedObjectNotFound:
+            return None, None
+        meta = parse_meta(props.get('config.annotation'))
+        parent = props.get('parent')
+        if props.get('name') != name or meta['component'] != component:
+            return None, None
+        if parent is None or parent._moId != entry.folder:
+            return None, None
+        return the_vm, meta
+
+    def get(self, username, component, name):
+        """Look up an entry, without checking it against vCenter
+
+        :Returns: Entry, or None
+        """
+        with self._lock:
+            entries = self._users.get(username)
+            if entries is None:
+                return None
+            self._users.move_to_end(username)
+            return entries.get((component, name))
+
+    def add(self, username, component, name, the_vm, folder):
+        """Index a VM, like one that was just created
+
+        :Returns: None
+
+        :param the_vm: The VM
+        :type the_vm: vim.VirtualMachine
+
+        :param folder: The folder the VM is in
+        :type folder: vim.Folder
+        """
+        with self._lock:
+            # A user indexed only in part is fine; a miss reads the whole folder
+            entries = self._users.setdefault(username, {})
+            entries[(component, name)] = Entry(the_vm._moId, folder._moId)
+            self._touch(username)
+
+    def remove(self, username, component, name):
+        """Forget a VM, like one that was just destroyed
+
+        :Returns: None
+        """
+        with self._lock:
+            self._users.get(username, {}).pop((component, name), None)
+
+    def rebuild(self, username, folder, vms):
+        """Replace the entries of a user with every VM in their folder
+
+        :Returns: None
+
+        :param folder: The user's folder
+        :type folder: vim.Folder
+
+        :param vms: Mapping of vim.VirtualMachine -> properties, which include the name and annotation
+        :type vms: Dictionary
+        """
+        entries = {}
+        for the_vm, props in vms.items():
+            if 'name' not in props:
+                continue
+            component = parse_meta(props.get('config.annotation'))['component']
+            entries[(component, props['name'])] = Entry(the_vm._moId, folder._moId)
+        with self._lock:
+            self._users[username] = entries
+            self._touch(username)
+
+    def _touch(self, username):
+        """Mark a user as just used, and forget the least recently used past the limit"""
+        self._users.move_to_end(username)
+        while len(self._users) > self.max_users:
+            self._users.popitem(last=False)
+
+    def forget(self, username):
+        """Throw away the entries of a user
+
+        :Returns: None
+        """
+        with self._lock:
+            self._users.pop(username, None)
+
+
+index = MetaIndex(max_users=const.VLAB_ROUTER_META_INDEX_USERS)
+
+
+def find(vcenter, username, component, name):
+    """Find a user's VM by its component and name
+
+    :Returns: Tuple (vim.VirtualMachine, Dictionary of its meta data), or (None, None)
+    """
+    return index.find(vcenter, username, component, name)
+
+
+def add(username, component, name, the_vm, folder):
+    """Index a VM that was just created
+
+    :Returns: None
+    """
+    index.add(username, component, name, the_vm, folder)
+
+
+def remove(username, component, name):
+    """Forget a VM that was just destroyed
+
+    :Returns: None
+    """
+    index.remove(username, component, name)
+
+
+def rebuild(username, folder, vms):
+    """Replace the entries of a user with every VM in their folder
+
+    :Returns: None
+    """
+    index.rebuild(username, folder, vms)
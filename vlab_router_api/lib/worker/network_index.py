@@ -0,0 +1,157 @@
+# -*- coding: UTF-8 -*-
+"""
+A per-worker index of network name -> moId, so creating a Router doesn't have
+to read the name of every port group in the datacenter.
+
+Entries are just the class and moId of the network, so they aren't tied to the
+vCenter session they were read with. The index is an LRU of at most
+``VLAB_ROUTER_NETWORK_INDEX_SIZE`` names; a lookup that misses re-reads the
+names of every network in one PropertyCollector call, and keeps the ones of
+the user that asked. A network deleted within the TTL is forgotten when
+``create_router`` finds its moId gone, and looked up again.
+"""
+import time
+import threading
+from collections import OrderedDict
+
+from pyVmomi import vmodl
+from vlab_inf_common.vmware import vim
+
+from vlab_router_api.lib import const
+
+
+class NetworkIndex(object):
+    """Bounded cache of network name -> (network class, moId)
+
+    :param max_size: The most networks to remember
+    :type max_size: Integer
+
+    :param ttl: How many seconds before an entry must be read from vCenter again
+    :type ttl: Integer
+    """
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, vcenter, names, scope):
+        """Find networks by name
+
+        :Returns: Dictionary of name -> vim.Network, for the names that exist
+
+        :param vcenter: The connection to vCenter
+        :type vcenter: vlab_inf_common.vmware.vCenter
+
+        :param names: The names of the networks to find
+        :type names: List
+
+        :param scope: Also index every network whose name starts with this, like ``<username>_``
+        :type scope: String
+        """
+        found = self._get(names)
+        missing = [x for x in names if x not in found]
+        if missing:
+            with self._lock:
+                self.misses += len(missing)
+            self._refresh(vcenter, missing, scope)
+            found.update(self._get(missing))
+        stub = vcenter._conn._stub
+        # Bind to the session of the caller; the index could have been filled by another one
+        return {name: vimtype(moid, stub) for name, (vimtype, moid) in found.items()}
+
+    def _get(self, names):
+        """The entries for names that are in the index, and not expired"""
+        now = time.time()
+        found = {}
+        with self._lock:
+            for name in names:
+                entry = self._entries.get(name)
+                if entry is None:
+                    continue
+                vimtype, moid, added = entry
+                if now - added > self.ttl:
+                    del self._entries[name]
+                    continue
+                self._entries.move_to_end(name)
+                found[name] = (vimtype, moid)
+                self.hits += 1
+        return found
+
+    def _refresh(self, vcenter, names, scope):
+        """Read the name of every network with one PropertyCollector call"""
+        now = time.time()
+        wanted = set(names)
+        entries = []
+        for obj, name in _network_names(vcenter):
+            if name in wanted or name.startswith(scope):
+                entries.append((name, (type(obj), obj._moId, now)))
+        with self._lock:
+            for name, entry in entries:
+                self._entries[name] = entry
+                self._entries.move_to_end(name)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, names):
+        """Forget about networks, like when they've been deleted
+
+        :Returns: None
+
+        :param names: The names of the networks to forget
+        :type names: List
+        """
+        with self._lock:
+            for name in names:
+                self._entries.pop(name, None)
+
+
+def _network_names(vcenter):
+    """Read the name of every network in vCenter
+
+    :Returns: List of (vim.Network, String)
+    """
+    content = vcenter.content
+    view = content.viewManager.CreateContainerView(container=content.rootFolder,
+                                                   type=[vim.Network],
+                                                   recursive=True)
+    try:
+        to_view = vmodl.query.PropertyCollector.TraversalSpec(name='viewToNetworks',
+                                                              type=vim.view.ContainerView,
+                                                              path='view',
+                                                              skip=False)
+        obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True,
+                                                            selectSet=[to_view])
+        prop_spec = vmodl.query.PropertyCollector.PropertySpec(type=vim.Network,
+                                                               pathSet=['name'])
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=[obj_spec],
+                                                               propSet=[prop_spec])
+        answer = []
+        for obj_content in content.propertyCollector.RetrieveContents([filter_spec]):
+            props = {x.name: x.val for x in obj_content.propSet}
+            answer.append((obj_content.obj, props.get('name', '')))
+        return answer
+    finally:
+        view.DestroyView()
+
+
+index = NetworkIndex(max_size=const.VLAB_ROUTER_NETWORK_INDEX_SIZE,
+                     ttl=const.VLAB_ROUTER_NETWORK_INDEX_TTL)
+
+
+def lookup(vcenter, names, scope):
+    """Find networks by name, using the index of this worker process
+
+    :Returns: Dictionary of name -> vim.Network
+    """
+    return index.lookup(vcenter, names, scope)
+
+
+def invalidate(names):
+    """Forget about networks in the index of this worker process
+
+    :Returns: None
+    """
+    index.invalidate(names)
@@ -0,0 +1,185 @@
+# -*- coding: UTF-8 -*-
+"""
+Uploads the disks of an OVA through an HttpNfcLease, every disk at once.
+
+``vlab_inf_common.vmware.Ova.deploy`` sends one disk after another, reading
+each through the tarfile module. Here the file holding each disk (the OVA, or
+its copy in the image cache) is mapped into memory, and the disk is sent
+straight out of that mapping on its own connection, so nothing is copied into
+Python buffers and one slow stream doesn't hold up the others.
+
+A stream-optimized VMDK has to reach ESXi as one ordered stream; NFC can't
+take a disk in ranges, or pick up a stream where it broke. So parallelism is
+one connection per disk, and a disk whose connection fails is sent again from
+its first byte, up to ``VLAB_ROUTER_UPLOAD_RETRIES`` times.
+"""
+import time
+import mmap
+import threading
+import http.client
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from pyVmomi import vmodl
+from vlab_api_common import get_logger
+from vlab_inf_common.ssl_context import get_context
+
+from vlab_router_api.lib import const
+
+
+logger = get_logger(__name__, loglevel=const.VLAB_ROUTER_LOG_LEVEL)
+CHUNK_SIZE = 1024 * 1024
+# vCenter drops a lease that doesn't report progress for a few minutes
+PROGRESS_INTERVAL = 5
+RETRY_DELAY = 2
+TRANSIENT_ERRORS = (OSError, http.client.HTTPException)
+
+
+class UploadError(RuntimeError):
+    """ESXi refused a disk"""
+    pass
+
+
+class NfcUpload(object):
+    """Sends the disks of one OVA deploy
+
+    :param disks: Mapping of disk name -> (path to the file it's in, offset in that file, size)
+    :type disks: Dictionary
+
+    :param lease: The lease from ``ImportVApp``, in the ready state
+    :type lease: vim.HttpNfcLease
+
+    :param host: The name of the ESXi host the lease is for
+    :type host: String
+    """
+    def __init__(self, disks, lease, host):
+        self.disks = disks
+        self.lease = lease
+        self.host = host
+        self.sent = {}
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def total(self):
+        return sum(size for _, _, size in self.disks.values())
+
+    def progress(self):
+        """How much of the OVA has been sent, as a percent
+
+        :Returns: Integer
+        """
+        with self._lock:
+            sent = sum(self.sent.values())
+        if not self.total:
+            return 100
+        return min(99, int(sent * 100 / self.total))
+
+    def upload(self, file_items):
+        """Send every disk the import spec asks for, then complete the lease
+
+        :Returns: None
+
+        :param file_items: The ``fileItem`` of the import spec
+        :type file_items: List of vim.OvfManager.FileItem
+        """
+        urls = {x.importKey: x.url.replace('*', self.host) for x in self.lease.info.deviceUrl}
+        jobs = []
+        for file_item in file_items:
+            if file_item.path not in self.disks:
+                continue
+            try:
+                jobs.append((file_item.path, urls[file_item.deviceId]))
+            except KeyError:
+                raise RuntimeError('Failed to find deviceUrl for file {}'.format(file_item.path))
+        chimer = threading.Thread(target=self._chime, daemon=True)
+        chimer.start()
+        try:
+            workers = max(1, min(len(jobs), const.VLAB_ROUTER_UPLOAD_STREAMS))
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(self._send_disk, name, url) for name, url in jobs]
+                for future in futures:
+                    future.result()
+            self._done.set()
+            self.lease.Progress(100)
+            self.lease.Complete()
+        except vmodl.MethodFault as doh:
+            self._done.set()
+            self.lease.Abort(doh)
+            raise
+        except Exception as doh:
+            self._done.set()
+            self.lease.Abort(vmodl.fault.SystemError(reason=str(doh)))
+            raise
+
+    def _send_disk(self, name, url):
+        """Send one disk, again from the start if the connection breaks"""
+        path, offset, size = self.disks[name]
+        with open(path, 'rb') as the_file:
+            with mmap.mmap(the_file.fileno(), 0, access=mmap.ACCESS_READ) as source:
+                # Views are released explicitly; the mmap can't close while one is alive
+                with memoryview(source) as whole, whole[offset:offset + size] as view:
+                    for attempt in range(1, const.VLAB_ROUTER_UPLOAD_RETRIES + 2):
+                        try:
+                            return self._post(url, name, view)
+                        except TRANSIENT_ERRORS as doh:
+                            if attempt > const.VLAB_ROUTER_UPLOAD_RETRIES or self.lease.state != 'ready':
+                                raise
+                            logger.warning('Upload of {} failed, starting it over: {}'.format(name, doh))
+                            time.sleep(RETRY_DELAY * attempt)
+
+    def _post(self, url, name, view):
+        """Stream a disk to ESXi in one POST"""
+        parsed = urlparse(url)
+        conn = http.client.HTTPSConnection(parsed.hostname, parsed.port or 443, context=get_context())
+        with self._lock:
+            self.sent[name] = 0
+        try:
+            conn.putrequest('POST', parsed.path + ('?' + parsed.query if parsed.query else ''))
+            conn.putheader('Content-Length', str(len(view)))
+            conn.putheader('Content-Type', 'application/x-vnd.vmware-streamVmdk')
+            conn.putheader('Connection', 'close')
+            conn.endheaders()
+            for start in range(0, len(view), CHUNK_SIZE):
+                # Slicing a memoryview doesn't copy
+                with view[start:start + CHUNK_SIZE] as chunk:
+                    conn.send(chunk)
+                    with self._lock:
+                        self.sent[name] += len(chunk)
+            resp = conn.getresponse()
+            resp.read()
+            if resp.status not in (200, 201):
+                raise UploadError('Upload of {} failed: HTTP {} {}'.format(name, resp.status, resp.reason))
+        finally:
+            conn.close()
+
+    def _chime(self):
+        """Report progress on the lease until the upload is done, so vCenter keeps it alive"""
+        while not self._done.wait(PROGRESS_INTERVAL):
+            try:
+                self.lease.Progress(self.progress())
+            except vmodl.fault.ManagedObjectNotFound:
+                # The lease completed between the wait and the call
+                return
+            except Exception as doh:
+                logger.error('Unable to report upload progress: {}'.format(doh))
+
+
+def upload(disks, import_spec, lease, host):
+    """Send the disks of an OVA through an HttpNfcLease, in parallel
+
+    :Returns: None
+
+    :param disks: Where to read each disk from, from ``image_cache.disks``
+    :type disks: Dictionary
+
+    :param import_spec: The result of ``CreateImportSpec``
+    :type import_spec: vim.OvfManager.CreateImportSpecResult
+
+    :param lease: The lease from ``ImportVApp``, in the ready state
+    :type lease: vim.HttpNfcLease
+
+    :param host: The name of the ESXi host the lease is for
+    :type host: String
+    """
+    NfcUpload(disks, lease, host).upload(import_spec.fileItem or [])
@@ -0,0 +1,186 @@
+# -*- coding: UTF-8 -*-
+"""
+A persistent index of what's inside each Router OVA, so creating a Router
+doesn't have to open and parse the OVA just to learn what networks it has.
+"""
+import re
+import os
+import hashlib
+import tarfile
+import threading
+
+import ujson
+from vlab_api_common import get_logger
+
+from vlab_router_api.lib import const
+
+
+logger = get_logger(__name__, loglevel=const.VLAB_ROUTER_LOG_LEVEL)
+CHUNK_SIZE = 1024 * 1024
+MANIFEST_LINE = re.compile(r'^(SHA1|SHA256|SHA512)\((.+)\)\s*=\s*([0-9a-fA-F]+)$')
+
+
+class OvaIndex(object):
+    """Maps the file name of an OVA to its metadata. Entries are invalidated when
+    the size or mtime of the OVA changes.
+
+    :param images_dir: The directory that contains the OVA files
+    :type images_dir: String
+
+    :param index_file: Where to store the index on local disk
+    :type index_file: String
+    """
+    def __init__(self, images_dir, index_file):
+        self.images_dir = images_dir
+        self.index_file = index_file
+        self._entries = None
+        self._lock = threading.Lock()
+
+    def lookup(self, image_name):
+        """Obtain the metadata of an OVA
+
+        :Returns: Dictionary
+
+        :Raises: FileNotFoundError when there's no such OVA
+
+        :param image_name: The file name of the OVA, like router-vyos-1.1.8.ova
+        :type image_name: String
+        """
+        ova_path = os.path.join(self.images_dir, image_name)
+        ova_stat = os.stat(ova_path)
+        with self._lock:
+            if self._entries is None:
+                self._entries = self._load()
+            entry = self._entries.get(image_name)
+            if _is_current(entry, ova_stat):
+                return entry
+        logger.info('Indexing {}'.format(image_name))
+        entry = parse_ova(ova_path)
+        entry['size'] = ova_stat.st_size
+        entry['mtime'] = ova_stat.st_mtime_ns
+        with self._lock:
+            # Another process might have indexed a different image in the meantime
+            self._entries = self._load()
+            self._entries[image_name] = entry
+            self._save()
+        return entry
+
+    def refresh(self):
+        """Index every OVA in the images directory, and forget about removed ones
+
+        :Returns: None
+        """
+        image_names = [x for x in os.listdir(self.images_dir) if x.endswith('.ova')]
+        for image_name in image_names:
+            try:
+                self.lookup(image_name)
+            except (OSError, tarfile.TarError) as doh:
+                logger.error('Unable to index {}: {}'.format(image_name, doh))
+        with self._lock:
+            self._entries = self._load()
+            for image_name in set(self._entries.keys()) - set(image_names):
+                self._entries.pop(image_name)
+            self._save()
+
+    def _load(self):
+        try:
+            with open(self.index_file) as the_file:
+                return ujson.load(the_file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        tmp_file = '{}.{}.tmp'.format(self.index_file, os.getpid())
+        with open(tmp_file, 'w') as the_file:
+            ujson.dump(self._entries, the_file)
+        os.replace(tmp_file, self.index_file)
+
+
+def _is_current(entry, ova_stat):
+    """Test if an index entry describes the OVA as it is on disk
+
+    :Returns: Boolean
+    """
+    if entry is None:
+        return False
+    if any(x not in entry for x in ('offsets', 'manifest')):
+        # Indexed by an older version, which didn't record everything
+        return False
+    return entry['size'] == ova_stat.st_size and entry['mtime'] == ova_stat.st_mtime_ns
+
+
+def parse_manifest(text):
+    """Read the checksums out of the manifest (.mf file) of an OVA
+
+    :Returns: Dictionary of file name -> [algorithm, hex digest]
+
+    :param text: The contents of the manifest, like ``SHA256(router-disk1.vmdk)= 3f8a...``
+    :type text: String
+    """
+    manifest = {}
+    for line in text.splitlines():
+        found = MANIFEST_LINE.match(line.strip())
+        if found:
+            algorithm, name, digest = found.groups()
+            manifest[name] = [algorithm.lower(), digest.lower()]
+    return manifest
+
+
+def parse_ova(ova_path):
+    """Read the OVF descriptor, network names, disk sizes and offsets, manifest and checksum of an OVA
+
+    :Returns: Dictionary
+
+    :param ova_path: The absolute path to the OVA file
+    :type ova_path: String
+    """
+    ovf = ''
+    disks = {}
+    offsets = {}
+    manifest = {}
+    with tarfile.open(ova_path) as the_tar:
+        for member in the_tar.getmembers():
+            if member.name.endswith('.ovf'):
+                ovf = the_tar.extractfile(member).read().decode()
+            elif member.name.endswith('.mf'):
+                manifest = parse_manifest(the_tar.extractfile(member).read().decode())
+            elif member.name.endswith('.vmdk'):
+                disks[member.name] = member.size
+                # Where the disk starts in the OVA, so it can be uploaded without tarfile
+                offsets[member.name] = member.offset_data
+    # Same parsing that vlab_inf_common.vmware.Ova.networks does
+    networks = re.findall(r'Network ovf:name=[\w\ \"]{1,50}', ovf)
+    networks = [x.split('=')[1].replace('"', '') for x in networks]
+    checksum = hashlib.sha256()
+    with open(ova_path, 'rb') as the_file:
+        for chunk in iter(lambda: the_file.read(CHUNK_SIZE), b''):
+            checksum.update(chunk)
+    return {'ovf': ovf,
+            'networks': networks,
+            'disks': disks,
+            'offsets': offsets,
+            'manifest': manifest,
+            'sha256': checksum.hexdigest(),
+           }
+
+
+index = OvaIndex(images_dir=const.VLAB_ROUTER_IMAGES_DIR,
+                 index_file=const.VLAB_ROUTER_OVA_INDEX)
+
+
+def lookup(image_name):
+    """Obtain the metadata of an OVA in the images directory
+
+    :Returns: Dictionary
+
+    :Raises: FileNotFoundError when there's no such OVA
+    """
+    return index.lookup(image_name)
+
+
+def refresh():
+    """Index every OVA in the images directory
+
+    :Returns: None
+    """
+    index.refresh()
@@ -0,0 +1,243 @@
+# -*- coding: UTF-8 -*-
+"""
+Chooses the datastore, resource pool and ESXi host for a new Router, so a
+class full of students deploying at once doesn't hot-spot one datastore.
+
+Datastores come from ``VLAB_ROUTER_DATASTORES``; a datastore cluster
+(StoragePod) there stands for every datastore in it. A datastore is picked at
+random, weighted by its free space, the deploys this worker has in flight on it
+and how long its recent deploys took. Weighting, rather than always taking the
+best one, keeps the worker processes (which don't share their counts) from all
+piling onto the same datastore. The resource pool is the one from
+``VLAB_ROUTER_RESOURCE_POOLS`` with the fewest deploys in flight, among the
+pools whose cluster has a host that mounts a usable datastore. The host must be
+in the cluster of the pool, or vCenter refuses to import the OVA there.
+
+What vCenter knows (free space, which hosts mount what) is read with one
+PropertyCollector call, and reused for ``VLAB_ROUTER_PLACEMENT_TTL`` seconds.
+"""
+import time
+import random
+import threading
+from contextlib import contextmanager
+from collections import namedtuple, Counter
+
+from pyVmomi import vmodl
+from vlab_inf_common.vmware import vim
+
+from vlab_router_api.lib import const, metrics
+
+# How many seconds of recent deploy latency halves the weight of a datastore
+LATENCY_SCALE = 60.0
+# How much the latest deploy moves the average latency of its datastore
+LATENCY_WEIGHT = 0.3
+Placement = namedtuple('Placement', 'datastore pool host datastore_name pool_name host_name')
+
+
+class PlacementEngine(object):
+    """Picks where new Routers go
+
+    :param datastores: The names of the datastores, or datastore clusters, to use
+    :type datastores: List
+
+    :param pools: The names of the resource pools, or clusters, to use
+    :type pools: List
+
+    :param ttl: How many seconds to reuse what was read from vCenter
+    :type ttl: Integer
+    """
+    def __init__(self, datastores, pools, ttl):
+        self.datastores = datastores
+        self.pools = pools
+        self.ttl = ttl
+        self.in_flight = Counter()
+        self.latency = {}
+        self._inventory = None
+        self._read_at = 0
+        self._lock = threading.Lock()
+
+    def choose(self, vcenter):
+        """Pick the datastore, resource pool and host for a new Router
+
+        :Returns: Placement
+
+        :Raises: RuntimeError when none of the configured datastores or pools can be used,
+                 or no host of a pool's cluster mounts any of the datastores
+
+        :param vcenter: The connection to vCenter
+        :type vcenter: vlab_inf_common.vmware.vCenter
+        """
+        inventory = self._read(vcenter)
+        candidates = [x for x in inventory['datastores'] if x['free'] > 0 and x['hosts']]
+        if not candidates:
+            error = 'None of the datastores {} can be deployed to'.format(', '.join(self.datastores))
+            raise RuntimeError(error)
+        if not inventory['pools']:
+            error = 'None of the resource pools {} exist'.format(', '.join(self.pools))
+            raise RuntimeError(error)
+        pools = [x for x in inventory['pools'] if any(_shared_hosts(x, y) for y in candidates)]
+        if not pools:
+            error = 'No host in the clusters of {} mounts any of the datastores {}'.format(', '.join(self.pools),
+                                                                                            ', '.join(self.datastores))
+            raise RuntimeError(error)
+        with self._lock:
+            fewest = min(self.in_flight[x['name']] for x in pools)
+            pool = random.choice([x for x in pools if self.in_flight[x['name']] == fewest])
+            candidates = [x for x in candidates if _shared_hosts(pool, x)]
+            weights = [self._weight(x) for x in candidates]
+            datastore = _weighted_choice(candidates, weights)
+        host_moid, host_name = random.choice(_shared_hosts(pool, datastore))
+        stub = vcenter._conn._stub
+        # Bind to the session of the caller; the inventory could have been read with another one
+        return Placement(datastore=vim.Datastore(datastore['moid'], stub),
+                         pool=vim.ResourcePool(pool['moid'], stub),
+                         host=vim.HostSystem(host_moid, stub),
+                         datastore_name=datastore['name'],
+                         pool_name=pool['name'],
+                         host_name=host_name)
+
+    def _weight(self, datastore):
+        """Free bytes, shared by the deploys in flight, and discounted for slow deploys"""
+        in_flight = self.in_flight[datastore['name']]
+        latency = self.latency.get(datastore['name'], 0)
+        return datastore['free'] / ((1.0 + in_flight) * (1.0 + latency / LATENCY_SCALE))
+
+    @contextmanager
+    def busy(self, *names):
+        """Count work on datastores and pools while the ``with`` block runs
+
+        :Returns: None
+
+        :param names: The datastores and pools being worked on; None is ignored
+        :type names: String
+        """
+        names = [x for x in names if x]
+        with self._lock:
+            self.in_flight.update(names)
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.in_flight.subtract(names)
+                self.in_flight += Counter()
+
+    @contextmanager
+    def deploying(self, placement):
+        """Count a deploy as in flight, and learn how long it took
+
+        :Returns: None
+
+        :param placement: Where the Router is being deployed
+        :type placement: Placement
+        """
+        start = time.perf_counter()
+        with self.busy(placement.datastore_name, placement.pool_name):
+            yield
+        seconds = time.perf_counter() - start
+        metrics.histograms.observe(metrics.DEPLOY_METRIC, {'datastore': placement.datastore_name}, seconds)
+        with self._lock:
+            before = self.latency.get(placement.datastore_name, seconds)
+            self.latency[placement.datastore_name] = before + LATENCY_WEIGHT * (seconds - before)
+
+    def _read(self, vcenter):
+        """What vCenter knows about the configured datastores and pools, cached for ``ttl`` seconds"""
+        with self._lock:
+            if self._inventory is not None and time.time() - self._read_at < self.ttl:
+                return self._inventory
+        inventory = _read_inventory(vcenter, self.datastores, self.pools)
+        with self._lock:
+            self._inventory = inventory
+            self._read_at = time.time()
+        return inventory
+
+
+def _shared_hosts(pool, datastore):
+    """The hosts of a pool's cluster that mount a datastore"""
+    return [x for x in datastore['hosts'] if x[0] in pool['hosts']]
+
+
+def _weighted_choice(items, weights):
+    """``random.choices`` with one pick; that function needs Python 3.6"""
+    total = sum(weights)
+    if total <= 0:
+        return random.choice(items)
+    point = random.uniform(0, total)
+    for item, weight in zip(items, weights):
+        point -= weight
+        if point <= 0:
+            return item
+    return items[-1]
+
+
+def _read_inventory(vcenter, datastore_names, pool_names):
+    """Read every datastore, datastore cluster, pool and host with one PropertyCollector call
+
+    :Returns: Dictionary with "datastores" and "pools"
+    """
+    types = {vim.Datastore: ['name', 'summary.freeSpace', 'summary.accessible', 'host'],
+             vim.StoragePod: ['name', 'childEntity'],
+             vim.ResourcePool: ['name', 'owner'],
+             vim.ComputeResource: ['name', 'resourcePool', 'host'],
+             vim.HostSystem: ['name', 'runtime.inMaintenanceMode'],
+            }
+    content = vcenter.content
+    view = content.viewManager.CreateContainerView(container=content.rootFolder,
+                                                   type=list(types.keys()),
+                                                   recursive=True)
+    try:
+        to_view = vmodl.query.PropertyCollector.TraversalSpec(name='viewToObjects',
+                                                              type=vim.view.ContainerView,
+                                                              path='view',
+                                                              skip=False)
+        obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=view, skip=True, selectSet=[to_view])
+        prop_specs = [vmodl.query.PropertyCollector.PropertySpec(type=k, pathSet=v) for k, v in types.items()]
+        filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=[obj_spec], propSet=prop_specs)
+        found = {x: [] for x in types.keys()}
+        for obj_content in content.propertyCollector.RetrieveContents([filter_spec]):
+            props = {x.name: x.val for x in obj_content.propSet}
+            for vimtype in types.keys():
+                # A ClusterComputeResource is a ComputeResource too; file it once
+                if isinstance(obj_content.obj, vimtype):
+                    found[vimtype].append((obj_content.obj, props))
+                    break
+    finally:
+        view.DestroyView()
+    wanted = set(datastore_names)
+    for pod, props in found[vim.StoragePod]:
+        if props['name'] in datastore_names:
+            wanted.update(x._moId for x in props.get('childEntity') or [])
+    hosts = {x._moId: props['name'] for x, props in found[vim.HostSystem]
+             if not props.get('runtime.inMaintenanceMode')}
+    datastores = []
+    for datastore, props in found[vim.Datastore]:
+        if props['name'] not in wanted and datastore._moId not in wanted:
+            continue
+        if not props.get('summary.accessible', True):
+            continue
+        usable = [(x.key._moId, hosts[x.key._moId]) for x in props.get('host') or []
+                  if x.key._moId in hosts and x.mountInfo.accessible is not False]
+        datastores.append({'name': props['name'], 'moid': datastore._moId,
+                           'free': props.get('summary.freeSpace') or 0, 'hosts': usable})
+    # A pool can only place VMs on the hosts of the cluster that owns it
+    clusters = {x._moId: [y._moId for y in props.get('host') or []] for x, props in found[vim.ComputeResource]}
+    pools = [{'name': props['name'], 'moid': x._moId,
+              'hosts': clusters.get(getattr(props.get('owner'), '_moId', None), [])}
+             for x, props in found[vim.ResourcePool] if props['name'] in pool_names]
+    # Like vCenter.resource_pools, the name of a cluster means its root pool
+    pools += [{'name': props['name'], 'moid': props['resourcePool']._moId, 'hosts': clusters[x._moId]}
+              for x, props in found[vim.ComputeResource]
+              if props['name'] in pool_names and props.get('resourcePool') is not None]
+    return {'datastores': datastores, 'pools': pools}
+
+
+engine = PlacementEngine(datastores=const.VLAB_ROUTER_DATASTORES,
+                         pools=const.VLAB_ROUTER_RESOURCE_POOLS,
+                         ttl=const.VLAB_ROUTER_PLACEMENT_TTL)
+
+
+def choose(vcenter):
+    """Pick the datastore, resource pool and host for a new Router
+
+    :Returns: Placement
+    """
+    return engine.choose(vcenter)
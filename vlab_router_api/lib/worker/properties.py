@@ -0,0 +1,122 @@
+# -*- coding: UTF-8 -*-
+"""
+Reads VM properties in bulk through the PropertyCollector, rather than with
+a SOAP round trip per lazy pyVmomi attribute.
+"""
+import ujson
+from pyVmomi import vmodl
+from vlab_inf_common.vmware import vim
+
+VM_PROPERTIES = ['name', 'config.annotation', 'runtime.powerState', 'guest.net', 'network']
+
+
+def retrieve_folder(vcenter, folder, vm_properties=VM_PROPERTIES):
+    """Read the properties of every VM in a folder with a single PropertyCollector
+    call, instead of a round trip per lazy pyVmomi attribute.
+
+    :Returns: Tuple (Dictionary of vim.VirtualMachine -> properties, Dictionary of network moId -> name)
+
+    :param vcenter: The connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param folder: The folder that contains the VMs
+    :type folder: vim.Folder
+
+    :param vm_properties: The VM properties to read
+    :type vm_properties: List
+    """
+    return _retrieve(vcenter, folder_filter_spec(folder, vm_properties))
+
+
+def folder_filter_spec(folder, vm_properties=VM_PROPERTIES):
+    """Describe the VMs of a folder, and the names of their networks, for the PropertyCollector
+
+    :Returns: vmodl.query.PropertyCollector.FilterSpec
+
+    :param folder: The folder that contains the VMs
+    :type folder: vim.Folder
+
+    :param vm_properties: The VM properties to read
+    :type vm_properties: List
+    """
+    to_children = vmodl.query.PropertyCollector.TraversalSpec(name='folderToChildren',
+                                                              type=vim.Folder,
+                                                              path='childEntity',
+                                                              skip=False,
+                                                              selectSet=[_to_networks()])
+    obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=folder, skip=True,
+                                                        selectSet=[to_children])
+    return _filter_spec(obj_spec, vm_properties)
+
+
+def retrieve_vm(vcenter, the_vm, vm_properties=VM_PROPERTIES):
+    """Read the properties of one VM, and the names of its networks, with a
+    single PropertyCollector call.
+
+    :Returns: Tuple (Dictionary of properties, Dictionary of network moId -> name)
+
+    :param vcenter: The connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param the_vm: The VM to read
+    :type the_vm: vim.VirtualMachine
+
+    :param vm_properties: The VM properties to read
+    :type vm_properties: List
+    """
+    obj_spec = vmodl.query.PropertyCollector.ObjectSpec(obj=the_vm, skip=False,
+                                                        selectSet=[_to_networks()])
+    vms, network_names = _retrieve(vcenter, _filter_spec(obj_spec, vm_properties))
+    return vms.get(the_vm, {}), network_names
+
+
+def _to_networks():
+    return vmodl.query.PropertyCollector.TraversalSpec(name='vmToNetwork',
+                                                       type=vim.VirtualMachine,
+                                                       path='network',
+                                                       skip=False)
+
+
+def _filter_spec(obj_spec, vm_properties):
+    """Ask for VMs and, if the network property is wanted, the names of their networks"""
+    prop_specs = [vmodl.query.PropertyCollector.PropertySpec(type=vim.VirtualMachine,
+                                                             pathSet=vm_properties)]
+    if 'network' in vm_properties:
+        prop_specs.append(vmodl.query.PropertyCollector.PropertySpec(type=vim.Network,
+                                                                     pathSet=['name']))
+    return vmodl.query.PropertyCollector.FilterSpec(objectSet=[obj_spec],
+                                                    propSet=prop_specs)
+
+
+def _retrieve(vcenter, filter_spec):
+    """Run one PropertyCollector query for VMs and their network names"""
+    vms = {}
+    network_names = {}
+    for content in vcenter.content.propertyCollector.RetrieveContents([filter_spec]):
+        props = {x.name: x.val for x in content.propSet}
+        if isinstance(content.obj, vim.VirtualMachine):
+            vms[content.obj] = props
+        elif isinstance(content.obj, vim.Network):
+            network_names[content.obj._moId] = props.get('name', '')
+    return vms, network_names
+
+
+def parse_meta(annotation):
+    """Convert the notes of a VM into the meta data vLab stores there
+
+    :Returns: Dictionary
+
+    :param annotation: The VM's ``config.annotation``; None if the VM has no config yet
+    :type annotation: String
+    """
+    try:
+        return ujson.loads(annotation)
+    except (ValueError, TypeError):
+        # ValueError -> VM created, but notes not updated
+        # TypeError  -> VM failed to be created, or is still being deployed
+        return {'component': 'Unknown',
+                'created': 0,
+                'version': "Unknown",
+                'generation': 0,
+                'configured': False
+               }
@@ -0,0 +1,231 @@
+# -*- coding: UTF-8 -*-
+"""
+Keeps authenticated vCenter sessions around between tasks, so a worker process
+only pays for the TLS handshake and login when it actually has to.
+"""
+import os
+import time
+import threading
+from contextlib import contextmanager
+
+from vlab_api_common import get_logger
+from vlab_inf_common.vmware import vCenter, vim
+
+from vlab_router_api.lib import const, metrics
+
+
+logger = get_logger(__name__, loglevel=const.VLAB_ROUTER_LOG_LEVEL)
+
+
+class SessionPool(object):
+    """A per-process pool of authenticated connections to vCenter.
+
+    :param host: The IP/FQDN of the vCenter server
+    :type host: String
+
+    :param user: The user account to authenticate with
+    :type user: String
+
+    :param password: The password of the user account
+    :type password: String
+
+    :param port: The port the vCenter server listens on
+    :type port: Integer
+
+    :param max_size: The most sessions the pool will have open at the same time
+    :type max_size: Integer
+
+    :param max_idle: How many seconds a session can go unused before it's thrown away
+    :type max_idle: Integer
+
+    :param check_after: How many seconds a session can go unused before it's
+                        health checked prior to being handed out again
+    :type check_after: Integer
+
+    :param timeout: How many seconds to block waiting on a free session
+    :type timeout: Integer
+    """
+    def __init__(self, host, user, password, port=443, max_size=4, max_idle=1500,
+                 check_after=60, timeout=300):
+        self._host = host
+        self._user = user
+        self._password = password
+        self._port = port
+        self.max_size = max_size
+        self.max_idle = max_idle
+        self.check_after = check_after
+        self.timeout = timeout
+        self._reset()
+
+    def _reset(self):
+        """Start over with an empty pool, and zeroed counters"""
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_size)
+        self._idle = []
+        self._open = 0
+        self.hits = 0
+        self.misses = 0
+        self.reconnects = 0
+
+    def _check_fork(self):
+        """Celery forks its worker processes; a socket opened by the parent cannot
+        be shared with the children, so forget (but don't logout) those sessions.
+        """
+        if os.getpid() != self._pid:
+            self._reset()
+
+    def stats(self):
+        """Obtain counters that describe how well the pool is working
+
+        :Returns: Dictionary
+        """
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'reconnects': self.reconnects,
+                    'open': self._open,
+                    'idle': len(self._idle),
+                    'max_size': self.max_size,
+                   }
+
+    @contextmanager
+    def session(self):
+        """Borrow an authenticated connection to vCenter
+
+        :Returns: vlab_inf_common.vmware.vCenter
+
+        :Raises: RuntimeError when no session is freed up within ``timeout`` seconds
+        """
+        self._check_fork()
+        with metrics.phase_timer('session', 'open'):
+            if not self._slots.acquire(timeout=self.timeout):
+                error = 'No vCenter session available after {} seconds'.format(self.timeout)
+                raise RuntimeError(error)
+            try:
+                vcenter = self._checkout()
+            except Exception:
+                self._slots.release()
+                raise
+        try:
+            yield vcenter
+        except vim.fault.NotAuthenticated:
+            # vCenter expired the session out from under us; don't recycle it
+            self._discard(vcenter)
+            vcenter = None
+            raise
+        finally:
+            if vcenter is not None:
+                self._checkin(vcenter)
+            self._slots.release()
+
+    def _checkout(self):
+        """Hand out an idle session if there's a healthy one, otherwise login
+
+        :Returns: vlab_inf_common.vmware.vCenter
+        """
+        now = time.time()
+        while True:
+            with self._lock:
+                if not self._idle:
+                    break
+                vcenter, last_used = self._idle.pop()
+            idle_for = now - last_used
+            if idle_for > self.max_idle:
+                self._discard(vcenter)
+            elif idle_for > self.check_after and not _is_alive(vcenter):
+                with self._lock:
+                    self.reconnects += 1
+                self._discard(vcenter)
+            else:
+                with self._lock:
+                    self.hits += 1
+                # The network mapping is cached on the object; don't let it go stale
+                vcenter._net_cache = None
+                return vcenter
+        vcenter = vCenter(host=self._host, user=self._user, password=self._password,
+                          port=self._port)
+        with self._lock:
+            self.misses += 1
+            self._open += 1
+            logger.info('Opened new vCenter session; hits: {}, misses: {}, open: {}'.format(self.hits, self.misses, self._open))
+        return vcenter
+
+    def _checkin(self, vcenter):
+        """Return a session to the pool, so another task can use it"""
+        with self._lock:
+            self._idle.append((vcenter, time.time()))
+
+    def _discard(self, vcenter):
+        """Logout of a session, and stop tracking it"""
+        with self._lock:
+            self._open -= 1
+        try:
+            vcenter.close()
+        except Exception:
+            # Most likely already expired; nothing left to cleanup
+            pass
+
+    def close(self):
+        """Logout of every idle session in the pool"""
+        self._check_fork()
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for vcenter, _ in idle:
+            self._discard(vcenter)
+
+
+def _is_alive(vcenter):
+    """Test if vCenter still considers a session to be logged in
+
+    :Returns: Boolean
+
+    :param vcenter: The connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+    """
+    try:
+        return vcenter.content.sessionManager.currentSession is not None
+    except Exception:
+        return False
+
+
+_POOL = None
+_POOL_LOCK = threading.Lock()
+
+
+def get_pool():
+    """Obtain the session pool for this worker process
+
+    :Returns: SessionPool
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            max_size = const.VLAB_VCENTER_POOL_SIZE
+            if const.VLAB_ROUTER_WORKER_ENGINE in ('threads', 'asyncio'):
+                # Enough for every engine thread, so reads don't wait on sessions held by deploys
+                max_size = max(max_size, const.VLAB_ROUTER_FAST_THREADS + const.VLAB_ROUTER_SLOW_THREADS)
+            _POOL = SessionPool(host=const.INF_VCENTER_SERVER,
+                                user=const.INF_VCENTER_USER,
+                                password=const.INF_VCENTER_PASSWORD,
+                                port=const.INF_VCENTER_PORT,
+                                max_size=max_size,
+                                max_idle=const.VLAB_VCENTER_SESSION_IDLE,
+                                check_after=const.VLAB_VCENTER_SESSION_CHECK)
+        return _POOL
+
+
+def session():
+    """Borrow an authenticated connection to vCenter from this process's pool
+
+    :Returns: contextmanager
+    """
+    return get_pool().session()
+
+
+def stats():
+    """Obtain the hit/miss counters of this process's pool
+
+    :Returns: Dictionary
+    """
+    return get_pool().stats()
@@ -2,13 +2,96 @@
 """
 Entry point logic for available backend worker tasks
 """
-from celery import Celery
+import time
+from threading import Thread
+
+from celery.signals import worker_ready, task_prerun, task_postrun
 from vlab_api_common import get_task_logger
 
-from vlab_router_api.lib import const
-from vlab_router_api.lib.worker import vmware
+from vlab_router_api.lib import const, metrics, admission
+from vlab_router_api.lib.celery_config import make_celery
+from vlab_router_api.lib.worker import vmware, inventory, ova_index, image_cache, worker_engine
+
+app = make_celery()
+worker_engine.configure(app)
+if const.VLAB_ROUTER_WARM_POOL_SIZE:
+    app.conf.beat_schedule = {'replenish-router-pool': {'task': 'router.replenish_pool',
+                                                        'schedule': const.VLAB_ROUTER_WARM_POOL_INTERVAL,
+                                                        'args': ['beat'],
+                                                        'options': {'expires': const.VLAB_ROUTER_WARM_POOL_INTERVAL}}}
+
+
+@worker_ready.connect
+def start_inventory_watcher(**kwargs):
+    """Keep the cached Router inventories fresh by listening for changes in vCenter"""
+    if const.VLAB_ROUTER_INVENTORY_WATCH:
+        inventory.start_watcher()
+
+
+@worker_ready.connect
+def prune_metrics(**kwargs):
+    """Stop reporting the numbers of worker processes that ran before this worker started"""
+    metrics.prune()
+
+
+@worker_ready.connect
+def build_ova_index(**kwargs):
+    """Index every Router OVA up front, and copy the newest into the image cache,
+    so the first create of each version is fast"""
+    Thread(target=_prepare_images, daemon=True).start()
+
+
+def _prepare_images():
+    """Index the OVAs before caching them; the cache needs their manifests"""
+    ova_index.refresh()
+    image_cache.warm()
+
+
+_task_started = {}
+
+
+def _progress(task):
+    """Make a function that publishes the progress of a task, so clients
+    following the status of the task see each phase as it happens.
+
+    :Returns: Function
+
+    :param task: The running task
+    :type task: celery.Task
+    """
+    # The request is thread local, and the threads and asyncio engines report from other threads
+    task_id = task.request.id
+    called_directly = task.request.called_directly
+    def report(phase, **details):
+        if called_directly:
+            # Not running in a worker, so nobody is following the status
+            return
+        details['phase'] = phase
+        task.update_state(task_id=task_id, state='PROGRESS', meta=details)
+    return report
+
 
-app = Celery('router', backend='rpc://', broker=const.VLAB_MESSAGE_BROKER)
+@task_prerun.connect
+def start_task_timer(task_id, task, **kwargs):
+    """Note when a task starts running, for the task duration metrics"""
+    _task_started[task_id] = time.perf_counter()
+
+
+@task_postrun.connect
+def stop_task_timer(task_id, task, **kwargs):
+    """Record how long a task ran, including tasks that raised"""
+    started = _task_started.pop(task_id, None)
+    if started is not None:
+        metrics.observe_task(task.name, time.perf_counter() - started)
+
+
+@task_postrun.connect
+def release_deploy_leases(task_id, task, args, **kwargs):
+    """Let the API admit more deploys, now that this one is done"""
+    if task.name == 'router.create':
+        admission.release(app, args[0], task_id)
+    elif task.name == 'router.create_many':
+        admission.release(app, args[0], task_id, len(args[1]))
 
 
 @app.task(name='router.show', bind=True)
@@ -27,7 +110,7 @@ def show(self, username, txn_id):
     resp = {'content' : {}, 'error': None, 'params': {}}
     logger.info('Task starting')
     try:
-        info = vmware.show_router(username)
+        info = worker_engine.run(self.name, vmware.show_router, username)
     except ValueError as doh:
         logger.error('Task failed: {}'.format(doh))
         resp['error'] = '{}'.format(doh)
@@ -62,7 +145,8 @@ def create(self, username, machine_name, image, requested_networks, txn_id):
     resp = {'content' : {}, 'error': None, 'params': {}}
     logger.info('Task starting')
     try:
-        resp['content'] = vmware.create_router(username, machine_name, image, requested_networks, logger)
+        resp['content'] = worker_engine.run(self.name, vmware.create_router, username, machine_name, image,
+                                            requested_networks, logger, progress=_progress(self))
     except ValueError as doh:
         logger.error('Task failed: {}'.format(doh))
         resp['error'] = '{}'.format(doh)
@@ -71,9 +155,14 @@ def create(self, username, machine_name, image, requested_networks, txn_id):
 
 
 @app.task(name='router.delete', bind=True)
-def delete(self, username, machine_name, txn_id):
+def delete(self, username, machine_name, txn_id, delete_task=None):
     """Destroy an instance of Router
 
+    Instead of holding a worker while vCenter destroys the disks, the task
+    retries itself every ``VLAB_ROUTER_DELETE_POLL`` seconds until the vCenter
+    task is done. Retries keep the same task id, so the status link given to
+    the client works the whole time.
+
     :Returns: Dictionary
 
     :param username: The name of the user who wants to delete an instance of Router
@@ -82,6 +171,72 @@ def delete(self, username, machine_name, txn_id):
     :param machine_name: The name of the instance of Router
     :type machine_name: String
 
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+
+    :param delete_task: The moId of the vCenter task destroying the Router. Only set by retries.
+    :type delete_task: String
+    """
+    logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_ROUTER_LOG_LEVEL.upper())
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    if delete_task is None:
+        logger.info('Task starting')
+        try:
+            delete_task = worker_engine.run(self.name, vmware.delete_router, username, machine_name, logger,
+                                            wait=False, progress=_progress(self))
+        except ValueError as doh:
+            logger.error('Task failed: {}'.format(doh))
+            resp['error'] = '{}'.format(doh)
+            return resp
+    if not worker_engine.run(self.name, vmware.task_done, delete_task):
+        logger.debug('Waiting on {}'.format(delete_task))
+        raise self.retry(kwargs={'delete_task': delete_task},
+                         countdown=const.VLAB_ROUTER_DELETE_POLL,
+                         max_retries=const.VLAB_ROUTER_DELETE_TIMEOUT // const.VLAB_ROUTER_DELETE_POLL)
+    inventory.invalidate(username)
+    logger.info('Task complete')
+    return resp
+
+
+@app.task(name='router.create_many', bind=True)
+def create_many(self, username, routers, txn_id):
+    """Deploy many new instances of Router, like for a whole class of students
+
+    :Returns: Dictionary
+
+    :param username: The name of the user who wants to create the Routers
+    :type username: String
+
+    :param routers: The Routers to create; each has a "name", "image" and "networks"
+    :type routers: List
+
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+    """
+    logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_ROUTER_LOG_LEVEL.upper())
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    resp['content'], failures = worker_engine.run(self.name, vmware.create_routers, username, routers, logger,
+                                                  progress=_progress(self))
+    if failures:
+        resp['error'] = '{} of {} Routers failed to be created'.format(failures, len(routers))
+        logger.error('Task failed: {}'.format(resp['error']))
+    logger.info('Task complete')
+    return resp
+
+
+@app.task(name='router.delete_many', bind=True)
+def delete_many(self, username, machine_names, txn_id):
+    """Destroy many instances of Router
+
+    :Returns: Dictionary
+
+    :param username: The name of the user who wants to delete the Routers
+    :type username: String
+
+    :param machine_names: The names of the Routers to delete. Empty means every Router the user has.
+    :type machine_names: List
+
     :param txn_id: A unique string supplied by the client to track the call through logs
     :type txn_id: String
     """
@@ -89,12 +244,16 @@ def delete(self, username, machine_name, txn_id):
     resp = {'content' : {}, 'error': None, 'params': {}}
     logger.info('Task starting')
     try:
-        vmware.delete_router(username, machine_name, logger)
+        resp['content'], failures = worker_engine.run(self.name, vmware.delete_routers, username, machine_names, logger,
+                                                      progress=_progress(self))
     except ValueError as doh:
         logger.error('Task failed: {}'.format(doh))
         resp['error'] = '{}'.format(doh)
-    else:
-        logger.info('Task complete')
+        return resp
+    if failures:
+        resp['error'] = '{} of {} Routers failed to be deleted'.format(failures, len(resp['content']))
+        logger.error('Task failed: {}'.format(resp['error']))
+    logger.info('Task complete')
     return resp
 
 
@@ -110,6 +269,23 @@ def image(self, txn_id):
     logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_ROUTER_LOG_LEVEL.upper())
     resp = {'content' : {}, 'error': None, 'params': {}}
     logger.info('Task starting')
-    resp['content'] = {'image': vmware.list_images()}
+    resp['content'] = {'image': worker_engine.run(self.name, vmware.list_images)}
+    logger.info('Task complete')
+    return resp
+
+
+@app.task(name='router.replenish_pool', bind=True)
+def replenish_pool(self, txn_id):
+    """Deploy Routers into the warm pool, so creates don't have to wait on a deploy
+
+    :Returns: Dictionary
+
+    :param txn_id: A unique string supplied by the client to track the call through logs
+    :type txn_id: String
+    """
+    logger = get_task_logger(txn_id=txn_id, task_id=self.request.id, loglevel=const.VLAB_ROUTER_LOG_LEVEL.upper())
+    resp = {'content' : {}, 'error': None, 'params': {}}
+    logger.info('Task starting')
+    resp['content'] = {'deployed': worker_engine.run(self.name, vmware.replenish_pool, logger)}
     logger.info('Task complete')
     return resp
@@ -1,12 +1,24 @@
 # -*- coding: UTF-8 -*-
 """Business logic for backend worker tasks"""
+import re
 import time
 import random
 import os.path
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
 from celery.utils.log import get_task_logger
-from vlab_inf_common.vmware import vCenter, Ova, vim, virtual_machine, consume_task
+from pyVmomi import vmodl
+from vlab_inf_common.vmware import vim, virtual_machine, consume_task
+
+from vlab_router_api.lib import const, metrics
+from vlab_router_api.lib.image_index import convert_name
+from vlab_router_api.lib.worker import session_pool, inventory, ova_index, linked_clone, warm_pool, network_index, placement, nfc_upload, image_cache, folder_diff, meta_index
+from vlab_router_api.lib.worker.properties import retrieve_folder, retrieve_vm, parse_meta, VM_PROPERTIES
+
 
-from vlab_router_api.lib import const
+def _no_progress(phase, **details):
+    """The default for functions that report progress; reports nothing"""
+    pass
 
 
 def show_router(username):
@@ -17,21 +29,81 @@ def show_router(username):
     :param username: The user requesting info about their Router
     :type username: String
     """
+    router_vms = inventory.get(username)
+    if router_vms is not None:
+        # The cache has no consoles; each ticket in one is only good once
+        with session_pool.session() as vcenter:
+            with metrics.phase_timer('show_router', 'console'):
+                for info in router_vms.values():
+                    the_vm = vim.VirtualMachine(info['moid'], vcenter._conn._stub)
+                    info['console'] = virtual_machine._get_vm_console_url(vcenter, the_vm)
+        return router_vms
     router_vms = {}
-    with vCenter(host=const.INF_VCENTER_SERVER, user=const.INF_VCENTER_USER, \
-                 password=const.INF_VCENTER_PASSWORD) as vcenter:
-        folder = vcenter.get_by_name(name=username, vimtype=vim.Folder)
-        for vm in folder.childEntity:
-            info = virtual_machine.get_info(vcenter, vm, username)
-            if info['meta']['component'] == 'Router':
-                router_vms[vm.name] = info
+    fetched_at = time.time()
+    with session_pool.session() as vcenter:
+        with metrics.phase_timer('show_router', 'folder_lookup'):
+            folder = vcenter.get_by_name(name=username, vimtype=vim.Folder)
+        with metrics.phase_timer('show_router', 'get_info'):
+            if const.VLAB_ROUTER_SHOW_INCREMENTAL:
+                vms, network_names = folder_diff.retrieve(vcenter, username, folder)
+            else:
+                vms, network_names = retrieve_folder(vcenter, folder)
+            meta_index.rebuild(username, folder, vms)
+            for vm, props in vms.items():
+                meta = parse_meta(props.get('config.annotation'))
+                if meta['component'] == 'Router':
+                    router_vms[props['name']] = make_info(vcenter, vm, props, meta,
+                                                          network_names, username)
+    inventory.store(username, router_vms, fetched_at)
     return router_vms
 
 
-def delete_router(username, machine_name, logger):
+def make_info(vcenter, the_vm, props, meta, network_names, username):
+    """Build the same output as ``virtual_machine.get_info`` from pre-fetched properties
+
+    :Returns: Dictionary
+
+    :param vcenter: The connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param the_vm: The VM to describe
+    :type the_vm: vim.VirtualMachine
+
+    :param props: The properties of the VM, as read by ``retrieve_folder``
+    :type props: Dictionary
+
+    :param meta: The parsed meta data of the VM
+    :type meta: Dictionary
+
+    :param network_names: Mapping of network moId to network name
+    :type network_names: Dictionary
+
+    :param username: The name of the user who owns the VM
+    :type username: String
+    """
+    ips = []
+    for nic in props.get('guest.net', []):
+        ips += nic.ipAddress
+    networks = []
+    for network in props.get('network', []):
+        net_name = network_names.get(network._moId, '')
+        if net_name.startswith(username):
+            networks.append(net_name.replace('{}_'.format(username), ''))
+    info = {}
+    info['state'] = props.get('runtime.powerState')
+    info['console'] = virtual_machine._get_vm_console_url(vcenter, the_vm)
+    # No point is showing the IPv6 link local addrs if a firewall wont forward them
+    info['ips'] = [x for x in ips if not x.startswith('fe80::')]
+    info['networks'] = networks
+    info['moid'] = the_vm._moId
+    info['meta'] = meta
+    return info
+
+
+def delete_router(username, machine_name, logger, wait=True, progress=_no_progress):
     """Unregister and destroy a user's Router
 
-    :Returns: None
+    :Returns: None, or the moId of the vCenter task destroying the VM when ``wait`` is False
 
     :param username: The user who wants to delete their jumpbox
     :type username: String
@@ -41,25 +113,55 @@ def delete_router(username, machine_name, logger):
 
     :param logger: An object for logging messages
     :type logger: logging.LoggerAdapter
+
+    :param wait: Set to False to return as soon as vCenter starts destroying the VM. Default True
+    :type wait: Boolean
+
+    :param progress: Called with the name of each phase as it starts, for reporting progress
+    :type progress: Function
     """
-    with vCenter(host=const.INF_VCENTER_SERVER, user=const.INF_VCENTER_USER, \
-                 password=const.INF_VCENTER_PASSWORD) as vcenter:
-        folder = vcenter.get_by_name(name=username, vimtype=vim.Folder)
-        for entity in folder.childEntity:
-            if entity.name == machine_name:
-                info = virtual_machine.get_info(vcenter, entity, username)
-                if info['meta']['component'] == 'Router':
-                    logger.debug('powering off VM')
-                    virtual_machine.power(entity, state='off')
-                    delete_task = entity.Destroy_Task()
-                    logger.debug('blocking while VM is being destroyed')
-                    consume_task(delete_task)
-                    break
-        else:
+    with session_pool.session() as vcenter:
+        progress('session_opened')
+        with metrics.phase_timer('delete_router', 'get_info'):
+            the_vm, meta = meta_index.find(vcenter, username, 'Router', machine_name)
+        if the_vm is None:
             raise ValueError('No {} named {} found'.format('router', machine_name))
+        logger.debug('powering off VM')
+        progress('powering_off')
+        with metrics.phase_timer('delete_router', 'power'):
+            virtual_machine.power(the_vm, state='off')
+        progress('destroying')
+        delete_task = the_vm.Destroy_Task()
+        meta_index.remove(username, 'Router', machine_name)
+        inventory.invalidate(username)
+        if not wait:
+            return delete_task._moId
+        logger.debug('blocking while VM is being destroyed')
+        with metrics.phase_timer('delete_router', 'destroy'):
+            with placement.engine.busy(meta.get('datastore')):
+                consume_task(delete_task)
+        inventory.invalidate(username)
+
+
+def task_done(task_id):
+    """Check on a vCenter task without waiting for it
+
+    :Returns: Boolean
+
+    :Raises: RuntimeError if the vCenter task failed
+
+    :param task_id: The moId of the vCenter task, like task-1234
+    :type task_id: String
+    """
+    with session_pool.session() as vcenter:
+        the_task = vim.Task(task_id, vcenter._conn._stub)
+        info = the_task.info
+    if info.state == vim.TaskInfo.State.error:
+        raise RuntimeError(info.error.msg)
+    return info.state == vim.TaskInfo.State.success
 
 
-def create_router(username, machine_name, image, requested_networks, logger):
+def create_router(username, machine_name, image, requested_networks, logger, progress=_no_progress):
     """Deploy a new instance of Router
 
     :Returns: Dictionary
@@ -78,31 +180,350 @@ def create_router(username, machine_name, image, requested_networks, logger):
 
     :param logger: An object for logging messages
     :type logger: logging.LoggerAdapter
+
+    :param progress: Called with the name of each phase as it starts, for reporting progress
+    :type progress: Function
     """
-    with vCenter(host=const.INF_VCENTER_SERVER, user=const.INF_VCENTER_USER,
-                 password=const.INF_VCENTER_PASSWORD) as vcenter:
-        image_name = convert_name(image)
-        logger.info(image_name)
-        try:
-            ova = Ova(os.path.join(const.VLAB_ROUTER_IMAGES_DIR, image_name))
-        except FileNotFoundError:
-            error = "Invalid version of Router supplied: {}".format(image)
-            raise ValueError(error)
+    image_name, ova_meta, user_networks = check_image(image, requested_networks, logger)
+    with session_pool.session() as vcenter:
+        progress('session_opened')
+        the_vm, where = place_router(vcenter, username, machine_name, image, image_name, ova_meta,
+                                     requested_networks, user_networks, logger, progress)
+        progress('powered_on')
+        with metrics.phase_timer('create_router', 'set_meta'):
+            virtual_machine.set_meta(the_vm, router_meta(image, where))
+        return created_info(vcenter, username, the_vm)
+
+
+def check_image(image, requested_networks, logger):
+    """Find the OVA of a version of Router, and check it has enough networks for the request
+
+    :Returns: Tuple (image name, OVA metadata, the networks that were asked for)
+
+    :Raises: ValueError for an unknown version, or too many networks
+    """
+    image_name = convert_name(image)
+    logger.info(image_name)
+    try:
+        with metrics.phase_timer('create_router', 'ova_parse'):
+            ova_meta = ova_index.lookup(image_name)
+    except FileNotFoundError:
+        error = "Invalid version of Router supplied: {}".format(image)
+        raise ValueError(error)
+    user_networks = [x for x in requested_networks if x]
+    if len(user_networks) > len(ova_meta['networks']):
+        error = "Router version {} supports at most {} networks, supplied {}".format(image, len(ova_meta['networks']), len(user_networks))
+        raise ValueError(error)
+    return image_name, ova_meta, user_networks
+
+
+def place_router(vcenter, username, machine_name, image, image_name, ova_meta, requested_networks, user_networks,
+                 logger, progress, power_on=True):
+    """Map the networks and get a Router on them, looking the networks up again if the index had a deleted one
+
+    :Returns: Tuple (vim.VirtualMachine, placement.Placement or None when claimed)
+
+    :param power_on: Set to False to leave a deployed Router powered off. Default True
+    :type power_on: Boolean
+    """
+    for attempt in range(2):
+        with metrics.phase_timer('create_router', 'network_map'):
+            vcenter_networks = network_index.lookup(vcenter, user_networks, scope='{}_'.format(username))
+            networks = map_networks(ova_meta['networks'], requested_networks, vcenter_networks)
+        progress('deploying')
         try:
-            networks = map_networks(ova.networks, requested_networks, vcenter.networks)
-            the_vm = virtual_machine.deploy_from_ova(vcenter, ova, networks,
-                                                     username, machine_name, logger)
-        finally:
-            ova.close()
-        meta_data = {'component' : "Router",
-                     'created': time.time(),
-                     'version': image,
-                     'configured': False,
-                     'generation': 1,
-                    }
-        virtual_machine.set_meta(the_vm, meta_data)
-        info = virtual_machine.get_info(vcenter, the_vm, username)
-        return {the_vm.name: info}
+            return _provision(vcenter, username, machine_name, image, image_name, ova_meta, networks, logger,
+                              power_on=power_on)
+        except vmodl.fault.ManagedObjectNotFound as doh:
+            if attempt or not isinstance(doh.obj, vim.Network):
+                raise
+            # Deleted, and maybe made again, since the network index read it
+            logger.info('Network {} no longer exists, looking up the networks again'.format(doh.obj._moId))
+            network_index.invalidate(user_networks)
+
+
+def router_meta(image, where):
+    """The meta data of a new Router
+
+    :Returns: Dictionary
+
+    :param image: The image/version of the Router
+    :type image: String
+
+    :param where: Where the Router was deployed, or None when it was claimed from the warm pool
+    :type where: placement.Placement
+    """
+    meta_data = {'component' : "Router",
+                 'created': time.time(),
+                 'version': image,
+                 'configured': False,
+                 'generation': 1,
+                }
+    if where is not None:
+        # So deletes and metrics know which datastore the Router lives on
+        meta_data['datastore'] = where.datastore_name
+        meta_data['pool'] = where.pool_name
+    return meta_data
+
+
+def created_info(vcenter, username, the_vm):
+    """Describe a new Router, and add it to the indexes of the user's Routers
+
+    :Returns: Dictionary
+    """
+    inventory.invalidate(username)
+    with metrics.phase_timer('create_router', 'get_info'):
+        props, network_names = retrieve_vm(vcenter, the_vm, vm_properties=VM_PROPERTIES + ['parent'])
+        info = make_info(vcenter, the_vm, props, parse_meta(props.get('config.annotation')),
+                         network_names, username)
+    meta_index.add(username, 'Router', props['name'], the_vm, props['parent'])
+    return {props['name']: info}
+
+
+def create_routers(username, routers, logger, progress=_no_progress):
+    """Deploy many Routers at once, with bounded concurrency
+
+    :Returns: Tuple (Dictionary of name -> result, Integer of failures)
+
+    :param username: The name of the user who wants to create the Routers
+    :type username: String
+
+    :param routers: The Routers to create; each has a "name", "image" and "networks"
+    :type routers: List
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+
+    :param progress: Called as each Router is done, for reporting progress
+    :type progress: Function
+    """
+    def create(spec):
+        return create_router(username, spec['name'], spec['image'], spec['networks'], logger)
+    return _run_many(create, routers, [x['name'] for x in routers], logger, progress)
+
+
+def delete_routers(username, machine_names, logger, progress=_no_progress):
+    """Destroy many Routers at once, like when a lab is over. Every power off
+    is started before waiting on any of them, then the destroys run at most
+    ``VLAB_ROUTER_DESTROY_CONCURRENCY`` at a time. The vCenter tasks of each
+    step are waited on together, through one PropertyCollector filter.
+
+    :Returns: Tuple (Dictionary of name -> result, Integer of failures)
+
+    :param username: The user who wants to delete the Routers
+    :type username: String
+
+    :param machine_names: The names of the Routers to delete. Empty means every Router the user has.
+    :type machine_names: List
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+
+    :param progress: Called as each step starts, and as Routers are destroyed
+    :type progress: Function
+    """
+    results = {}
+    with session_pool.session() as vcenter:
+        progress('session_opened')
+        with metrics.phase_timer('delete_routers', 'folder_lookup'):
+            folder = vcenter.get_by_name(name=username, vimtype=vim.Folder)
+        with metrics.phase_timer('delete_routers', 'get_info'):
+            vms, _ = retrieve_folder(vcenter, folder, ['name', 'config.annotation', 'runtime.powerState'])
+        meta_index.rebuild(username, folder, vms)
+        routers = {}
+        for the_vm, props in vms.items():
+            meta = parse_meta(props.get('config.annotation'))
+            if meta['component'] == 'Router':
+                routers[props['name']] = (the_vm, props, meta)
+        wanted = list(machine_names) or sorted(routers.keys())
+        for name in wanted:
+            if name not in routers:
+                results[name] = {'content': {}, 'error': 'No {} named {} found'.format('router', name)}
+
+        targets = [name for name in wanted if name in routers]
+        progress('powering_off', total=len(targets))
+        with metrics.phase_timer('delete_routers', 'power'):
+            power_tasks = {}
+            for name in targets:
+                the_vm, props, _ = routers[name]
+                if props.get('runtime.powerState') != 'poweredOff':
+                    power_tasks[name] = the_vm.PowerOffVM_Task()
+            errors = wait_for_tasks(vcenter, list(power_tasks.values()))
+        for name, task in power_tasks.items():
+            if errors[task._moId]:
+                results[name] = {'content': {}, 'error': errors[task._moId]}
+
+        targets = [name for name in targets if name not in results]
+        progress('destroying', total=len(targets))
+        limit = const.VLAB_ROUTER_DESTROY_CONCURRENCY
+        with metrics.phase_timer('delete_routers', 'destroy'):
+            for index in range(0, len(targets), limit):
+                batch = targets[index:index + limit]
+                destroy_tasks = {}
+                for name in batch:
+                    try:
+                        destroy_tasks[name] = routers[name][0].Destroy_Task()
+                    except vmodl.MethodFault as doh:
+                        results[name] = {'content': {}, 'error': doh.msg}
+                datastores = [routers[x][2].get('datastore') for x in destroy_tasks.keys()]
+                with placement.engine.busy(*datastores):
+                    errors = wait_for_tasks(vcenter, list(destroy_tasks.values()))
+                for name, task in destroy_tasks.items():
+                    results[name] = {'content': {}, 'error': errors[task._moId]}
+                    if not errors[task._moId]:
+                        meta_index.remove(username, 'Router', name)
+                progress('running', done=len(results), total=len(wanted),
+                         percent=int(len(results) * 100 / len(wanted)))
+        inventory.invalidate(username)
+    failures = len([x for x in results.values() if x['error']])
+    if failures:
+        logger.error('Failed to delete {} of {} Routers'.format(failures, len(results)))
+    return results, failures
+
+
+def wait_for_tasks(vcenter, tasks, timeout=const.VLAB_ROUTER_DELETE_TIMEOUT):
+    """Wait on many vCenter tasks with one PropertyCollector filter, instead of
+    polling each task on its own.
+
+    :Returns: Dictionary of task moId -> None, or the error message of the task
+
+    :param vcenter: The connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param tasks: The tasks to wait on
+    :type tasks: List of vim.Task
+
+    :param timeout: How many seconds to wait before giving up on the tasks that haven't finished
+    :type timeout: Integer
+    """
+    if not tasks:
+        return {}
+    pending = {x._moId for x in tasks}
+    errors = {}
+    obj_specs = [vmodl.query.PropertyCollector.ObjectSpec(obj=x) for x in tasks]
+    prop_spec = vmodl.query.PropertyCollector.PropertySpec(type=vim.Task, pathSet=['info.state', 'info.error'])
+    filter_spec = vmodl.query.PropertyCollector.FilterSpec(objectSet=obj_specs, propSet=[prop_spec])
+    # A collector of our own, so the filter can't mix with other threads using this session
+    collector = vcenter.content.propertyCollector.CreatePropertyCollector()
+    try:
+        collector.CreateFilter(filter_spec, partialUpdates=True)
+        version = ''
+        deadline = time.time() + timeout
+        while pending:
+            remaining = int(deadline - time.time())
+            if remaining <= 0:
+                break
+            options = vmodl.query.PropertyCollector.WaitOptions(maxWaitSeconds=remaining)
+            update = collector.WaitForUpdatesEx(version, options)
+            if update is None:
+                continue
+            version = update.version
+            for filter_set in update.filterSet:
+                for obj_set in filter_set.objectSet:
+                    changes = {x.name: x.val for x in obj_set.changeSet}
+                    state = changes.get('info.state')
+                    if state == vim.TaskInfo.State.success:
+                        errors[obj_set.obj._moId] = None
+                        pending.discard(obj_set.obj._moId)
+                    elif state == vim.TaskInfo.State.error:
+                        error = changes.get('info.error')
+                        errors[obj_set.obj._moId] = error.msg if error is not None else 'Task failed'
+                        pending.discard(obj_set.obj._moId)
+    finally:
+        collector.DestroyPropertyCollector()
+    for task_id in pending:
+        errors[task_id] = 'Timed out after {} seconds'.format(timeout)
+    return errors
+
+
+def _run_many(func, items, names, logger, progress=_no_progress):
+    """Call ``func`` on every item, at most ``VLAB_ROUTER_BULK_CONCURRENCY`` at a time.
+    Sessions come out of the worker's session pool, so vCenter never sees more
+    than ``VLAB_VCENTER_POOL_SIZE`` concurrent sessions from one worker.
+
+    :Returns: Tuple (Dictionary of name -> result, Integer of failures)
+    """
+    results = {}
+    failures = 0
+    with ThreadPoolExecutor(max_workers=const.VLAB_ROUTER_BULK_CONCURRENCY) as executor:
+        futures = {executor.submit(func, item): name for item, name in zip(items, names)}
+        for future in as_completed(futures):
+            name = futures[future]
+            result = {'content': {}, 'error': None}
+            try:
+                result['content'] = future.result() or {}
+            except Exception as doh:
+                if not isinstance(doh, ValueError):
+                    logger.exception('Unexpected failure for {}'.format(name))
+                result['error'] = '{}'.format(doh)
+                failures += 1
+            results[name] = result
+            progress('running', done=len(results), total=len(futures),
+                     percent=int(len(results) * 100 / len(futures)))
+    return results, failures
+
+
+def _provision(vcenter, username, machine_name, image, image_name, ova_meta, networks, logger, power_on=True):
+    """Claim a Router from the warm pool, or deploy a new one. Claimed Routers are always powered on.
+
+    :Returns: Tuple (vim.VirtualMachine, placement.Placement or None when claimed)
+    """
+    if const.VLAB_ROUTER_WARM_POOL_SIZE:
+        with metrics.phase_timer('create_router', 'claim'):
+            the_vm = warm_pool.claim(vcenter, image, username, machine_name, networks, logger)
+        if the_vm is not None:
+            return the_vm, None
+    with metrics.phase_timer('create_router', 'placement'):
+        where = placement.choose(vcenter)
+    logger.info('Deploying to datastore {} in pool {}'.format(where.datastore_name, where.pool_name))
+    with metrics.phase_timer('create_router', 'deploy'):
+        with placement.engine.deploying(where):
+            the_vm = _deploy(vcenter, username, machine_name, image_name, ova_meta, networks, where, logger)
+    if power_on:
+        with metrics.phase_timer('create_router', 'power'):
+            virtual_machine.power(the_vm, state='on')
+    return the_vm, where
+
+
+def _deploy(vcenter, username, machine_name, image_name, ova_meta, networks, where, logger):
+    """Create a new, powered off Router, as a linked clone or from the OVA depending on the deploy mode
+
+    :Returns: vim.VirtualMachine
+    """
+    if const.VLAB_ROUTER_DEPLOY_MODE == 'clone':
+        template = linked_clone.get_template(vcenter, image_name, ova_meta, networks, logger)
+        folder = vcenter.get_by_name(name=username, vimtype=vim.Folder)
+        return linked_clone.clone_router(vcenter, template, folder, machine_name,
+                                         networks, logger, power_on=False, where=where)
+    return _deploy_ova(vcenter, image_name, ova_meta, networks, username, machine_name, where, logger)
+
+
+def _deploy_ova(vcenter, image_name, ova_meta, networks, username, machine_name, where, logger):
+    """Upload an OVA to the datastore, pool and host that placement picked. Same
+    steps as ``virtual_machine.deploy_from_ova``, which picks a datastore at random
+    and uploads one disk at a time.
+
+    :Returns: vim.VirtualMachine
+    """
+    if not re.match(linked_clone.HOSTNAME_REGEX, machine_name):
+        error = 'Invalid machine name. Names can only contain characters a-z, A-Z, 0-9, periods (".") and dashes ("-"). Supplied: {}'.format(machine_name)
+        raise ValueError(error)
+    folder = vcenter.get_by_name(name=username, vimtype=vim.Folder)
+    spec_params = vim.OvfManager.CreateImportSpecParams(entityName=machine_name,
+                                                        diskProvisioning='thin',
+                                                        networkMapping=networks)
+    spec = vcenter.ovf_manager.CreateImportSpec(ovfDescriptor=ova_meta['ovf'],
+                                                resourcePool=where.pool,
+                                                datastore=where.datastore,
+                                                cisp=spec_params)
+    lease = virtual_machine._get_lease(where.pool, spec.importSpec, folder, where.host)
+    logger.debug('Uploading OVA to {}'.format(where.host_name))
+    nfc_upload.upload(image_cache.disks(image_name, ova_meta), spec, lease, where.host_name)
+    for entity in folder.childEntity:
+        if entity.name == machine_name:
+            return entity
+    error = 'Unable to find newly created VM by name {}'.format(machine_name)
+    raise RuntimeError(error)
 
 
 def map_networks(ova_networks, user_networks, vcenter_networks):
@@ -136,6 +557,22 @@ def map_networks(ova_networks, user_networks, vcenter_networks):
     return networks
 
 
+def replenish_pool(logger):
+    """Top up the warm pool of pre-deployed Routers
+
+    :Returns: Dictionary
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    images = {}
+    for image_name in os.listdir(const.VLAB_ROUTER_IMAGES_DIR):
+        if image_name.endswith('.ova'):
+            images[convert_name(image_name, to_version=True)] = image_name
+    with session_pool.session() as vcenter:
+        return warm_pool.replenish(vcenter, images, logger)
+
+
 def list_images():
     """Obtain a list of available versions of Router that can be created
 
@@ -144,21 +581,3 @@ def list_images():
     images = os.listdir(const.VLAB_ROUTER_IMAGES_DIR)
     images = [convert_name(x, to_version=True) for x in images]
     return images
-
-
-def convert_name(name, to_version=False):
-    """This function centralizes converting between the name of the OVA, and the
-    version of software it contains.
-
-    The naming convention is ``router-<software>-<version>.ova``, like router-vyos-1.1.8.ova
-
-    :param name: The thing to covert
-    :type name: String
-
-    :param to_version: Set to True to covert the name of an OVA to the version
-    :type to_version: Boolean
-    """
-    if to_version:
-        return name.split('-')[2].rstrip('.ova')
-    else:
-        return 'router-vyos-{}.ova'.format(name)
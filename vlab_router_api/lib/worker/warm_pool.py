@@ -0,0 +1,182 @@
+# -*- coding: UTF-8 -*-
+"""
+Keeps a pool of already deployed, powered off Routers for every image, so that
+creating a Router only has to claim one and hook it up to the user's networks.
+
+Pooled VMs live in ``VLAB_ROUTER_WARM_POOL_FOLDER`` with their meta data
+``component`` set to ``RouterPool``. A Router is claimed by rewriting its
+meta data with the ``changeVersion`` it was read with; vCenter rejects the
+reconfigure if another worker changed the VM first, so two workers can never
+claim the same VM.
+"""
+import os
+import re
+import time
+import uuid
+
+import ujson
+from vlab_inf_common.vmware import Ova, vim, virtual_machine, consume_task
+
+from vlab_router_api.lib import const
+from vlab_router_api.lib.worker import ova_index, linked_clone, network_index
+from vlab_router_api.lib.worker.properties import retrieve_folder, parse_meta
+
+POOL_COMPONENT = 'RouterPool'
+CLAIMED_COMPONENT = 'RouterClaimed'
+POOL_PROPERTIES = ['name', 'config.annotation', 'config.changeVersion']
+
+
+def pooled_vms(vcenter, image):
+    """Find the unclaimed VMs in the pool for an image
+
+    :Returns: Dictionary of vim.VirtualMachine -> properties
+
+    :param vcenter: The connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param image: The image/version of Router
+    :type image: String
+    """
+    folder = vcenter.get_by_name(name=const.VLAB_ROUTER_WARM_POOL_FOLDER, vimtype=vim.Folder)
+    vms, _ = retrieve_folder(vcenter, folder, vm_properties=POOL_PROPERTIES)
+    pooled = {}
+    for vm, props in vms.items():
+        meta = parse_meta(props.get('config.annotation'))
+        if meta['component'] == POOL_COMPONENT and meta['version'] == image:
+            pooled[vm] = props
+    return pooled
+
+
+def claim(vcenter, image, username, machine_name, network_map, logger):
+    """Take a pre-deployed Router out of the pool, and make it the user's
+
+    :Returns: vim.VirtualMachine, or None when the pool is empty
+
+    :Raises: ValueError if the machine name is not valid
+
+    :param vcenter: The connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param image: The image/version of Router
+    :type image: String
+
+    :param username: The user who's creating a Router
+    :type username: String
+
+    :param machine_name: The name of the new Router
+    :type machine_name: String
+
+    :param network_map: The networks to attach, in the order of the NICs in the OVF
+    :type network_map: List of vim.OvfManager.NetworkMapping
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    if not re.match(linked_clone.HOSTNAME_REGEX, machine_name):
+        error = 'Invalid machine name. Names can only contain characters a-z, A-Z, 0-9, periods (".") and dashes ("-"). Supplied: {}'.format(machine_name)
+        raise ValueError(error)
+    for the_vm, props in pooled_vms(vcenter, image).items():
+        if _take(the_vm, props, username):
+            break
+    else:
+        logger.info('Warm pool for version {} is empty'.format(image))
+        return None
+    logger.info('Claimed {} from the warm pool'.format(props['name']))
+    try:
+        consume_task(the_vm.Rename_Task(newName=machine_name))
+        folder = vcenter.get_by_name(name=username, vimtype=vim.Folder)
+        consume_task(folder.MoveIntoFolder_Task([the_vm]))
+        config_spec = vim.vm.ConfigSpec(deviceChange=linked_clone.nic_specs(the_vm, network_map))
+        consume_task(the_vm.ReconfigVM_Task(config_spec))
+        virtual_machine.power(the_vm, state='on')
+    except Exception:
+        # Don't leave a half configured Router behind
+        logger.exception('Failed to setup claimed VM {}'.format(props['name']))
+        consume_task(the_vm.Destroy_Task())
+        raise
+    return the_vm
+
+
+def _take(the_vm, props, username):
+    """Atomically mark a pooled VM as claimed
+
+    :Returns: Boolean
+    """
+    meta = parse_meta(props.get('config.annotation'))
+    meta['component'] = CLAIMED_COMPONENT
+    meta['claimed_by'] = username
+    spec = vim.vm.ConfigSpec()
+    spec.annotation = ujson.dumps(meta)
+    spec.changeVersion = props['config.changeVersion']
+    try:
+        consume_task(the_vm.ReconfigVM_Task(spec))
+    except RuntimeError:
+        # Another worker claimed it first
+        return False
+    return True
+
+
+def replenish(vcenter, images, logger):
+    """Deploy Routers into the pool until every image has the configured number
+
+    :Returns: Dictionary of image -> number of VMs deployed
+
+    :param vcenter: The connection to vCenter
+    :type vcenter: vlab_inf_common.vmware.vCenter
+
+    :param images: Mapping of image/version to the file name of its OVA
+    :type images: Dictionary
+
+    :param logger: An object for logging messages
+    :type logger: logging.LoggerAdapter
+    """
+    deployed = {}
+    folder = vcenter.get_by_name(name=const.VLAB_ROUTER_WARM_POOL_FOLDER, vimtype=vim.Folder)
+    vms, _ = retrieve_folder(vcenter, folder, vm_properties=POOL_PROPERTIES)
+    staging_network = network_index.lookup(vcenter, [const.VLAB_ROUTER_WARM_POOL_NETWORK],
+                                           scope=const.VLAB_ROUTER_WARM_POOL_NETWORK)[const.VLAB_ROUTER_WARM_POOL_NETWORK]
+    for image, image_name in sorted(images.items()):
+        # Count by name too, so VMs still being deployed (no meta data yet) aren't topped up again
+        prefix = 'pool-{}-'.format(image)
+        have = len([x for x in vms.values() if x.get('name', '').startswith(prefix)])
+        wanted = const.VLAB_ROUTER_WARM_POOL_SIZE - have
+        ova_meta = ova_index.lookup(image_name)
+        network_map = []
+        for ova_network in ova_meta['networks']:
+            net_map = vim.OvfManager.NetworkMapping()
+            net_map.name = ova_network
+            net_map.network = staging_network
+            network_map.append(net_map)
+        for _ in range(max(wanted, 0)):
+            name = '{}{}'.format(prefix, uuid.uuid4().hex[:8])
+            logger.info('Adding {} to the warm pool'.format(name))
+            the_vm = _deploy(vcenter, folder, image_name, ova_meta, name, network_map, logger)
+            meta_data = {'component' : POOL_COMPONENT,
+                         'created': time.time(),
+                         'version': image,
+                         'configured': False,
+                         'generation': 1,
+                        }
+            virtual_machine.set_meta(the_vm, meta_data)
+            deployed[image] = deployed.get(image, 0) + 1
+    return deployed
+
+
+def _deploy(vcenter, folder, image_name, ova_meta, name, network_map, logger):
+    """Create a powered off Router in the pool folder
+
+    :Returns: vim.VirtualMachine
+    """
+    if const.VLAB_ROUTER_DEPLOY_MODE == 'clone':
+        template = linked_clone.get_template(vcenter, image_name, ova_meta, network_map, logger)
+        the_vm = linked_clone.clone_router(vcenter, template, folder, name, network_map,
+                                           logger, power_on=False)
+    else:
+        ova = Ova(os.path.join(const.VLAB_ROUTER_IMAGES_DIR, image_name))
+        try:
+            the_vm = virtual_machine.deploy_from_ova(vcenter, ova, network_map,
+                                                     const.VLAB_ROUTER_WARM_POOL_FOLDER,
+                                                     name, logger, power_on=False)
+        finally:
+            ova.close()
+    return the_vm
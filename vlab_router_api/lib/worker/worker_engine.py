@@ -0,0 +1,185 @@
+# -*- coding: UTF-8 -*-
+"""Runs the vCenter calls of the tasks, as picked by ``VLAB_ROUTER_WORKER_ENGINE``"""
+import asyncio
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from vlab_api_common import get_logger
+
+from vlab_router_api.lib import const
+from vlab_router_api.lib.celery_config import SLOW_TASKS
+from vlab_router_api.lib.worker import async_vmware
+
+
+logger = get_logger(__name__, loglevel=const.VLAB_ROUTER_LOG_LEVEL)
+ENGINES = ('prefork', 'threads', 'asyncio')
+
+
+class ThreadEngine(object):
+    """A bounded executor for each class of task, so reads never wait on deploys for a thread
+
+    :param fast_threads: The most blocking calls of reads to run at the same time
+    :type fast_threads: Integer
+
+    :param slow_threads: The most blocking calls of deploys and deletes to run at the same time
+    :type slow_threads: Integer
+    """
+    def __init__(self, fast_threads, slow_threads):
+        self.threads = {'fast': fast_threads, 'slow': slow_threads}
+        self._executors = {}
+        self._lock = threading.Lock()
+
+    def run(self, task_name, func, *args, **kwargs):
+        """Run a blocking call on the executor of a task's class, and wait for it
+
+        :Returns: Whatever ``func`` returns
+
+        :param task_name: The name of the Celery task making the call, like router.show
+        :type task_name: String
+
+        :param func: The blocking call, like ``vmware.show_router``
+        :type func: Function
+        """
+        future = self._executor(task_name).submit(functools.partial(func, *args, **kwargs))
+        return future.result()
+
+    def _executor(self, task_name):
+        """Create executors the first time they're needed; Celery forks after importing the tasks"""
+        kind = 'slow' if task_name in SLOW_TASKS else 'fast'
+        with self._lock:
+            if kind not in self._executors:
+                self._executors[kind] = ThreadPoolExecutor(max_workers=self.threads[kind],
+                                                           thread_name_prefix='engine-{}'.format(kind))
+            return self._executors[kind]
+
+    def stop(self):
+        """Stop the executors, after the calls they're running are done
+
+        :Returns: None
+        """
+        with self._lock:
+            executors = list(self._executors.values())
+            self._executors = {}
+        for executor in executors:
+            executor.shutdown(wait=True)
+
+
+class AsyncioEngine(ThreadEngine):
+    """Runs the coroutines in ``async_vmware`` on one event loop, so waiting on
+    vCenter tasks doesn't hold a thread. Their blocking steps, and functions
+    without a coroutine, run on the executors of ThreadEngine.
+    """
+    def __init__(self, fast_threads, slow_threads):
+        super(AsyncioEngine, self).__init__(fast_threads, slow_threads)
+        self._loop = None
+        self._thread = None
+
+    def run(self, task_name, func, *args, **kwargs):
+        """Run the coroutine of a vmware function on the event loop, and wait for it
+
+        :Returns: Whatever ``func`` returns
+
+        :param task_name: The name of the Celery task making the call, like router.show
+        :type task_name: String
+
+        :param func: The blocking call, like ``vmware.show_router``
+        :type func: Function
+        """
+        coroutine = async_vmware.COROUTINES.get(func)
+        if coroutine is None:
+            return super(AsyncioEngine, self).run(task_name, func, *args, **kwargs)
+        executor = self._executor(task_name)
+        loop = self._event_loop()
+        def call(step, *step_args, **step_kwargs):
+            return loop.run_in_executor(executor, functools.partial(step, *step_args, **step_kwargs))
+        future = asyncio.run_coroutine_threadsafe(coroutine(call, *args, **kwargs), loop)
+        return future.result()
+
+    def _event_loop(self):
+        """Start the event loop the first time it's needed; Celery forks after importing the tasks"""
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._loop.run_forever, name='engine-loop', daemon=True)
+                self._thread.start()
+            return self._loop
+
+    def stop(self):
+        """Stop the event loop and the executors
+
+        :Returns: None
+        """
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            loop.close()
+        super(AsyncioEngine, self).stop()
+
+
+class DirectEngine(object):
+    """The prefork engine: blocking calls run in the task's own process"""
+    def run(self, task_name, func, *args, **kwargs):
+        """Run a blocking call
+
+        :Returns: Whatever ``func`` returns
+        """
+        return func(*args, **kwargs)
+
+    def stop(self):
+        """Nothing to stop
+
+        :Returns: None
+        """
+        pass
+
+
+def make_engine(name):
+    """Create the engine named by ``VLAB_ROUTER_WORKER_ENGINE``
+
+    :Returns: AsyncioEngine, ThreadEngine or DirectEngine
+
+    :Raises: ValueError for an unknown engine
+
+    :param name: The name of the engine, like asyncio
+    :type name: String
+    """
+    if name == 'asyncio':
+        return AsyncioEngine(fast_threads=const.VLAB_ROUTER_FAST_THREADS,
+                             slow_threads=const.VLAB_ROUTER_SLOW_THREADS)
+    elif name == 'threads':
+        return ThreadEngine(fast_threads=const.VLAB_ROUTER_FAST_THREADS,
+                            slow_threads=const.VLAB_ROUTER_SLOW_THREADS)
+    elif name == 'prefork':
+        return DirectEngine()
+    error = 'Unknown worker engine {}, must be one of {}'.format(name, ', '.join(ENGINES))
+    raise ValueError(error)
+
+
+def configure(celery_app):
+    """Setup the Celery worker pool to match the engine
+
+    :Returns: None
+
+    :param celery_app: The Celery app of the worker
+    :type celery_app: celery.Celery
+    """
+    if const.VLAB_ROUTER_WORKER_ENGINE in ('threads', 'asyncio'):
+        # Tasks wait on the engine; a thread each is all they need. The slots
+        # are shared by both queues, so keep them well above VLAB_ROUTER_MAX_DEPLOYS.
+        celery_app.conf.update(worker_pool='threads',
+                               worker_concurrency=const.VLAB_ROUTER_WORKER_THREADS)
+
+
+engine = make_engine(const.VLAB_ROUTER_WORKER_ENGINE)
+
+
+def run(task_name, func, *args, **kwargs):
+    """Run a blocking vCenter call of a task with the configured engine
+
+    :Returns: Whatever ``func`` returns
+    """
+    return engine.run(task_name, func, *args, **kwargs)